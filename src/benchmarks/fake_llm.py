@@ -0,0 +1,321 @@
+"""
+fake_llm.py
+
+A scripted stand-in for the Azure OpenAI deployments, used by the pipeline
+benchmark (`pipeline.py`).
+
+`FakeLLM` is registered as the innermost LLM gateway middleware and never calls
+`call_next`, so no request leaves the process. The middleware that run
+further out (such as the scheduler) still run as they do in production. Each
+agent receives a reply that moves its workflow forward exactly as a
+well-behaved model would:
+- Planner: directs the Document_Writer, then terminates once the draft is saved.
+- Document_Writer: a markdown draft of a configurable size that follows the
+  section's structure partial, or its own heading of it for a sub-section
+  (so it passes pre-validation), or a
+  `[FIELD_EDITS]` block rewriting its last field when asked for a patch.
+- Writer_User_Proxy / Validator_User_Proxy: the `upload_blob_async` and
+  `download_blob_as_text_async` tool calls their team expects.
+- Fact_Checker / Quality_Assessor: findings, then a `submit_feedback_report`
+  call whose report has a critical issue until `passes_on_iteration` (which
+  `passes_on_iteration_by_section` can override per section). Asked for
+  `[FIELD_VERDICTS]` (for changed fields, or for the consistency of an
+  assembled section), the Fact_Checker follows the same schedule. With
+  `report_faults`, the first submission is malformed ("reject") or the report
+  is written as plain text instead ("unsubmitted").
+- Report_Repairer: the same report, as a JSON object.
+- Prompt_Writer: a `[REVISION_REQUEST]` block.
+
+Each reply is delayed by `latency_seconds` plus the time it would take to
+stream its completion tokens at `output_tokens_per_second`. Prompt caching is
+simulated as Azure OpenAI does it: per deployment, the longest previously seen
+prompt prefix of at least 1,024 tokens, in 128-token increments, is reported as
+cached tokens. Calls, tokens and simulated model time are recorded per agent
+and per section.
+"""
+
+import re
+import json
+import time
+import hashlib
+import uuid
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List
+
+from openai.types.chat import ChatCompletion, ChatCompletionMessage, ChatCompletionMessageFunctionToolCall
+from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_message_function_tool_call import Function
+from openai.types.completion_usage import CompletionUsage, PromptTokensDetails
+
+from src.ehcp_autogen import config
+from src.ehcp_autogen.llm.gateway import LLMCall, complete_response
+from src.ehcp_autogen.utils.prevalidation import parse_structure
+
+CHARS_PER_TOKEN = 4
+# Azure OpenAI caches prompts of at least 1,024 tokens, in 128-token increments.
+_CACHE_MIN_CHARS = 1024 * CHARS_PER_TOKEN
+_CACHE_BLOCK_CHARS = 128 * CHARS_PER_TOKEN
+
+# Section numbers include sub-sections, such as "3.2".
+_SECTION_PATTERN = re.compile(r"bench-section:(\d+(?:\.\d+)?)|(?:output|feedback)_s(\d+(?:\.\d+)?)_i\d+\.md|section '(\d+(?:\.\d+)?)'")
+_OUTPUT_BLOB_PATTERN = re.compile(r"output_s[\d.]+_i(\d+)\.md")
+_FEEDBACK_BLOB_PATTERN = re.compile(r"feedback_s[\d.]+_i(\d+)\.md")
+
+_FILLER_WORDS = (
+    "The child communicates well with familiar adults and benefits from visual support, "
+    "structured routines and regular opportunities to practise new skills in small groups. "
+)
+
+
+class FakeLLM:
+    """Gateway middleware that answers every LLM call with a scripted reply."""
+
+    def __init__(self, latency_seconds: float = 0.0, output_tokens_per_second: float = 0.0, draft_tokens: int = 800, passes_on_iteration: int = 2, passes_on_iteration_by_section: Dict[str, int] = None, report_faults: str = "none"):
+        self.latency_seconds = latency_seconds
+        self.output_tokens_per_second = output_tokens_per_second
+        self.draft_tokens = draft_tokens
+        self.passes_on_iteration = passes_on_iteration
+        self.passes_on_iteration_by_section = passes_on_iteration_by_section or {}
+        self.report_faults = report_faults
+
+        self._lock = threading.Lock()
+        self.calls_by_agent: Dict[str, int] = defaultdict(int)
+        self.tokens_by_section: Dict[str, Dict[str, int]] = defaultdict(lambda: {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "calls": 0})
+        self.simulated_llm_seconds = 0.0
+        self._seen_prefixes = set()
+        self._revisions_by_section: Dict[str, int] = defaultdict(int)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "llm_calls": sum(self.calls_by_agent.values()),
+                "llm_calls_by_agent": dict(sorted(self.calls_by_agent.items())),
+                "tokens_by_section": {section: dict(tokens) for section, tokens in sorted(self.tokens_by_section.items())},
+                "simulated_llm_seconds": round(self.simulated_llm_seconds, 3),
+            }
+
+    def __call__(self, call: LLMCall, call_next: Callable[[], Any]):
+        messages = call.params.get("messages") or []
+        content, tool_call = self._script(call.agent_name, messages)
+
+        serialised_prompt = json.dumps(messages, default=str)
+        prompt_tokens = len(serialised_prompt) // CHARS_PER_TOKEN
+        cached_tokens = self._cached_tokens(call.deployment, serialised_prompt)
+        completion_tokens = len(content or json.dumps(tool_call or {})) // CHARS_PER_TOKEN
+        delay = self.latency_seconds + (completion_tokens / self.output_tokens_per_second if self.output_tokens_per_second else 0.0)
+        if delay:
+            # Gateway calls run in AutoGen's worker threads, so this blocks like a real request would.
+            time.sleep(delay)
+
+        section = self._section_of(messages)
+        with self._lock:
+            self.calls_by_agent[call.agent_name] += 1
+            self.tokens_by_section[section]["prompt_tokens"] += prompt_tokens
+            self.tokens_by_section[section]["cached_tokens"] += cached_tokens
+            self.tokens_by_section[section]["completion_tokens"] += completion_tokens
+            self.tokens_by_section[section]["calls"] += 1
+            self.simulated_llm_seconds += delay
+
+        return self._build_response(call, content, tool_call, prompt_tokens, cached_tokens, completion_tokens)
+
+    def _cached_tokens(self, deployment: str, serialised_prompt: str) -> int:
+        """Returns the length of the longest cached prefix and caches this prompt's prefixes."""
+        digest = hashlib.sha1(deployment.encode("utf-8"))
+        position = 0
+        cached_chars = 0
+        prefixes = []
+        for boundary in range(_CACHE_MIN_CHARS, len(serialised_prompt) + 1, _CACHE_BLOCK_CHARS):
+            digest.update(serialised_prompt[position:boundary].encode("utf-8"))
+            position = boundary
+            prefixes.append(digest.hexdigest())
+        with self._lock:
+            for index, prefix in enumerate(prefixes):
+                if prefix not in self._seen_prefixes:
+                    break
+                cached_chars = _CACHE_MIN_CHARS + index * _CACHE_BLOCK_CHARS
+            self._seen_prefixes.update(prefixes)
+        return cached_chars // CHARS_PER_TOKEN
+
+    # --- Scripted replies ---
+
+    def _script(self, agent_name: str, messages: List[Dict]) -> tuple:
+        """Returns (content, tool_call) for the agent's next turn."""
+        task = _content(messages[1]) if len(messages) > 1 else ""
+        saved = any(_is_tool_response(message) for message in messages)
+
+        if agent_name == "Planner":
+            if saved:
+                return "TERMINATE", None
+            return "Document_Writer, please draft the document, strictly following the writer's guidance.", None
+        if agent_name == "Document_Writer":
+            if "[FIELD_EDITS]" in task:
+                return self._field_edits(messages), None
+            return self._draft(messages, revised="[PREVIOUS_DRAFT]" in task), None
+        if agent_name == "Writer_User_Proxy":
+            return None, {
+                "name": "upload_blob_async",
+                "arguments": {"container_name": config.OUTPUT_BLOB_CONTAINER, "blob_name": _first(_OUTPUT_BLOB_PATTERN, task), "data": _last_content_containing(messages, "bench-section:")},
+            }
+        if agent_name == "Validator_User_Proxy":
+            if saved:
+                return "TERMINATE", None
+            return None, {
+                "name": "download_blob_as_text_async",
+                "arguments": {"container_name": config.OUTPUT_BLOB_CONTAINER, "blob_name": _first(_OUTPUT_BLOB_PATTERN, task)},
+            }
+        if agent_name == "Fact_Checker":
+            if "[FIELD_VERDICTS]" in task:
+                output_match = _OUTPUT_BLOB_PATTERN.search(task)
+                if output_match and int(output_match.group(1)) >= self._passes_on_iteration(self._section_of(messages)):
+                    return "[FIELD_VERDICTS]\nALL FACTS VERIFIED\n[END_FIELD_VERDICTS]", None
+                return f"[FIELD_VERDICTS]\n- **{_revised_field(self._section_of(messages))}:** CRITICAL: The assessment date does not match the source documents.\n[END_FIELD_VERDICTS]", None
+            return "- The date of the most recent assessment should be checked against the source documents.", None
+        if agent_name == "Quality_Assessor":
+            submissions = [_content(message) for message in messages if _is_tool_response(message) and "accepted" in _content(message)]
+            if submissions:
+                return "TERMINATE", None
+            report = self._report(messages)
+            if self.report_faults == "unsubmitted":
+                return f"Here is my report: {json.dumps(report)}", None
+            rejected = any(_is_tool_response(message) and _content(message).startswith("Error:") for message in messages)
+            if self.report_faults == "reject" and not rejected:
+                report = {**report, "issues": [{**issue, "severity": "severe"} for issue in report["issues"]]}
+            return None, {"name": "submit_feedback_report", "arguments": {"report": report}}
+        if agent_name == "Report_Repairer":
+            # The findings it is given include the report the Quality_Assessor wrote out.
+            return task[task.find("{"):task.rfind("}") + 1], None
+        if agent_name == "Prompt_Writer":
+            return "[REVISION_REQUEST]\n- Please ensure the assessment date matches the source documents exactly.", None
+        return "TERMINATE", None
+
+    def _passes_on_iteration(self, section: str) -> int:
+        return self.passes_on_iteration_by_section.get(section, self.passes_on_iteration)
+
+    def _report(self, messages: List[Dict]) -> Dict[str, Any]:
+        """The structured report for the iteration under review: one critical issue until `passes_on_iteration`."""
+        output_match = _OUTPUT_BLOB_PATTERN.search(_content(messages[1]) if len(messages) > 1 else "")
+        iteration = int(output_match.group(1)) if output_match else 1
+        section = self._section_of(messages)
+        passes_on_iteration = self._passes_on_iteration(section)
+        revised_field = _revised_field(section)
+        issues = [{"severity": "standard", "field": revised_field, "description": "Please confirm the assessment date.", "source_reference": None}]
+        if iteration < passes_on_iteration:
+            issues.insert(0, {"severity": "critical", "field": revised_field, "description": "The assessment date does not match the source documents.", "source_reference": "report_000.pdf"})
+        return {
+            "overall_status": "FAIL" if iteration < passes_on_iteration else "PASS",
+            "assessment": "The draft follows the guidance.",
+            "issues": issues,
+        }
+
+    def _revision(self, section: str) -> str:
+        # Each correction changes the revised field, as a real one would, so that
+        # it is neither a no-op nor a return to an earlier draft.
+        with self._lock:
+            self._revisions_by_section[section] += 1
+            revision = self._revisions_by_section[section]
+        return f"The assessment date has been corrected to match the source documents (revision {revision})."
+
+    def _field_edits(self, messages: List[Dict]) -> str:
+        section = self._section_of(messages)
+        return f"[FIELD_EDITS]\n**{_revised_field(section)}:** {self._revision(section)}\n[END_FIELD_EDITS]"
+
+    def _draft(self, messages: List[Dict], revised: bool = False) -> str:
+        section = self._section_of(messages)
+        layout = _draft_layout(section)
+        # A sub-section's fields are as long as in the whole section's draft, so the parts add up to it.
+        whole_layout = _draft_layout(section.split(".")[0])
+        field_chars = self.draft_tokens * CHARS_PER_TOKEN // max(sum(len(labels) for _, labels in whole_layout), 1)
+        body = (_FILLER_WORDS * (field_chars // len(_FILLER_WORDS) + 1))[:field_chars].strip()
+        lines = [f"<!-- bench-section:{section} -->"]
+        for heading, labels in layout:
+            lines.append(f"\n## {heading}")
+            for label in labels:
+                lines.append(f"**{label}:** {'01/09/2015' if 'date' in label.lower() else body}")
+        if revised:
+            lines[-1] = f"**{_revised_field(section)}:** {self._revision(section)}"
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _section_of(messages: List[Dict]) -> str:
+        for message in messages:
+            match = _SECTION_PATTERN.search(_content(message))
+            if match:
+                return next(group for group in match.groups() if group)
+        return "unknown"
+
+    # --- Response construction ---
+
+    @staticmethod
+    def _build_response(call: LLMCall, content: str | None, tool_call: Dict | None, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> ChatCompletion:
+        tool_calls = None
+        if tool_call:
+            tool_calls = [ChatCompletionMessageFunctionToolCall(
+                id=f"call_{uuid.uuid4().hex[:24]}",
+                type="function",
+                function=Function(name=tool_call["name"], arguments=json.dumps(tool_call["arguments"])),
+            )]
+        response = ChatCompletion(
+            id=f"chatcmpl-bench-{uuid.uuid4().hex[:12]}",
+            object="chat.completion",
+            created=int(time.time()),
+            model=call.deployment,
+            choices=[Choice(
+                index=0,
+                finish_reason="tool_calls" if tool_calls else "stop",
+                message=ChatCompletionMessage(role="assistant", content=content, tool_calls=tool_calls),
+            )],
+            usage=CompletionUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+                prompt_tokens_details=PromptTokensDetails(cached_tokens=cached_tokens),
+            ),
+        )
+        return complete_response(call, response)
+
+
+@lru_cache(maxsize=None)
+def _draft_layout(section: str) -> tuple:
+    """
+    The headings and fields of the section's structure partial, or of a
+    sub-section's heading only.
+    """
+    section_config = config.get_section_config(section) if re.fullmatch(r"\d+(?:\.\d+)?", section) else {}
+    if not section_config.get("structure"):
+        return (("Summary", ("Summary",)),)
+    with open(section_config["structure"], encoding="utf-8") as f:
+        layout = parse_structure(f.read())
+    if section_config.get("heading"):
+        layout = [(heading, labels) for heading, labels in layout if heading == section_config["heading"]]
+    return tuple((heading or "Details", tuple(labels)) for heading, labels in layout)
+
+
+def _revised_field(section: str) -> str:
+    """The field that scripted feedback is about and that scripted patches rewrite."""
+    return _draft_layout(section)[-1][1][-1]
+
+
+def _content(message: Dict) -> str:
+    content = message.get("content")
+    return content if isinstance(content, str) else ""
+
+
+def _is_tool_response(message: Dict) -> bool:
+    return message.get("role") in ("tool", "function") or bool(message.get("tool_responses"))
+
+
+def _last_content_containing(messages: List[Dict], marker: str) -> str:
+    # Matched on content rather than sender name, because an agent sees its own
+    # earlier turns as unnamed "assistant" messages. The system message and the
+    # task (which quotes the report format) are skipped.
+    for message in reversed(messages[2:]):
+        if marker in _content(message):
+            return _content(message)
+    return ""
+
+
+def _first(pattern: re.Pattern, text: str) -> str:
+    match = pattern.search(text)
+    return match.group(0) if match else ""
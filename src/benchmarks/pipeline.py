@@ -0,0 +1,320 @@
+"""
+pipeline.py
+
+End-to-end benchmark of the pipeline's own overhead, i.e. the time spent
+outside the language model.
+
+`main_async` is run unchanged, but with:
+- every container on the in-memory storage backend, seeded with a synthetic
+  corpus of generated PDFs, so pre-processing, merging, Word generation,
+  archiving and cleanup all run without Azure;
+- the scripted `FakeLLM` (`fake_llm.py`) as the innermost LLM gateway
+  middleware, with configurable latency and output speed. The scheduler and
+  any other middleware still run.
+
+The scale is set from the command line and applied to `TOTAL_SECTIONS`,
+`CONCURRENT_SECTIONS` and `MAX_SECTION_ITERATIONS`. Unless
+`--production-quotas` is given, the scheduler runs with unbounded quotas. Sections beyond the three
+real ones reuse their guidance. The benchmark reports wall time, simulated model
+time, LLM calls per agent, tokens per section, stage timings and the critical
+path, peak RSS and event-loop lag.
+With `--latency 0` (the default), the wall time is almost entirely pipeline
+overhead.
+
+Usage (from the project root):
+    python -m src.benchmarks.pipeline --sections 6 --concurrent-sections 3 --max-iterations 3 --documents 8 --pages 30
+
+With `--interrupt-after SECONDS` the run is cancelled after that many
+seconds, which runs its `finally` block as a failed run would, and is then
+resumed from its run-state journal; the LLM calls made before and after the
+interruption are reported separately.
+
+With `--cases N` (N > 1), the corpus is seeded once per case, under the source
+prefixes `case_1/` ... `case_N/`, and the cases are run as one batch; each
+case's outcome is reported separately.
+
+Results are written as JSON to the logs directory, tagged with the current git
+commit. Pass `--baseline <file.json>` to print the change against an earlier
+result.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+from dataclasses import asdict
+from datetime import datetime
+
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.ehcp_autogen import config
+from src.ehcp_autogen.llm import gateway
+from src.ehcp_autogen.utils.feedback import feedback_report_stats
+from src.ehcp_autogen.agents.agent_pool import get_agent_pool
+from src.ehcp_autogen.utils.utils import upload_blob_async, list_blobs_async
+from src.benchmarks.fake_llm import FakeLLM
+
+# The fake model must be the innermost middleware so everything else runs first.
+FAKE_LLM_MIDDLEWARE_ORDER = 1000
+
+_CORPUS_LINES = [
+    "The child was assessed by the educational psychologist in the spring term.",
+    "Speech and language therapy recommends weekly sessions in a small group.",
+    "Parents report that sleep and mealtimes remain difficult at home.",
+    "Occupational therapy identified sensory seeking behaviour in busy spaces.",
+    "The school provides a key adult and a visual timetable throughout the day.",
+    "Attainment in reading is below age-related expectations but improving.",
+]
+
+
+def _make_pdf(document_index: int, pages: int, lines_per_page: int) -> bytes:
+    """Generates a text PDF with `pages` pages of varied report-like sentences."""
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for page_number in range(pages):
+        page = writer.add_blank_page(612, 792)
+        page[NameObject("/Resources")] = DictionaryObject({NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+        lines = []
+        for line_number in range(lines_per_page):
+            sentence = _CORPUS_LINES[(document_index + page_number + line_number) % len(_CORPUS_LINES)]
+            lines.append(f"BT /F1 10 Tf 50 {760 - line_number * 14} Td (Doc {document_index} p{page_number}: {sentence}) Tj ET")
+        stream = DecodedStreamObject()
+        stream.set_data("\n".join(lines).encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(stream)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _configure(args: argparse.Namespace):
+    """Points the application at in-memory storage and the requested scale."""
+    config.STORAGE_BACKEND = "memory"
+    config.STORAGE_CONTAINER_BACKENDS = {}
+    config.TOTAL_SECTIONS = args.sections
+    config.CONCURRENT_SECTIONS = args.concurrent_sections
+    config.MAX_SECTION_ITERATIONS = args.max_iterations
+    config.WRITER_ENGINE = args.writer_engine
+    config.CORRECTION_MODE = args.correction_mode
+    config.VALIDATION_MODE = args.validation_mode
+    config.SPEAKER_SELECTION_MODE = "state_machine"
+    config.SECTION_SCHEDULING = args.section_scheduling
+    config.SUBSECTION_GENERATION = args.subsection_generation
+    config.STAGE_SCHEDULING = args.stage_scheduling
+    config.ARCHIVE_MODE = args.archive_mode
+    config.CONCURRENT_CASES = args.cases
+    # A fresh history unless one is given, so that runs do not learn from each other by accident.
+    config.SECTION_HISTORY_PATH = args.section_history or os.path.join(tempfile.mkdtemp(prefix="bench-history-"), "section_costs.json")
+    config.EXTRACTION_CACHE_ENABLED = args.extraction_cache
+    config.LLM_SCHEDULER_ENABLED = not args.no_scheduler
+    if not args.production_quotas:
+        # The scheduler still runs, but the fake deployments never throttle, so the
+        # wall time measures the pipeline rather than the configured quotas.
+        config.LLM_RATE_LIMITS = {}
+        config.LLM_DEFAULT_RATE_LIMIT = {"tokens_per_minute": 10**12, "requests_per_minute": 10**9, "max_concurrency": 1024}
+
+    real_section_config = config.get_section_config
+    real_section_count = 3
+
+    def _section_config(section_number: str) -> dict:
+        # Sub-section "6.2" is sub-section 2 of the real section that section 6 maps to.
+        section, _, subsection = str(section_number).partition(".")
+        real_section = str((int(section) - 1) % real_section_count + 1)
+        return real_section_config(f"{real_section}.{subsection}" if subsection else real_section)
+
+    config.get_section_config = _section_config
+
+
+async def _monitor_event_loop_lag(interval: float, samples: list):
+    """Records how late each wake-up is; a blocked event loop shows up as lag."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(loop.time() - start - interval, 0.0))
+
+
+def _percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def _git_revision() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+async def run_benchmark_async(args: argparse.Namespace) -> dict:
+    from src.main import main_async
+
+    _configure(args)
+
+    # A single case reads the whole source container, as a production run does.
+    source_prefixes = [f"case_{case_number}/" for case_number in range(1, args.cases + 1)] if args.cases > 1 else [""]
+    for source_prefix in source_prefixes:
+        for document_index in range(args.documents):
+            await upload_blob_async(config.SOURCE_BLOB_CONTAINER, f"{source_prefix}report_{document_index:03d}.pdf", _make_pdf(document_index, args.pages, args.lines_per_page))
+        if args.appendix_pages:
+            # Section 3 (and every third section after it) excludes this document.
+            await upload_blob_async(config.SOURCE_BLOB_CONTAINER, f"{source_prefix}Appendix A.pdf", _make_pdf(args.documents, args.appendix_pages, args.lines_per_page))
+
+    fake_llm = FakeLLM(
+        latency_seconds=args.latency,
+        output_tokens_per_second=args.output_tokens_per_second,
+        draft_tokens=args.draft_tokens,
+        passes_on_iteration=args.passes_on_iteration,
+        passes_on_iteration_by_section={section: int(passes) for section, passes in (item.split("=", 1) for item in args.section_passes.split(",") if item)} if args.section_passes else {},
+        report_faults=args.report_faults,
+    )
+    gateway.install()
+    gateway.register_middleware("fake_llm", fake_llm, order=FAKE_LLM_MIDDLEWARE_ORDER)
+
+    lag_samples = []
+    lag_monitor = asyncio.create_task(_monitor_event_loop_lag(args.lag_interval, lag_samples))
+    start_time = time.perf_counter()
+    resume = {}
+    try:
+        if args.interrupt_after:
+            try:
+                await asyncio.wait_for(main_async(source_prefixes), args.interrupt_after)
+            except asyncio.TimeoutError:
+                pass
+            resume["interrupted_llm_calls"] = fake_llm.metrics()["llm_calls"]
+            resume["interrupted_run_seconds"] = round(time.perf_counter() - start_time, 3)
+            # The interrupted runs are found by their journals, the only state they leave outside the archive.
+            run_ids = sorted({journal_name.split("/", 1)[0] for journal_name in await list_blobs_async(config.RUN_STATE_CONTAINER) if journal_name.endswith("/journal.json")})
+            case_results = await main_async(resume_run_ids=run_ids)
+            resume["resumed_llm_calls"] = fake_llm.metrics()["llm_calls"] - resume["interrupted_llm_calls"]
+        else:
+            case_results = await main_async(source_prefixes)
+    finally:
+        wall_seconds = time.perf_counter() - start_time
+        lag_monitor.cancel()
+        gateway.unregister_middleware("fake_llm")
+
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    llm_metrics = fake_llm.metrics()
+    total_prompt_tokens = sum(tokens["prompt_tokens"] for tokens in llm_metrics["tokens_by_section"].values())
+    total_cached_tokens = sum(tokens["cached_tokens"] for tokens in llm_metrics["tokens_by_section"].values())
+
+    return {
+        "benchmark": "pipeline",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        **_git_revision(),
+        "parameters": vars(args),
+        "succeeded": all(case_result.succeeded for case_result in case_results),
+        "wall_seconds": round(wall_seconds, 3),
+        "simulated_llm_seconds": llm_metrics.pop("simulated_llm_seconds"),
+        **llm_metrics,
+        "prompt_cache_hit_rate": round(total_cached_tokens / total_prompt_tokens, 3) if total_prompt_tokens else 0.0,
+        "feedback_reports": feedback_report_stats(),
+        "agent_pool": get_agent_pool().stats(),
+        "resume": resume,
+        # Section outcomes, stage timings, the section schedule and the archive report of each case.
+        "cases": [asdict(case_result) for case_result in case_results],
+        # ru_maxrss is reported in kilobytes on Linux.
+        "peak_rss_mb": round(self_usage.ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(children_usage.ru_maxrss / 1024, 1),
+        "event_loop_lag_ms": {
+            "samples": len(lag_samples),
+            "mean": round(statistics.fmean(lag_samples) * 1000, 2) if lag_samples else 0.0,
+            "p95": round(_percentile(lag_samples, 0.95) * 1000, 2),
+            "max": round(max(lag_samples, default=0.0) * 1000, 2),
+        },
+    }
+
+
+def _print_comparison(result: dict, baseline: dict):
+    """Prints headline metrics next to a baseline result."""
+    rows = [
+        ("wall_seconds", result["wall_seconds"], baseline.get("wall_seconds")),
+        ("llm_calls", result["llm_calls"], baseline.get("llm_calls")),
+        ("prompt_cache_hit_rate", result["prompt_cache_hit_rate"], baseline.get("prompt_cache_hit_rate")),
+        ("peak_rss_mb", result["peak_rss_mb"], baseline.get("peak_rss_mb")),
+        ("event_loop_lag_p95_ms", result["event_loop_lag_ms"]["p95"], baseline.get("event_loop_lag_ms", {}).get("p95")),
+        ("event_loop_lag_max_ms", result["event_loop_lag_ms"]["max"], baseline.get("event_loop_lag_ms", {}).get("max")),
+    ]
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for name, current, previous in rows:
+        if previous:
+            print(f"  {name:<24} {previous:>10} -> {current:>10} ({(current - previous) / previous:+.1%})")
+        else:
+            print(f"  {name:<24} {'-':>10} -> {current:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline overhead with a scripted LLM and in-memory storage.")
+    parser.add_argument("--sections", type=int, default=3, help="TOTAL_SECTIONS for the run.")
+    parser.add_argument("--concurrent-sections", type=int, default=3, help="CONCURRENT_SECTIONS for the run.")
+    parser.add_argument("--max-iterations", type=int, default=3, help="MAX_SECTION_ITERATIONS for the run.")
+    parser.add_argument("--passes-on-iteration", type=int, default=2, help="Validation iteration from which the fake validator reports no critical issues.")
+    parser.add_argument("--section-passes", help="Per-section overrides of --passes-on-iteration, e.g. '3=4' makes section 3 need four iterations.")
+    parser.add_argument("--section-scheduling", choices=["critical_path", "fifo"], default="fifo")
+    parser.add_argument("--subsection-generation", choices=["parallel", "whole"], default="whole", help="Write sections that declare sub-sections in parallel parts, or as one document.")
+    parser.add_argument("--section-history", help="Section cost history file to read and update (default: a fresh temporary file).")
+    parser.add_argument(
+        "--report-faults", choices=["none", "reject", "unsubmitted"], default="none",
+        help="Make the fake Quality_Assessor submit a malformed first report ('reject') or write it as plain text instead ('unsubmitted').",
+    )
+    parser.add_argument("--stage-scheduling", choices=["dag", "phased"], default="phased")
+    parser.add_argument("--archive-mode", choices=["copy", "bundle"], default="copy", help="Archive each artifact as its own blob, or as one compressed bundle per run.")
+    parser.add_argument("--documents", type=int, default=5, help="Number of source PDFs.")
+    parser.add_argument("--appendix-pages", type=int, default=0, help="Pages of an additional 'Appendix A.pdf', which section 3 excludes (0 = none).")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per source PDF.")
+    parser.add_argument("--lines-per-page", type=int, default=40, help="Text lines per PDF page.")
+    parser.add_argument("--draft-tokens", type=int, default=800, help="Size of each fake draft.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fixed seconds added to every fake LLM call.")
+    parser.add_argument("--output-tokens-per-second", type=float, default=0.0, help="Simulated generation speed (0 = instant).")
+    parser.add_argument("--writer-engine", choices=["groupchat", "direct"], default="groupchat")
+    parser.add_argument("--correction-mode", choices=["rewrite", "patch"], default="rewrite")
+    parser.add_argument("--validation-mode", choices=["full", "incremental"], default="full")
+    parser.add_argument("--extraction-cache", action="store_true", help="Enable the PDF extraction cache.")
+    parser.add_argument("--no-scheduler", action="store_true", help="Disable the LLM scheduler middleware.")
+    parser.add_argument("--production-quotas", action="store_true", help="Keep the configured TPM/RPM quotas instead of unbounded ones.")
+    parser.add_argument("--lag-interval", type=float, default=0.01, help="Event-loop lag sampling interval in seconds.")
+    parser.add_argument("--cases", type=int, default=1, help="Number of cases, each with its own copy of the corpus, run concurrently as one batch.")
+    parser.add_argument("--interrupt-after", type=float, default=0.0, help="Cancel the run after this many seconds, then resume it from its journal (0 = run once).")
+    parser.add_argument("--baseline", help="A previous result JSON to compare against.")
+    parser.add_argument("--output", help="Where to write the result JSON (default: logs directory).")
+    args = parser.parse_args()
+
+    os.makedirs(config.LOGS_DIR, exist_ok=True)
+    os.makedirs(config.OUTPUTS_DIR, exist_ok=True)
+    result = asyncio.run(run_benchmark_async(args))
+
+    output_path = args.output or os.path.join(config.LOGS_DIR, f"bench_pipeline_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    # main_async routes logging to the console; the summary is printed on its own.
+    logging.getLogger().handlers.clear()
+    print(json.dumps({key: value for key, value in result.items() if key != "parameters"}, indent=2))
+    print(f"\nResults written to {output_path}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            _print_comparison(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
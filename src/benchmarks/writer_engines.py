@@ -0,0 +1,144 @@
+"""
+writer_engines.py
+
+Benchmarks the two writer engines against each other on the same section,
+task and source documents, using the configured Azure OpenAI deployments:
+
+- "groupchat": the Planner / Document_Writer / Writer_User_Proxy team.
+- "direct": a single completion from a standalone Document_Writer, saved by
+  the orchestrator.
+
+Usage (from the project root, after the sources have been pre-processed):
+    python -m src.benchmarks.writer_engines --section 1 --repeats 3
+
+Add `--preprocess` to run PDF pre-processing first. Drafts are written to the
+output container as `bench_{engine}_s{n}_r{k}.md`, so they never collide with
+a real run's `output_s{n}_i{k}.md` blobs, and are removed by the normal
+end-of-run cleanup of that container. Results are printed and written as JSON
+to the logs directory.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+from datetime import datetime
+
+import autogen
+from autogen import GroupChatManager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.ehcp_autogen import config
+from src.ehcp_autogen.config import llm_config, llm_config_fast
+from src.ehcp_autogen.tasks import get_creation_task
+from src.ehcp_autogen.orchestration.orchestrator import create_writer, run_writer_async
+from src.ehcp_autogen.utils.utils import SourceCorpus, preprocess_all_pdfs_async, download_blob_as_text_async
+
+ENGINES = ["groupchat", "direct"]
+
+
+def _token_usage(writer) -> dict:
+    """Sums prompt and completion tokens across every agent involved in a writer pass."""
+    agents = writer.groupchat.agents + [writer] if isinstance(writer, GroupChatManager) else [writer]
+    usage = autogen.gather_usage_summary(agents)["usage_including_cached_inference"]
+    totals = {"prompt_tokens": 0, "completion_tokens": 0, "cost": usage.get("total_cost", 0.0)}
+    for model, model_usage in usage.items():
+        if model == "total_cost":
+            continue
+        totals["prompt_tokens"] += model_usage.get("prompt_tokens", 0)
+        totals["completion_tokens"] += model_usage.get("completion_tokens", 0)
+    return totals
+
+
+def _agent_turns(writer) -> int:
+    """Counts the agent replies in a pass, excluding tool executions, which make no LLM call."""
+    if not isinstance(writer, GroupChatManager):
+        return 1
+    return sum(
+        1 for message in writer.groupchat.messages[1:]
+        if message.get("role") not in ("tool", "function") and not message.get("tool_responses")
+    )
+
+
+async def run_benchmark_async(section_number: str, repeats: int) -> dict:
+    source_corpus = await SourceCorpus.load(config.PROCESSED_BLOB_CONTAINER)
+    section_config = config.get_section_config(section_number)
+    source_content = source_corpus.get_content(section_config.get("source_exclude_files", []))
+
+    runs = []
+    for repeat in range(1, repeats + 1):
+        # Engines are interleaved so that drift in service latency affects both equally.
+        for engine in ENGINES:
+            output_blob_name = f"bench_{engine}_s{section_number}_r{repeat}.md"
+            writer = create_writer(llm_config, llm_config_fast, writer_engine=engine)
+            task = await get_creation_task(section_number, output_blob_name, source_content, writer_engine=engine)
+
+            start_time = time.monotonic()
+            await run_writer_async(writer, task, output_blob_name)
+            elapsed_seconds = time.monotonic() - start_time
+
+            draft = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, output_blob_name)
+            run = {
+                "engine": engine,
+                "repeat": repeat,
+                "seconds": round(elapsed_seconds, 2),
+                "agent_turns": _agent_turns(writer),
+                "draft_saved": bool(draft),
+                "draft_chars": len(draft),
+                **_token_usage(writer),
+            }
+            logging.info(f"Benchmark run: {run}")
+            runs.append(run)
+
+    summary = {}
+    for engine in ENGINES:
+        engine_runs = [run for run in runs if run["engine"] == engine]
+        summary[engine] = {
+            "mean_seconds": round(statistics.mean(run["seconds"] for run in engine_runs), 2),
+            "mean_agent_turns": statistics.mean(run["agent_turns"] for run in engine_runs),
+            "mean_prompt_tokens": statistics.mean(run["prompt_tokens"] for run in engine_runs),
+            "mean_completion_tokens": statistics.mean(run["completion_tokens"] for run in engine_runs),
+            "mean_cost": statistics.mean(run["cost"] for run in engine_runs),
+            "drafts_saved": sum(run["draft_saved"] for run in engine_runs),
+        }
+    if summary["direct"]["mean_seconds"]:
+        summary["speedup"] = round(summary["groupchat"]["mean_seconds"] / summary["direct"]["mean_seconds"], 2)
+
+    return {
+        "section": section_number,
+        "repeats": repeats,
+        "speaker_selection_mode": config.SPEAKER_SELECTION_MODE,
+        "source_bytes": len(source_content.encode("utf-8")),
+        "runs": runs,
+        "summary": summary,
+    }
+
+
+async def main_async(args: argparse.Namespace):
+    if args.preprocess and not await preprocess_all_pdfs_async():
+        raise RuntimeError("Pre-processing failed; cannot run the benchmark.")
+
+    results = await run_benchmark_async(str(args.section), args.repeats)
+
+    os.makedirs(config.LOGS_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    results_path = os.path.join(config.LOGS_DIR, f"bench_writer_engines_{timestamp}.json")
+    with open(results_path, "w", encoding="utf-8") as results_file:
+        json.dump(results, results_file, indent=2)
+
+    print(json.dumps(results["summary"], indent=2))
+    print(f"Full results written to {results_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the groupchat and direct writer engines.")
+    parser.add_argument("--section", default="1", help="Section number to draft.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of drafts per engine.")
+    parser.add_argument("--preprocess", action="store_true", help="Run PDF pre-processing before benchmarking.")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(main_async(parser.parse_args()))
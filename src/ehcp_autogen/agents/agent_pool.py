@@ -0,0 +1,99 @@
+"""
+agent_pool.py
+
+This module keeps the process's agents and agent teams for reuse.
+
+Every validation used to build a new validator team (a GroupChatManager and
+three agents, each with its own LLM client), every section a new writer team,
+and every incremental validation or consistency check a new Fact_Checker.
+Building a team takes about 0.2s of event-loop time, which was repeated for
+every iteration of every section, and again for every case. `AgentPool`
+keeps each agent or team after its caller has finished with it, resets its
+chat history and reply counters, and leases it to the next caller that needs
+the same role, from any section of any case run in the process. A role never
+has more instances than were in use at the same time.
+
+An agent or team whose caller failed or was cancelled is discarded rather than
+returned to the pool, as a completion for it may still be running in the
+executor. With `AGENT_POOL_ENABLED` false, every lease builds a new agent.
+"""
+
+import logging
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List
+
+from autogen import GroupChatManager
+
+from .. import config
+
+
+def _reset(resource: Any):
+    """Clears everything an agent, a team, or a tuple of them kept from its last task."""
+    if isinstance(resource, tuple):
+        for part in resource:
+            _reset(part)
+    elif isinstance(resource, GroupChatManager):
+        for agent in resource.groupchat.agents:
+            agent.reset()
+        resource.groupchat.reset()
+        # `reset` would replace the manager's group chat with a copy, so only its history and counters are cleared.
+        resource.clear_history()
+        resource.reset_consecutive_auto_reply_counter()
+    else:
+        resource.reset()
+
+
+class AgentPool:
+    """Leases agents and teams by role, building one only when none is free."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._idle: Dict[str, List[Any]] = defaultdict(list)
+        self.created = Counter()
+        self.reused = Counter()
+
+    @asynccontextmanager
+    async def lease(self, role: str, create: Callable[[], Any]):
+        """
+        Yields a free agent (or team) of `role`, or one built with `create`, and
+        takes it back, reset, when the caller's block finishes.
+        """
+        idle = self._idle[role]
+        if idle:
+            resource = idle.pop()
+            self.reused[role] += 1
+        else:
+            resource = create()
+            self.created[role] += 1
+        yield resource
+        # Not reached if the caller's block raised (or was cancelled), so such an agent is dropped.
+        if self.enabled:
+            try:
+                _reset(resource)
+            except Exception as e:
+                logging.warning(f"A pooled '{role}' could not be reset and was discarded. Reason: {e}")
+                return
+            idle.append(resource)
+
+    def stats(self) -> Dict[str, object]:
+        """Returns the agents built and reused, per role, for the run summary."""
+        return {
+            "created": sum(self.created.values()),
+            "reused": sum(self.reused.values()),
+            "by_role": {
+                role: {"created": self.created[role], "reused": self.reused[role], "idle": len(self._idle[role])}
+                for role in sorted(set(self.created) | set(self.reused))
+            },
+        }
+
+
+_agent_pool: AgentPool | None = None
+
+
+def get_agent_pool() -> AgentPool:
+    """Returns the process's agent pool, shared by every case run in the process."""
+    global _agent_pool
+    if _agent_pool is None:
+        _agent_pool = AgentPool(config.AGENT_POOL_ENABLED)
+    return _agent_pool
@@ -0,0 +1,146 @@
+"""
+speaker_selection.py
+
+This module provides deterministic speaker-transition functions for the
+Writer and Validator GroupChats.
+
+By default an AutoGen `GroupChatManager` asks an LLM to pick the next speaker
+on every round. Both of our teams, however, follow a fixed workflow that is
+already spelled out in their system messages, so that LLM call adds latency
+and cost without adding any information. The functions here encode those
+workflows as simple state machines and are passed to `GroupChat` as its
+`speaker_selection_method`.
+
+Whenever the conversation leaves the expected path (most importantly, when a
+tool call fails), a selector returns the string "auto". AutoGen then falls
+back to its normal LLM-based selection for that round only, so the team can
+still recover in the same way it did before.
+
+The mode is chosen with `SPEAKER_SELECTION_MODE` in `config.py`.
+"""
+
+import logging
+from typing import Callable, Dict, List, Union
+from autogen import Agent, GroupChat
+
+from .. import config
+
+# Returning this value from a selector hands the round back to the manager's LLM.
+LLM_FALLBACK = "auto"
+
+
+def _has_tool_calls(message: Dict) -> bool:
+    return bool(message.get("tool_calls") or message.get("function_call"))
+
+
+def _is_tool_response(message: Dict) -> bool:
+    return message.get("role") in ("tool", "function") or bool(message.get("tool_responses"))
+
+
+def _tool_call_failed(message: Dict) -> bool:
+    """
+    Detects a failed tool execution. AutoGen reports exceptions raised by a tool
+    as an "Error: ..." response, and our blob download tool returns an empty
+    string when it cannot read the blob.
+    """
+    responses = message.get("tool_responses") or [message]
+    for response in responses:
+        content = (response.get("content") or "").strip()
+        if not content or content.startswith("Error:"):
+            return True
+    return False
+
+
+def _last_tool_call_names(messages: List[Dict]) -> List[str]:
+    """Returns the function names of the most recent tool-call request in the chat."""
+    for message in reversed(messages):
+        if message.get("tool_calls"):
+            return [call["function"]["name"] for call in message["tool_calls"]]
+        if message.get("function_call"):
+            return [message["function_call"]["name"]]
+    return []
+
+
+def _fallback(team: str, reason: str) -> str:
+    logging.warning(f"{team} speaker selection: {reason}. Falling back to LLM speaker selection for this round.")
+    return LLM_FALLBACK
+
+
+def select_writer_speaker(last_speaker: Agent, groupchat: GroupChat) -> Union[Agent, str]:
+    """
+    State machine for the Writer team:
+    task -> Planner -> Document_Writer -> Writer_User_Proxy (save) -> Planner (TERMINATE).
+    """
+    messages = groupchat.messages
+    last_message = messages[-1] if messages else {}
+    proxy = groupchat.agent_by_name("Writer_User_Proxy")
+
+    # A requested tool call is always executed by the proxy, which owns the tools.
+    if _has_tool_calls(last_message):
+        return proxy
+    if _is_tool_response(last_message):
+        if _tool_call_failed(last_message):
+            return _fallback("Writer", "the upload tool call failed")
+        # The draft is saved; the Planner confirms and terminates.
+        return groupchat.agent_by_name("Planner")
+
+    if last_speaker.name == "Writer_User_Proxy" and len(messages) == 1:
+        return groupchat.agent_by_name("Planner")
+    if last_speaker.name == "Planner":
+        has_draft = any(message.get("name") == "Document_Writer" for message in messages)
+        return proxy if has_draft else groupchat.agent_by_name("Document_Writer")
+    if last_speaker.name == "Document_Writer":
+        # The proxy already holds the blob name from the task, so it can save the
+        # draft directly without the Planner relaying the instruction.
+        return proxy
+
+    return _fallback("Writer", f"unexpected turn from '{last_speaker.name}'")
+
+
+def select_validator_speaker(last_speaker: Agent, groupchat: GroupChat) -> Union[Agent, str]:
+    """
+    State machine for the Validator team:
+    task -> Validator_User_Proxy (download draft) -> Fact_Checker -> Quality_Assessor (submit report)
+    -> Validator_User_Proxy (execute submission) -> Quality_Assessor (TERMINATE).
+
+    A rejected report submission goes straight back to the Quality_Assessor to
+    correct it, without repeating the review.
+    """
+    messages = groupchat.messages
+    last_message = messages[-1] if messages else {}
+    proxy = groupchat.agent_by_name("Validator_User_Proxy")
+    quality_assessor = groupchat.agent_by_name("Quality_Assessor")
+
+    if _has_tool_calls(last_message):
+        return proxy
+    if _is_tool_response(last_message):
+        if "submit_feedback_report" in _last_tool_call_names(messages):
+            # Accepted, the Quality_Assessor issues the termination signal; rejected,
+            # it corrects the report it submitted.
+            return quality_assessor
+        if _tool_call_failed(last_message):
+            return _fallback("Validator", "a blob tool call failed")
+        return groupchat.agent_by_name("Fact_Checker")
+
+    if last_speaker.name == "Validator_User_Proxy" and len(messages) == 1:
+        # The proxy's first turn is the tool call that downloads the draft.
+        return proxy
+    if last_speaker.name == "Fact_Checker":
+        return quality_assessor
+    if last_speaker.name == "Quality_Assessor":
+        return proxy
+
+    return _fallback("Validator", f"unexpected turn from '{last_speaker.name}'")
+
+
+def resolve_speaker_selection_method(state_machine_selector: Callable, mode: str = None) -> Union[Callable, str]:
+    """
+    Maps a speaker selection mode to the value expected by `GroupChat`.
+    "state_machine" returns the team's selector; "auto" keeps LLM-based selection.
+    """
+    mode = (mode or config.SPEAKER_SELECTION_MODE).lower()
+    if mode == "state_machine":
+        return state_machine_selector
+    if mode == "auto":
+        return LLM_FALLBACK
+    raise ValueError(f"Unknown speaker selection mode '{mode}'. Expected 'state_machine' or 'auto'.")
@@ -9,30 +9,92 @@ The Validator Team's purpose is to meticulously review a generated document
 draft against a set of predefined rules and the original source materials.
 It is designed to identify factual inaccuracies, structural errors,
 hallucinations, and rule violations. The final output of this team is a
-structured markdown feedback report that includes a summary of critical and
-standard issues found.
+structured feedback report (see `utils/feedback.py`) listing the critical and
+standard issues found, which is saved as a markdown report with a summary of
+their counts.
 
 The team consists of:
-- Quality_Assessor: The lead agent that consolidates feedback and creates the final report.
+- Quality_Assessor: The lead agent that consolidates feedback and submits the final report
+  through the `submit_feedback_report` tool.
 - Fact_Checker: A specialist agent focused solely on verifying content against source documents.
-- Validator_User_Proxy: The tool-executing agent for downloading drafts and uploading feedback.
+- Validator_User_Proxy: The tool-executing agent for downloading drafts and receiving the report.
+
+A report the team fails to submit is rebuilt from its findings by a
+standalone Report_Repairer (`create_report_repair_agent`), rather than by
+running the team again.
+
+When `VALIDATION_MODE` is "incremental", later iterations may skip the team and
+send only the changed fields to a standalone Fact_Checker
+(`create_fact_checker_agent`); see `run_incremental_validation_async`.
 """
 
 
+import json
 import autogen
 from autogen import ConversableAgent, UserProxyAgent, GroupChat, GroupChatManager
 from typing import Dict
 
+from .speaker_selection import select_validator_speaker, resolve_speaker_selection_method
+
 from ..utils.utils import (
     is_terminate_message,
     download_blob_as_text_async,
-    upload_blob_async,
 )
+from ..utils.feedback import FeedbackReport, FeedbackReportCollector
+
+def create_fact_checker_agent(llm_config: Dict) -> ConversableAgent:
+    """
+    Creates the Fact_Checker agent. It is a member of the validator team and is
+    also used on its own by incremental validation, which sends it only the
+    fields that changed since the previous iteration.
+    """
+    return ConversableAgent(
+        name="Fact_Checker",
+        llm_config=llm_config,
+        system_message="""You are a meticulous Fact Checker. Your role is to be the ultimate authority on the factual accuracy of a document when compared against the original source materials.
+
+        Your SOLE FOCUS is content verification. Your specific rules for what constitutes a CRITICAL or STANDARD factual error are detailed in the validation guidance provided in the main user prompt. **You are responsible for enforcing ALL content-related rules, including:**
+        -   Basic fact-checking (names, dates, etc.).
+        -   Anti-hallucination rules.
+        -   The "Golden Thread" rules.
+        -   The "Provision Specificity" rules.
+        -   The "SMART Outcomes" rules.
+        -   The "Needs Categorisation" rules.
+
+        **Workflow:**
+        1.  Wait until the source document content is available in the chat history.
+        2.  Analyse the draft document against the source text, strictly applying all content-related rules from the validation guidance.
+        3.  Report your findings as a detailed, clear list of all discrepancies. If there are no issues, your entire response MUST be "ALL FACTS VERIFIED".
+
+        You must not comment on the final report's formatting. You do not call any tools."""
+    )
+
+def create_report_repair_agent(llm_config: Dict) -> ConversableAgent:
+    """
+    Creates the Report_Repairer, which turns the validator team's findings and
+    any malformed report into a `FeedbackReport` in JSON mode. It is given
+    the fast model: it only restructures findings that have already been made.
+    """
+    return ConversableAgent(
+        name="Report_Repairer",
+        llm_config={**llm_config, "response_format": {"type": "json_object"}},
+        system_message=f"""You convert a validation team's findings into a structured feedback report.
+
+        You are given the Fact_Checker's findings and the Quality_Assessor's attempted report, which could not be accepted. Do not add, remove or re-judge any issue: restructure the findings exactly as reported, classifying each as critical or standard as the Quality_Assessor did, or as the Fact_Checker did if the Quality_Assessor did not.
+
+        Your ENTIRE response MUST be a single JSON object that conforms to this JSON schema:
+        {json.dumps(FeedbackReport.model_json_schema())}"""
+    )
 
 # This team is responsible for validating the document against criteria and generating a feedback report.
-def create_validator_team(llm_config: Dict, llm_config_fast: Dict) -> GroupChatManager:
+def create_validator_team(llm_config: Dict, llm_config_fast: Dict, report_collector: FeedbackReportCollector, speaker_selection_mode: str = None) -> GroupChatManager:
     """
-    Creates and configures the validator multi-agent team.
+    Creates and configures the validator multi-agent team. The report the
+    Quality_Assessor submits is kept by `report_collector`.
+
+    `speaker_selection_mode` is either "state_machine" (follow the team's fixed
+    workflow without asking the manager's LLM) or "auto" (LLM-selected speakers).
+    Defaults to `config.SPEAKER_SELECTION_MODE`.
     """
     validator_user_proxy = UserProxyAgent(
         name="Validator_User_Proxy",
@@ -43,7 +105,7 @@ def create_validator_team(llm_config: Dict, llm_config_fast: Dict) -> GroupChatM
         llm_config=llm_config_fast,
         system_message="""You are the user proxy and tool executor for the validation team.
         Your job is to execute tool calls as directed by other agents.
-        You will read files when asked and, crucially, you will save the final consolidated feedback report using the `upload_blob` tool when the `Quality_Assessor` provides it.
+        You will read files when asked and execute the `submit_feedback_report` call made by the `Quality_Assessor`.
         You will listen for the `Quality_Assessor` to say 'TERMINATE', at which point the task will end."""
     )
 
@@ -59,40 +121,22 @@ def create_validator_team(llm_config: Dict, llm_config_fast: Dict) -> GroupChatM
 
         **Your Workflow:**
 
-        1.  **First Turn (Generate Report):** You will be called upon AFTER the `Fact_Checker` has provided its findings. In this turn, your **ENTIRE response MUST be the complete and final feedback report** in the specified markdown format. The report must consolidate your own assessment with the findings from the `Fact_Checker` and include the `[FEEDBACK_SUMMARY]` block with the correct counts.
+        1.  **First Turn (Submit Report):** You will be called upon AFTER the `Fact_Checker` has provided its findings. In this turn, you MUST call the `submit_feedback_report` tool with the complete and final report, consolidating your own assessment with the findings from the `Fact_Checker`. List every issue separately, with its severity, the exact label of the field it concerns and, where there is one, the source document it relies on. The report is saved for you; do not write it out as a message.
+
+        2.  **Correction Turn (Only If Rejected):** If the tool replies with an error, the report did not fit the required format. Call `submit_feedback_report` again with the corrected report. Do not change your findings.
 
-        2.  **Second Turn (Terminate):** After the user proxy has saved your report, you will be called upon one final time. In this turn, your **ENTIRE response MUST be the single word `TERMINATE`**.
+        3.  **Final Turn (Terminate):** After your report has been accepted, your **ENTIRE response MUST be the single word `TERMINATE`**.
         
         You MUST treat the `Fact_Checker`'s report as the absolute truth for all content issues. You are a report compiler, not a second-level fact-checker. You do not need to consult the source documents.
         """
 
     )
 
-    fact_checker = ConversableAgent(
-        name="Fact_Checker",
-        llm_config=llm_config,
-        system_message="""You are a meticulous Fact Checker. Your role is to be the ultimate authority on the factual accuracy of a document when compared against the original source materials.
-
-        Your SOLE FOCUS is content verification. Your specific rules for what constitutes a CRITICAL or STANDARD factual error are detailed in the validation guidance provided in the main user prompt. **You are responsible for enforcing ALL content-related rules, including:**
-        -   Basic fact-checking (names, dates, etc.).
-        -   Anti-hallucination rules.
-        -   The "Golden Thread" rules.
-        -   The "Provision Specificity" rules.
-        -   The "SMART Outcomes" rules.
-        -   The "Needs Categorisation" rules.
-
-        **Workflow:**
-        1.  Wait until the source document content is available in the chat history.
-        2.  Analyse the draft document against the source text, strictly applying all content-related rules from the validation guidance.
-        3.  Report your findings as a detailed, clear list of all discrepancies. If there are no issues, your entire response MUST be "ALL FACTS VERIFIED".
-
-        You must not comment on the final report's formatting. You do not call any tools."""
-    )
+    fact_checker = create_fact_checker_agent(llm_config)
 
 
     agent_tools = [
         download_blob_as_text_async,
-        upload_blob_async
     ]
 
     for func in agent_tools:
@@ -106,9 +150,21 @@ def create_validator_team(llm_config: Dict, llm_config_fast: Dict) -> GroupChatM
             description=description
         )
 
+    # The report is passed as a schema-checked argument, so the proxy never has to
+    # copy it into an upload call. A report that does not fit the schema is returned
+    # to the Quality_Assessor as an "Error: ..." tool response.
+    autogen.agentchat.register_function(
+        report_collector.submit_feedback_report,
+        caller=quality_assessor,
+        executor=validator_user_proxy,
+        name="submit_feedback_report",
+        description=report_collector.submit_feedback_report.__doc__,
+    )
+
     groupchat = GroupChat(
         agents=[validator_user_proxy, quality_assessor, fact_checker],
         messages=[],
+        speaker_selection_method=resolve_speaker_selection_method(select_validator_speaker, speaker_selection_mode),
         max_round=40
     )
     
@@ -119,7 +175,7 @@ def create_validator_team(llm_config: Dict, llm_config_fast: Dict) -> GroupChatM
         Follow the workflow:
         1. `Fact_Checker` (factual review).
         2. `Quality_Assessor` (consolidate and create the single, final report).
-        3. `Validator_User_Proxy` (save report).
+        3. `Validator_User_Proxy` (execute the report submission).
         4. `Quality_Assessor` (final termination signal).
         Ensure the conversation flows in this exact order."""
     )
@@ -14,21 +14,49 @@ The team consists of:
 - Planner: A fast orchestrator agent that directs the workflow and ensures tasks are completed in order.
 - Document_Writer: The specialist content generation agent that synthesises information and writes the draft.
 - Writer_User_Proxy: The tool-executing agent for saving the final document to blob storage.
+
+When `WRITER_ENGINE` is "direct", the team is bypassed entirely: the task prompt
+is sent to a standalone Document_Writer (`create_document_writer_agent`) in one
+completion and the orchestrator saves the result itself.
 """
 
 
 import autogen
 from autogen import ConversableAgent, UserProxyAgent, GroupChat, GroupChatManager
 from typing import Dict
+
+from .speaker_selection import select_writer_speaker, resolve_speaker_selection_method
 from ..utils.utils import (
     is_terminate_message,
     upload_blob_async
 )
 
+def create_document_writer_agent(llm_config: Dict) -> ConversableAgent:
+    """
+    Creates the Document_Writer agent. It is a member of the writer team and is
+    also used on its own by the "direct" writer engine, which sends the creation
+    or correction task to it in a single completion.
+    """
+    return ConversableAgent(
+        name="Document_Writer",
+        llm_config=llm_config,
+        system_message= """You are a professional document writer. Your job is to synthesise information from provided source documents into a final draft.
+
+        Your primary directive is to **strictly and precisely follow all rules and instructions** provided to you in the user's prompt under the heading "writer's guidance". This guidance is your absolute source of truth for formatting, structure, and content generation rules.
+
+        **Execution Rules:**
+        - If you receive a [REVISION_REQUEST], refine the document based ONLY on the revision instructions provided, while continuing to adhere to the original writer's guidance.
+        - Your entire response must be ONLY the content of the document itself. Do not add any conversational text, comments, or explanations."""
+    )
+
 # This team is responsible for drafting the document
-def create_writer_team(llm_config: Dict, llm_config_fast: Dict) -> GroupChatManager:
+def create_writer_team(llm_config: Dict, llm_config_fast: Dict, speaker_selection_mode: str = None) -> GroupChatManager:
     """
     Creates and configures the writer multi-agent team.
+
+    `speaker_selection_mode` is either "state_machine" (follow the team's fixed
+    workflow without asking the manager's LLM) or "auto" (LLM-selected speakers).
+    Defaults to `config.SPEAKER_SELECTION_MODE`.
     """
     writer_user_proxy = UserProxyAgent(
         name="Writer_User_Proxy",
@@ -43,17 +71,7 @@ def create_writer_team(llm_config: Dict, llm_config_fast: Dict) -> GroupChatMana
                         The Planner will signal the end of the task by replying with the single word 'TERMINATE'. Your termination condition is set to detect this word."""
     )
 
-    document_writer = ConversableAgent(
-        name="Document_Writer",
-        llm_config=llm_config,
-        system_message= """You are a professional document writer. Your job is to synthesise information from provided source documents into a final draft.
-
-        Your primary directive is to **strictly and precisely follow all rules and instructions** provided to you in the user's prompt under the heading "writer's guidance". This guidance is your absolute source of truth for formatting, structure, and content generation rules.
-
-        **Execution Rules:**
-        - If you receive a [REVISION_REQUEST], refine the document based ONLY on the revision instructions provided, while continuing to adhere to the original writer's guidance.
-        - Your entire response must be ONLY the content of the document itself. Do not add any conversational text, comments, or explanations."""
-    )
+    document_writer = create_document_writer_agent(llm_config)
 
     planner = ConversableAgent(
         name="Planner",
@@ -92,6 +110,7 @@ def create_writer_team(llm_config: Dict, llm_config_fast: Dict) -> GroupChatMana
     groupchat = GroupChat(
         agents=[writer_user_proxy, document_writer, planner],
         messages=[],
+        speaker_selection_method=resolve_speaker_selection_method(select_writer_speaker, speaker_selection_mode),
         max_round=30
     )
     
@@ -47,11 +47,195 @@ PROCESSED_BLOB_CONTAINER = "processed-docs"
 OUTPUT_BLOB_CONTAINER = "outputs"
 FINAL_DOCUMENT_CONTAINER = "final-document"
 ARCHIVE_BLOB_CONTAINER = "run-archive"
+# Persists extracted PDF text between runs. Unlike 'processed-docs', this
+# container is never cleared at the end of a run.
+EXTRACTION_CACHE_CONTAINER = "extraction-cache"
+# Holds each run's progress journal and checkpoints (see `run_state.py`), so a
+# run that stops part-way can be resumed. Never cleared at the end of a run.
+RUN_STATE_CONTAINER = "run-state"
+# Every blob a run writes to these containers is named under a `{run_id}/`
+# prefix, so the runs of several cases can share them (see utils/run_scope.py).
+# The source container is scoped by each case's source prefix instead, and the
+# extraction cache, archive and run-state containers are keyed by content or
+# run ID already.
+RUN_SCOPED_CONTAINERS = [PROCESSED_BLOB_CONTAINER, OUTPUT_BLOB_CONTAINER, FINAL_DOCUMENT_CONTAINER]
+
+# --- Storage Backend Settings ---
+# Where each container lives: "azure" (Azure Blob Storage), "local" (a directory
+# per container under LOCAL_STORAGE_DIR) or "memory" (in-process, for tests and
+# benchmarks). STORAGE_BACKEND is the default; SCRATCH_STORAGE_BACKEND applies to
+# the intermediate containers only, so drafts and feedback can stay on local disk
+# while source documents, final deliverables and archives remain in Azure.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "azure")
+SCRATCH_STORAGE_BACKEND = os.getenv("SCRATCH_STORAGE_BACKEND", STORAGE_BACKEND)
+STORAGE_CONTAINER_BACKENDS = {
+    PROCESSED_BLOB_CONTAINER: SCRATCH_STORAGE_BACKEND,
+    OUTPUT_BLOB_CONTAINER: SCRATCH_STORAGE_BACKEND,
+}
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", os.path.join(BASE_DIR, "storage"))
+# Local blobs at least this large are read through mmap. None disables mmap reads.
+LOCAL_STORAGE_MMAP_MIN_BYTES = 1024 * 1024
+
+# --- Blob Read Cache Settings ---
+# Blobs in these containers are cached in memory for the duration of a run.
+# Uploads write through to the cache, so drafts, feedback reports and the merged
+# document are not downloaded again straight after they were written.
+BLOB_CACHE_ENABLED = True
+BLOB_CACHE_CONTAINERS = [PROCESSED_BLOB_CONTAINER, OUTPUT_BLOB_CONTAINER]
+BLOB_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# When True, every cache hit is confirmed with an ETag-conditional request, for
+# deployments where another process may modify these containers during a run.
+BLOB_CACHE_REVALIDATE = os.getenv("BLOB_CACHE_REVALIDATE", "false").lower() in ("1", "true", "yes")
+
+# --- Archive Settings ---
+# How `archive_run_artifacts` keeps a run's artifacts in ARCHIVE_BLOB_CONTAINER:
+# "copy" copies each one into a {run_id}/ folder; "bundle" streams them all into
+# one compressed tar per run attempt, {run_id}/{run_timestamp}.tar.gz.
+ARCHIVE_MODE = os.getenv("ARCHIVE_MODE", "copy")
+# Artifacts copied (or downloaded into the bundle) at once.
+ARCHIVE_CONCURRENCY = 16
+# Attempts at each artifact before it is reported as not archived. A container
+# with any artifact not archived is not cleared at the end of the run.
+ARCHIVE_COPY_ATTEMPTS = 3
+# A bundle is built in memory up to this size, then in a temporary file.
+ARCHIVE_BUNDLE_SPOOL_BYTES = 64 * 1024 * 1024
+# Server-side copies are polled until they complete, for at most the timeout.
+BLOB_COPY_POLL_SECONDS = 0.5
+BLOB_COPY_TIMEOUT_SECONDS = 300
+
+# --- Bulk Delete Settings ---
+# Container cleanup deletes blobs in batches (one Blob Batch request each on
+# Azure, which accepts at most 256 blobs), a bounded number at a time. Blobs
+# that could not be deleted are retried with exponential backoff.
+BULK_DELETE_BATCH_SIZE = 256
+BULK_DELETE_CONCURRENCY = 4
+BULK_DELETE_ATTEMPTS = 3
+BULK_DELETE_RETRY_BACKOFF_SECONDS = 1.0
 
 # --- Application-Level Settings ---
 TOTAL_SECTIONS = 3
 CONCURRENT_SECTIONS = 3
 MAX_SECTION_ITERATIONS = 10
+# Maximum number of processed source blobs downloaded at the same time when the
+# per-run source corpus is loaded.
+SOURCE_DOWNLOAD_CONCURRENCY = 8
+
+# --- Convergence Settings ---
+# Sections that stop improving (a no-op rewrite, an A/B oscillation, or no fall in
+# critical issues for CONVERGENCE_STALL_ITERATIONS validations) are failed early
+# instead of running to MAX_SECTION_ITERATIONS (see orchestration/convergence.py).
+# Set CONVERGENCE_DETECTION=false to run every failing section to the iteration cap.
+CONVERGENCE_DETECTION_ENABLED = os.getenv("CONVERGENCE_DETECTION", "true").lower() in ("1", "true", "yes")
+CONVERGENCE_STALL_ITERATIONS = 3
+# A section that passes on its first validation is normally validated a second
+# time to guard against a lucky pass ("always"). "unless_prechecks_clean" accepts
+# the first pass when the deterministic pre-validator found no issues either.
+SECOND_LOOP_POLICY = os.getenv("SECOND_LOOP_POLICY", "always")
+
+# --- Section Scheduling Settings ---
+# "fifo" starts sections in numeric order; "critical_path" starts the waiting
+# section with the longest estimated duration whenever a slot is free (see
+# orchestration/scheduling.py). Section durations, iterations and LLM usage are
+# kept across runs in SECTION_HISTORY_PATH.
+SECTION_SCHEDULING = os.getenv("SECTION_SCHEDULING", "fifo")
+SECTION_HISTORY_PATH = os.getenv("SECTION_HISTORY_PATH", os.path.join(BASE_DIR, "run-history", "section_costs.json"))
+# Weight of the latest run in each section's moving averages.
+SECTION_HISTORY_SMOOTHING = 0.3
+
+# --- Sub-section Settings ---
+# "whole" writes every section as a single document. "parallel" writes and validates each sub-section declared in get_section_config
+# (section 3 has one per need category) in its own loop, all at once, then
+# assembles them into the section's draft and checks the parts for consistency
+# with one another (see orchestration/subsections.py).
+SUBSECTION_GENERATION = os.getenv("SUBSECTION_GENERATION", "whole")
+# Consistency checks of an assembled section. Sub-sections faulted by a check are
+# corrected in their own loops before the section is assembled and checked again.
+SUBSECTION_CONSISTENCY_ROUNDS = 2
+
+# --- Stage Scheduling Settings ---
+# "phased" waits for every document to be pre-processed before any section
+# starts, as the pipeline always has. "dag" starts each section as soon as the source documents it uses (after its
+# source_exclude_files) are pre-processed, and the merge and Word rendering as
+# soon as the last section passes (see orchestration/stages.py).
+STAGE_SCHEDULING = os.getenv("STAGE_SCHEDULING", "phased")
+
+# --- Run State Settings ---
+# Every run journals its progress (pre-processed documents, and each section's
+# last validated draft, iteration, issue counts and outcome) in
+# RUN_STATE_CONTAINER. A run that stopped part-way is resumed with
+# `python -m src.main --resume <run_id>`.
+RUN_STATE_JOURNAL_ENABLED = os.getenv("RUN_STATE_JOURNAL", "true").lower() in ("1", "true", "yes")
+
+# --- Batch Settings ---
+# `python -m src.main --cases <prefix> ...` runs one case per source prefix in
+# this process, at most CONCURRENT_CASES at a time, each with its own run ID and
+# CONCURRENT_SECTIONS section slots. The LLM gateway, scheduler and agent pool
+# are shared by every case.
+CONCURRENT_CASES = int(os.getenv("CONCURRENT_CASES", "4"))
+
+# --- Source Retrieval Settings ---
+# Controls how much of the source corpus is placed in each section's prompts:
+# "full" always sends every (non-excluded) document; "retrieval" sends only the
+# chunks most relevant to the section, up to SOURCE_TOKEN_BUDGET; "auto" sends the
+# full text when it fits within the budget and falls back to retrieval otherwise.
+SOURCE_RETRIEVAL_MODE = os.getenv("SOURCE_RETRIEVAL_MODE", "auto")
+SOURCE_TOKEN_BUDGET = 60000
+RETRIEVAL_CHUNK_CHARS = 2000
+RETRIEVAL_CHUNK_OVERLAP_CHARS = 200
+
+# --- PDF Pre-processing Settings ---
+# Number of PDFs held in the download -> extract -> upload pipeline at once.
+PDF_PREPROCESS_CONCURRENCY = 4
+# Size of the text-extraction process pool. None uses one worker per CPU core.
+PDF_EXTRACTION_WORKERS = None
+# Documents shorter than this are extracted by a single worker rather than split.
+PDF_MIN_PAGES_PER_TASK = 8
+
+# --- Extraction Cache Settings ---
+# Re-uses previously extracted text for any PDF whose content hash is unchanged.
+EXTRACTION_CACHE_ENABLED = True
+# Bump this to invalidate every cached extraction (e.g. after changing how text
+# is cleaned). Changes to `_clean_text` itself are detected automatically.
+EXTRACTION_CACHE_VERSION = "1"
+# Set EXTRACTION_CACHE_REFRESH=true in the environment to re-extract every PDF
+# for a single run and overwrite its cache entry.
+EXTRACTION_CACHE_REFRESH = os.getenv("EXTRACTION_CACHE_REFRESH", "false").lower() in ("1", "true", "yes")
+
+# --- Agent Team Settings ---
+# "auto" has the GroupChatManager's LLM select every speaker. "state_machine"
+# drives the writer and validator GroupChats through their fixed workflows
+# without an LLM call per round; the manager's LLM is only used as a fallback
+# when a tool call fails.
+SPEAKER_SELECTION_MODE = os.getenv("SPEAKER_SELECTION_MODE", "auto")
+# "groupchat" runs the Planner/Document_Writer/proxy team for every draft.
+# "direct" sends the task to the Document_Writer in a single completion and the
+# orchestrator uploads the result itself. Blob names are the same in both modes.
+WRITER_ENGINE = os.getenv("WRITER_ENGINE", "groupchat")
+# "rewrite" has the writer regenerate the whole section on every correction pass.
+# "patch" asks the Document_Writer for edits to individual **Key:** fields and
+# applies them to the previous draft locally; the pass falls back to a rewrite
+# when the edits cannot be applied (e.g. the revision adds or renames fields).
+CORRECTION_MODE = os.getenv("CORRECTION_MODE", "rewrite")
+# "full" runs the validator team on the whole draft every iteration. "incremental"
+# re-checks only the fields changed since a failed validation with a standalone
+# Fact_Checker and carries the earlier verdicts forward for the unchanged fields.
+VALIDATION_MODE = os.getenv("VALIDATION_MODE", "full")
+# Deterministic structure and formatting checks (see utils/prevalidation.py) run
+# on every draft before the validator team. A draft that fails a critical check
+# receives its feedback report directly, without any LLM call.
+PREVALIDATION_ENABLED = os.getenv("PREVALIDATION", "true").lower() in ("1", "true", "yes")
+# The Quality_Assessor submits its report as a schema-checked tool call. When a
+# team run ends without an accepted report, the Report_Repairer rebuilds it from
+# the team's findings (up to this many attempts) rather than the section being
+# sent through a whole new correction cycle.
+FEEDBACK_REPORT_REPAIR_ATTEMPTS = int(os.getenv("FEEDBACK_REPORT_REPAIR_ATTEMPTS", "2"))
+# Team runs per validation when there are no findings to repair a report from
+# (e.g. the draft could not be downloaded).
+VALIDATOR_TEAM_ATTEMPTS = 2
+# Agent teams and standalone agents are kept after use, reset, and handed to the
+# next section (of any case) that needs the same role, instead of every
+# validation building a new team and its LLM clients (see agents/agent_pool.py).
+AGENT_POOL_ENABLED = os.getenv("AGENT_POOL", "true").lower() in ("1", "true", "yes")
 
 # --- Final Document Blob Name ---
 FINAL_DOCUMENT_FILENAME = "final_document.md"
@@ -66,16 +250,66 @@ azure_model_name = os.getenv("AZURE_OPENAI_MODEL_NAME")
 azure_model_name2 = os.getenv("AZURE_OPENAI_MODEL_NAME2")
 azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION")
 
+# --- LLM Scheduler Settings ---
+# All LLM traffic is admitted through a process-wide scheduler (see llm/scheduler.py)
+# that enforces each deployment's token and request quotas and adapts concurrency
+# when the service returns HTTP 429.
+LLM_SCHEDULER_ENABLED = True
+# When the scheduler is enabled it owns retries, so the OpenAI client is told not
+# to retry 429s itself (its hidden retries would bypass the scheduler's back-off).
+_client_max_retries = {"max_retries": 0} if LLM_SCHEDULER_ENABLED else {}
+
 # --- Build LLM Config Dictionaries ---
-config_list = [{"model": azure_model_name, "api_key": azure_api_key, "base_url": azure_endpoint, "api_type": "azure", "api_version": azure_api_version}]
+config_list = [{"model": azure_model_name, "api_key": azure_api_key, "base_url": azure_endpoint, "api_type": "azure", "api_version": azure_api_version, **_client_max_retries}]
 llm_config = {"config_list": config_list, "timeout": 300, "cache_seed": None}
 
-config_list_fast = [{"model": azure_model_name2, "api_key": azure_api_key, "base_url": azure_endpoint, "api_type": "azure", "api_version": azure_api_version}]
+config_list_fast = [{"model": azure_model_name2, "api_key": azure_api_key, "base_url": azure_endpoint, "api_type": "azure", "api_version": azure_api_version, **_client_max_retries}]
 llm_config_fast = {"config_list": config_list_fast, "timeout": 300, "cache_seed": None}
 
 if not all([azure_api_key, azure_endpoint, azure_model_name, azure_model_name2, azure_api_version]):
     raise ValueError("One or more critical Azure OpenAI environment variables are not set in .env")
 
+# Per-deployment quotas. Set these to the TPM/RPM allocated to each deployment in
+# Azure; max_concurrency is the ceiling for the adaptive concurrency limit.
+LLM_RATE_LIMITS = {
+    azure_model_name: {
+        "tokens_per_minute": int(os.getenv("AZURE_OPENAI_MODEL_TPM", "150000")),
+        "requests_per_minute": int(os.getenv("AZURE_OPENAI_MODEL_RPM", "900")),
+        "max_concurrency": int(os.getenv("AZURE_OPENAI_MODEL_MAX_CONCURRENCY", "8")),
+    },
+    azure_model_name2: {
+        "tokens_per_minute": int(os.getenv("AZURE_OPENAI_MODEL2_TPM", "150000")),
+        "requests_per_minute": int(os.getenv("AZURE_OPENAI_MODEL2_RPM", "900")),
+        "max_concurrency": int(os.getenv("AZURE_OPENAI_MODEL2_MAX_CONCURRENCY", "8")),
+    },
+}
+# Used for any deployment not listed above.
+LLM_DEFAULT_RATE_LIMIT = {"tokens_per_minute": 60000, "requests_per_minute": 360, "max_concurrency": 4}
+# Attempts per LLM request (the first try plus retries after HTTP 429).
+LLM_MAX_ATTEMPTS = 6
+# Expected completion size used to reserve tokens when a request sets no max_tokens.
+LLM_COMPLETION_TOKEN_ESTIMATE = 2000
+# Records tokens, latency and cost for every LLM call to JSON-lines and Prometheus
+# textfiles in LOGS_DIR (see llm/telemetry.py).
+LLM_TELEMETRY_ENABLED = True
+# Position of each middleware in the LLM gateway chain (lower runs further out).
+# Telemetry is outermost so its latency includes time queued in the scheduler;
+# replayed completions are answered before they reach the scheduler.
+LLM_MIDDLEWARE_ORDER = {"telemetry": 10, "replay": 30, "scheduler": 50}
+# --- LLM Record/Replay Settings ---
+# "off" sends every request to the model. "record" also saves each request/response
+# pair to LLM_CACHE_PATH; "replay" answers every request from that file without
+# contacting the model (see llm/replay.py). Replay matching is "strict" (identical
+# normalised request) or "fuzzy" (ignores timestamps and ids, then accepts the
+# closest recorded request with at least LLM_CACHE_FUZZY_THRESHOLD word overlap).
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off")
+LLM_CACHE_MATCHING = os.getenv("LLM_CACHE_MATCHING", "strict")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(BASE_DIR, "llm-cache", "completions.sqlite3"))
+LLM_CACHE_FUZZY_THRESHOLD = 0.9
+# Agent replies run in the event loop's default thread pool, and calls waiting in
+# the scheduler hold a thread while they wait, so the pool is sized generously.
+LLM_EXECUTOR_THREADS = 64
+
 # ==============================================================================
 # 4. DYNAMIC SECTION CONFIGURATION
 # ==============================================================================
@@ -93,9 +327,19 @@ def get_section_config(section_number: str) -> dict:
     """
     Returns a dictionary of all necessary configuration (blob names and local
     guidance file paths) for a specific section number.
+
+    A sub-section number such as "3.2" (the second entry of section 3's
+    "subsections") returns its section's configuration, with the sub-section's
+    "heading" in place of the list of sub-sections.
     """
-    section_str = str(section_number)
-    
+    section_str, _, subsection = str(section_number).partition(".")
+    if subsection:
+        section_config = get_section_config(section_str)
+        headings = section_config.pop("subsections", [])
+        if not subsection.isdigit() or not 1 <= int(subsection) <= len(headings):
+            return {}
+        return {**section_config, "heading": headings[int(subsection) - 1]}
+
     writer_guidance_s = os.path.join(INSTRUCTIONS_DIR, f"writer_guidance_s{section_str}.md")
     validation_guidance_s = os.path.join(INSTRUCTIONS_DIR, f"validation_guidance_s{section_str}.md")
 
@@ -103,17 +347,22 @@ def get_section_config(section_number: str) -> dict:
         "1": {
             "writer_guidance": [writer_guidance_s, WRITER_COMMON_RULES, STRUCTURE_S1],
             "validation_guidance": [validation_guidance_s, VALIDATOR_COMMON_RULES, VALIDATOR_COMMON_FEEDBACK_FORMAT, STRUCTURE_S1],
+            "structure": STRUCTURE_S1,
             "source_exclude_files": []
         },
         "2": {
             "writer_guidance": [writer_guidance_s, WRITER_COMMON_RULES, STRUCTURE_S2],
             "validation_guidance": [validation_guidance_s, VALIDATOR_COMMON_RULES, VALIDATOR_COMMON_FEEDBACK_FORMAT, STRUCTURE_S2],
+            "structure": STRUCTURE_S2,
             "source_exclude_files": []
         },
         "3": {
             "writer_guidance": [writer_guidance_s, WRITER_COMMON_RULES, NEED_CATEGORISATION_GUIDE, STRUCTURE_S3],
             "validation_guidance": [validation_guidance_s, VALIDATOR_COMMON_RULES, VALIDATOR_COMMON_FEEDBACK_FORMAT, NEED_CATEGORISATION_GUIDE, STRUCTURE_S3],
-            "source_exclude_files": ['Appendix A.pdf']
+            "structure": STRUCTURE_S3,
+            "source_exclude_files": ['Appendix A.pdf'],
+            # One sub-section per need category, in the order of the structure's headings.
+            "subsections": ["Communication & Interaction", "Cognition & Learning", "SEMH", "Sensory & Physical", "Health Care", "Social Care"],
         },
     }
 
@@ -0,0 +1,124 @@
+"""
+gateway.py
+
+This module is the single interception point for all LLM traffic in the
+application.
+
+Every agent in the pipeline (the writer and validator team members, their
+GroupChatManagers, the temporary agents AutoGen creates for speaker selection,
+and the Prompt_Writer) ultimately calls `autogen.OpenAIWrapper.create`. The
+gateway replaces that method with one that passes each call through an ordered
+chain of middleware before it reaches the real client. This allows
+cross-cutting concerns such as rate limiting to be applied process-wide
+without changing how the agents are built.
+
+A middleware is a callable `(call: LLMCall, call_next) -> response`. It may
+inspect or modify `call`, decide whether to invoke `call_next()` (which runs the
+rest of the chain and finally the real request), and must return an
+AutoGen-compatible response. Middleware with a lower `order` runs further out.
+
+`install()` must be called once at start-up, before any LLM request is made.
+"""
+
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+from autogen import OpenAIWrapper
+from autogen.oai.client import OpenAIClient
+
+
+@dataclass
+class LLMCall:
+    """Describes a single LLM request as it passes through the middleware chain."""
+    wrapper: OpenAIWrapper
+    params: Dict[str, Any]
+    agent_name: str
+    deployment: str
+    # Free-form values that middleware can share with each other for this call.
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+Middleware = Callable[[LLMCall, Callable[[], Any]], Any]
+
+_middlewares: List[Tuple[int, str, Middleware]] = []
+_middlewares_lock = threading.Lock()
+_original_create = None
+
+
+def _deployment_of(wrapper: OpenAIWrapper, params: Dict[str, Any]) -> str:
+    """Returns the model deployment a call is addressed to."""
+    if params.get("model"):
+        return params["model"]
+    config_list = getattr(wrapper, "_config_list", None) or [{}]
+    return config_list[0].get("model", "unknown")
+
+
+def register_middleware(name: str, middleware: Middleware, order: int):
+    """Adds (or replaces) a named middleware. Lower `order` values run further out."""
+    with _middlewares_lock:
+        _middlewares[:] = [entry for entry in _middlewares if entry[1] != name]
+        _middlewares.append((order, name, middleware))
+        _middlewares.sort(key=lambda entry: entry[0])
+    logging.info(f"LLM gateway middleware registered: '{name}' (order {order}).")
+
+
+def unregister_middleware(name: str):
+    """Removes a named middleware if it is registered."""
+    with _middlewares_lock:
+        _middlewares[:] = [entry for entry in _middlewares if entry[1] != name]
+
+
+def complete_response(call: LLMCall, response: Any, cost: float = 0.0) -> Any:
+    """
+    Prepares a response that a middleware produced without calling the real
+    client, by attaching the fields `OpenAIWrapper.create` normally adds and
+    recording its usage on the calling wrapper.
+    """
+    response.cost = cost
+    response.config_id = 0
+    response.pass_filter = True
+    response.message_retrieval_function = lambda completion: OpenAIClient.message_retrieval(None, completion)
+    usage = OpenAIClient.get_usage(response)
+    call.wrapper._update_usage(actual_usage=usage, total_usage=usage)
+    return response
+
+
+def _gateway_create(self: OpenAIWrapper, **params: Any):
+    """Replacement for `OpenAIWrapper.create` that runs the middleware chain."""
+    agent = params.get("agent")
+    call = LLMCall(
+        wrapper=self,
+        params=params,
+        agent_name=getattr(agent, "name", None) or "unknown",
+        deployment=_deployment_of(self, params),
+    )
+    with _middlewares_lock:
+        chain = [middleware for _, _, middleware in _middlewares]
+
+    def _invoke(index: int):
+        if index == len(chain):
+            return _original_create(call.wrapper, **call.params)
+        return chain[index](call, lambda: _invoke(index + 1))
+
+    return _invoke(0)
+
+
+def install():
+    """Routes every `OpenAIWrapper.create` call through the gateway. Safe to call more than once."""
+    global _original_create
+    if _original_create is not None:
+        return
+    _original_create = OpenAIWrapper.create
+    OpenAIWrapper.create = _gateway_create
+    logging.info("LLM gateway installed.")
+
+
+def uninstall():
+    """Restores the original `OpenAIWrapper.create`."""
+    global _original_create
+    if _original_create is None:
+        return
+    OpenAIWrapper.create = _original_create
+    _original_create = None
@@ -0,0 +1,256 @@
+"""
+replay.py
+
+This module implements a record/replay cache for LLM completions, so that
+development runs, benchmarks and regression checks can be repeated without
+paying for (or waiting on) the model.
+
+`LLMReplayCache` is installed as a middleware in the LLM gateway, inside the
+telemetry middleware and outside the scheduler. It works in one of two modes:
+- "record": every request is sent to the model as usual, and each successful
+  request/response pair is saved to a local SQLite database.
+- "replay": requests are answered from the database at memory speed and never
+  reach the scheduler or the model. A request with no recorded answer raises
+  `LLMReplayMiss`.
+
+Requests are keyed by a hash of the model deployment, the tool definitions and
+the normalised messages. Normalisation keeps each message's role, name, content
+and tool calls, and drops the tool-call ids the model generates afresh for
+every reply. In "strict" matching a request must have exactly this key. In
+"fuzzy" matching, ISO timestamps, run ids, UUIDs, long hex ids and whitespace
+are also masked. If that still finds nothing, the recorded request from the
+same agent, with the same number of messages, and with the highest word
+overlap is used, provided the overlap reaches `LLM_CACHE_FUZZY_THRESHOLD`.
+Fuzzy matching lets a transcript recorded in production be replayed after small
+prompt or instruction changes.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Callable, Dict
+
+from openai.types.chat import ChatCompletion
+
+from .. import config
+from .gateway import LLMCall, complete_response, register_middleware
+
+# Attributes that `OpenAIWrapper.create` attaches to responses; they are not part
+# of the completion itself and are re-attached on replay.
+_WRAPPER_ATTRIBUTES = {"cost", "config_id", "pass_filter", "message_retrieval_function"}
+
+_VOLATILE_PATTERNS = [
+    re.compile(r"\d{4}-\d{2}-\d{2}[T _]\d{2}[:-]\d{2}[:-]\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?(?:_[0-9a-f]{4})?"),
+    re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE),
+    re.compile(r"\bcall_[A-Za-z0-9]+\b"),
+    re.compile(r"\b[0-9a-f]{16,}\b", re.IGNORECASE),
+]
+_WORD_PATTERN = re.compile(r"\w+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    request_key TEXT PRIMARY KEY,
+    fuzzy_key TEXT NOT NULL,
+    deployment TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    message_count INTEGER NOT NULL,
+    request_json TEXT NOT NULL,
+    response_json TEXT NOT NULL,
+    cost REAL NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS completions_fuzzy_key ON completions (fuzzy_key);
+CREATE INDEX IF NOT EXISTS completions_candidates ON completions (deployment, agent, message_count);
+"""
+
+
+class LLMReplayMiss(LookupError):
+    """Raised in replay mode when no recorded completion matches a request."""
+
+
+def _normalise_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    normalised = {"role": message.get("role"), "content": message.get("content")}
+    if message.get("name"):
+        normalised["name"] = message["name"]
+    tool_calls = message.get("tool_calls") or []
+    if tool_calls:
+        normalised["tool_calls"] = [
+            {"name": tool_call.get("function", {}).get("name"), "arguments": tool_call.get("function", {}).get("arguments")}
+            for tool_call in tool_calls
+        ]
+    if message.get("function_call"):
+        normalised["function_call"] = message["function_call"]
+    return normalised
+
+
+def normalise_request(deployment: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the parts of a request that determine its completion, without per-reply ids."""
+    return {
+        "deployment": deployment,
+        "messages": [_normalise_message(message) for message in params.get("messages") or []],
+        "tools": params.get("tools") or params.get("functions") or [],
+        "tool_choice": params.get("tool_choice"),
+    }
+
+
+def _fuzzy_text(request_json: str) -> str:
+    text = request_json
+    for pattern in _VOLATILE_PATTERNS:
+        text = pattern.sub("#", text)
+    return " ".join(text.split())
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _word_overlap(first: set, second: set) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+class LLMReplayCache:
+    """Gateway middleware that records completions to SQLite, or replays them from it."""
+
+    def __init__(self, path: str, mode: str, matching: str = "strict", fuzzy_threshold: float = 0.9):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown LLM cache mode '{mode}'. Expected 'off', 'record' or 'replay'.")
+        if matching not in ("strict", "fuzzy"):
+            raise ValueError(f"Unknown LLM cache matching '{matching}'. Expected 'strict' or 'fuzzy'.")
+        self.path = path
+        self.mode = mode
+        self.matching = matching
+        self.fuzzy_threshold = fuzzy_threshold
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Calls arrive from AutoGen's worker threads; one connection is shared under a lock.
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def __call__(self, call: LLMCall, call_next: Callable[[], Any]):
+        request_json = json.dumps(normalise_request(call.deployment, call.params), sort_keys=True, default=str)
+        request_key = _hash(request_json)
+        fuzzy_text = _fuzzy_text(request_json)
+
+        if self.mode == "replay":
+            return self._replay(call, request_key, fuzzy_text)
+
+        response = call_next()
+        self._record(call, request_key, fuzzy_text, request_json, response)
+        return response
+
+    # --- Replay ---
+
+    def _replay(self, call: LLMCall, request_key: str, fuzzy_text: str):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response_json, cost FROM completions WHERE request_key = ?", (request_key,)
+            ).fetchone()
+            fuzzy = False
+            if row is None and self.matching == "fuzzy":
+                fuzzy = True
+                row = self._connection.execute(
+                    "SELECT response_json, cost FROM completions WHERE fuzzy_key = ? ORDER BY recorded_at DESC LIMIT 1",
+                    (_hash(fuzzy_text),),
+                ).fetchone() or self._closest_match(call, fuzzy_text)
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.fuzzy_hits += fuzzy
+
+        if row is None:
+            raise LLMReplayMiss(
+                f"No recorded completion for agent '{call.agent_name}' on '{call.deployment}' in {self.path} "
+                f"({self.matching} matching)."
+            )
+        response_json, cost = row
+        call.metadata["replayed"] = True
+        return complete_response(call, ChatCompletion.model_validate_json(response_json), cost)
+
+    def _closest_match(self, call: LLMCall, fuzzy_text: str):
+        """Returns the recorded row whose request has the highest word overlap, if it is close enough."""
+        message_count = len(call.params.get("messages") or [])
+        candidates = self._connection.execute(
+            "SELECT request_json, response_json, cost FROM completions "
+            "WHERE deployment = ? AND agent = ? AND message_count = ? ORDER BY recorded_at DESC",
+            (call.deployment, call.agent_name, message_count),
+        ).fetchall()
+        words = set(_WORD_PATTERN.findall(fuzzy_text))
+        best_row, best_overlap = None, self.fuzzy_threshold
+        for request_json, response_json, cost in candidates:
+            overlap = _word_overlap(words, set(_WORD_PATTERN.findall(_fuzzy_text(request_json))))
+            if overlap >= best_overlap:
+                best_row, best_overlap = (response_json, cost), overlap
+                if overlap == 1.0:
+                    break
+        return best_row
+
+    # --- Record ---
+
+    def _record(self, call: LLMCall, request_key: str, fuzzy_text: str, request_json: str, response: Any):
+        if not isinstance(response, ChatCompletion):
+            return
+        response_json = response.model_dump_json(exclude=_WRAPPER_ATTRIBUTES)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    request_key, _hash(fuzzy_text), call.deployment, call.agent_name,
+                    len(call.params.get("messages") or []), request_json, response_json,
+                    getattr(response, "cost", 0.0) or 0.0, time.time(),
+                ),
+            )
+            self._connection.commit()
+            self.recorded += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "matching": self.matching,
+                "hits": self.hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+            }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_replay_cache: LLMReplayCache | None = None
+
+
+def get_replay_cache() -> LLMReplayCache | None:
+    """Returns the run's record/replay cache, or None if it has not been installed."""
+    return _replay_cache
+
+
+def install_replay_cache() -> LLMReplayCache | None:
+    """Creates the record/replay cache for `LLM_CACHE_MODE` and registers it with the LLM gateway."""
+    global _replay_cache
+    if _replay_cache is None and config.LLM_CACHE_MODE != "off":
+        _replay_cache = LLMReplayCache(
+            path=config.LLM_CACHE_PATH,
+            mode=config.LLM_CACHE_MODE,
+            matching=config.LLM_CACHE_MATCHING,
+            fuzzy_threshold=config.LLM_CACHE_FUZZY_THRESHOLD,
+        )
+        register_middleware("replay", _replay_cache, order=config.LLM_MIDDLEWARE_ORDER["replay"])
+        logging.info(f"LLM {config.LLM_CACHE_MODE} cache opened at {config.LLM_CACHE_PATH} ({config.LLM_CACHE_MATCHING} matching).")
+    return _replay_cache
@@ -0,0 +1,248 @@
+"""
+scheduler.py
+
+This module implements the process-wide LLM scheduler. It is installed as a
+middleware in the LLM gateway, so every completion made by any agent is
+admitted through it.
+
+For each model deployment (`azure_model_name`, `azure_model_name2`) the
+scheduler keeps:
+- a token bucket, refilled continuously up to the deployment's
+  tokens-per-minute quota;
+- a request bucket, refilled up to its requests-per-minute quota;
+- an adaptive concurrency limit managed with AIMD (additive increase,
+  multiplicative decrease). Each successful call raises the limit slightly;
+  each HTTP 429 halves it and pauses the deployment for the server's
+  `retry-after` period.
+
+Requests are admitted in FIFO order. The token cost of a request is estimated
+before it is sent and reconciled with the real usage reported in the
+response. Queue depth, wait times and throttling counts are available from
+`LLMScheduler.metrics()`.
+
+Calls reach the gateway from the worker threads AutoGen uses for agent
+replies, so the scheduler blocks with `threading` primitives and never on
+the event loop.
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict
+
+from .. import config
+from .gateway import LLMCall, register_middleware
+
+# Rough characters-per-token ratio used to estimate the size of a prompt before
+# it is sent. The estimate is corrected from the response's reported usage.
+_CHARS_PER_TOKEN = 4
+
+
+class DeploymentBudget:
+    """Token, request and concurrency budget for a single model deployment."""
+
+    def __init__(self, deployment: str, tokens_per_minute: int, requests_per_minute: int, max_concurrency: int):
+        self.deployment = deployment
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+
+        self._condition = threading.Condition()
+        self._tokens = float(tokens_per_minute)
+        self._requests = float(requests_per_minute)
+        self._last_refill = time.monotonic()
+        self._concurrency_limit = float(max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._queue = deque()
+        self._next_ticket = 0
+
+        self.completed_requests = 0
+        self.throttled_responses = 0
+        self.tokens_used = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.max_queue_depth = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60.0)
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60.0)
+
+    def _seconds_until_admissible(self, estimated_tokens: int, now: float) -> float:
+        """Returns 0 if the request can start now, otherwise how long to wait before re-checking."""
+        waits = [self._paused_until - now]
+        if self._in_flight >= max(int(self._concurrency_limit), 1):
+            # Woken by `release`; the timeout is only a safety net.
+            waits.append(1.0)
+        # A request larger than the whole bucket is admitted once the bucket is full.
+        needed_tokens = min(estimated_tokens, self.tokens_per_minute)
+        if self._tokens < needed_tokens:
+            waits.append((needed_tokens - self._tokens) * 60.0 / self.tokens_per_minute)
+        if self._requests < 1:
+            waits.append((1 - self._requests) * 60.0 / self.requests_per_minute)
+        return max(waits)
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """Blocks until the request may be sent, then reserves its budget. Returns the wait in seconds."""
+        start = time.monotonic()
+        with self._condition:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._queue.append(ticket)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = 0.0 if self._queue[0] == ticket else 1.0
+                    if wait == 0.0:
+                        wait = self._seconds_until_admissible(estimated_tokens, now)
+                    if wait <= 0:
+                        break
+                    self._condition.wait(timeout=min(wait, 5.0))
+                self._tokens -= estimated_tokens
+                self._requests -= 1
+                self._in_flight += 1
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+
+            waited = time.monotonic() - start
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return waited
+
+    def release(self, estimated_tokens: int, actual_tokens: int | None, throttled: bool, retry_after: float = 0.0):
+        """Returns a concurrency slot, reconciles the token estimate and applies AIMD."""
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self.throttled_responses += 1
+                self._concurrency_limit = max(1.0, self._concurrency_limit / 2)
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                # The service has told us we are over quota, so our bucket is optimistic.
+                self._tokens = min(self._tokens, 0.0)
+            else:
+                self.completed_requests += 1
+                self._concurrency_limit = min(float(self.max_concurrency), self._concurrency_limit + 1.0 / self._concurrency_limit)
+                if actual_tokens is not None:
+                    self.tokens_used += actual_tokens
+                    self._tokens -= actual_tokens - estimated_tokens
+            self._condition.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "deployment": self.deployment,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": self._in_flight,
+                "concurrency_limit": round(self._concurrency_limit, 2),
+                "completed_requests": self.completed_requests,
+                "throttled_responses": self.throttled_responses,
+                "tokens_used": self.tokens_used,
+                "total_wait_seconds": round(self.total_wait_seconds, 3),
+                "mean_wait_seconds": round(self.total_wait_seconds / max(self._next_ticket, 1), 3),
+                "max_wait_seconds": round(self.max_wait_seconds, 3),
+            }
+
+
+class LLMScheduler:
+    """Holds one `DeploymentBudget` per deployment and admits calls through them."""
+
+    def __init__(self, rate_limits: Dict[str, Dict[str, int]], max_attempts: int):
+        self.rate_limits = rate_limits
+        self.max_attempts = max_attempts
+        self._budgets: Dict[str, DeploymentBudget] = {}
+        self._lock = threading.Lock()
+
+    def budget_for(self, deployment: str) -> DeploymentBudget:
+        with self._lock:
+            if deployment not in self._budgets:
+                limits = self.rate_limits.get(deployment, config.LLM_DEFAULT_RATE_LIMIT)
+                self._budgets[deployment] = DeploymentBudget(deployment, **limits)
+            return self._budgets[deployment]
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            budgets = list(self._budgets.values())
+        return {budget.deployment: budget.metrics() for budget in budgets}
+
+    def __call__(self, call: LLMCall, call_next: Callable[[], Any]):
+        """Gateway middleware: admits the call, retries on 429 and feeds the AIMD controller."""
+        budget = self.budget_for(call.deployment)
+        estimated_tokens = estimate_request_tokens(call.params)
+
+        for attempt in range(1, self.max_attempts + 1):
+            call.metadata["scheduler_wait_seconds"] = call.metadata.get("scheduler_wait_seconds", 0.0) + budget.acquire(estimated_tokens)
+            try:
+                response = call_next()
+            except Exception as e:
+                if not _is_rate_limit_error(e):
+                    budget.release(estimated_tokens, None, throttled=False)
+                    raise
+                retry_after = _retry_after_seconds(e, attempt)
+                budget.release(estimated_tokens, None, throttled=True, retry_after=retry_after)
+                call.metadata["retries"] = attempt
+                if attempt == self.max_attempts:
+                    logging.error(f"LLM request to '{call.deployment}' was still rate limited after {attempt} attempts.")
+                    raise
+                logging.warning(f"LLM request to '{call.deployment}' rate limited (attempt {attempt}). Retrying in {retry_after:.1f}s.")
+                # The pause is applied to the whole deployment, so `acquire` performs the wait.
+                continue
+            budget.release(estimated_tokens, _response_total_tokens(response), throttled=False)
+            return response
+
+
+def estimate_request_tokens(params: Dict[str, Any]) -> int:
+    """Estimates prompt plus completion tokens for a request before it is sent."""
+    messages = params.get("messages") or []
+    prompt_chars = sum(len(json.dumps(message, default=str)) for message in messages)
+    completion_tokens = params.get("max_tokens") or config.LLM_COMPLETION_TOKEN_ESTIMATE
+    return prompt_chars // _CHARS_PER_TOKEN + completion_tokens
+
+
+def _response_total_tokens(response: Any) -> int | None:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    return (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def _retry_after_seconds(error: Exception, attempt: int) -> float:
+    """Reads the server's retry-after hint, falling back to exponential backoff."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return min(2.0 ** attempt, 60.0)
+
+
+_scheduler: LLMScheduler | None = None
+
+
+def get_scheduler() -> LLMScheduler | None:
+    """Returns the process-wide scheduler, or None if it has not been installed."""
+    return _scheduler
+
+
+def install_scheduler() -> LLMScheduler:
+    """Creates the process-wide scheduler and registers it with the LLM gateway."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler(config.LLM_RATE_LIMITS, config.LLM_MAX_ATTEMPTS)
+        register_middleware("scheduler", _scheduler, order=config.LLM_MIDDLEWARE_ORDER["scheduler"])
+    return _scheduler
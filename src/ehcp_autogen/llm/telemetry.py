@@ -0,0 +1,201 @@
+"""
+telemetry.py
+
+This module records one metrics record for every LLM completion made during a
+run. It is installed as the outermost middleware in the LLM gateway, so it
+sees every call from every agent: the writer and validator team members, their
+GroupChatManagers and the Prompt_Writer.
+
+Each record contains the agent, model deployment, prompt, completion and
+cached tokens, cost, total latency, time spent queued in the scheduler,
+retries, outcome and whether the completion was replayed from the record/replay
+cache. It is tagged with the run (case) set by `run_case_async`, and with the
+section, iteration and stage set by `process_section`, through `set_call_tags`.
+
+The tags are held in a `contextvars.ContextVar`, which is local to each
+section's asyncio task. AutoGen makes its completions in the event loop's
+default executor, which does not carry the caller's context into the worker
+thread. `ContextPropagatingExecutor` is therefore installed as that executor,
+so the tags set by the section's task are visible when the call reaches the
+gateway.
+
+Records are appended to `llm_metrics_{run_timestamp}.jsonl` as they complete.
+At the end of the run, aggregated counters are written to
+`llm_metrics_{run_timestamp}.prom` in the Prometheus textfile format. Both
+files are in `LOGS_DIR`, so `archive_run_artifacts` bundles them with the run
+logs.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict
+
+from .. import config
+from .gateway import LLMCall, register_middleware
+
+_call_tags: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("llm_call_tags", default={})
+
+
+def set_call_tags(**tags: Any):
+    """
+    Adds or replaces tags (e.g. section, iteration, stage) for every LLM call made
+    from the current asyncio task from now on.
+    """
+    _call_tags.set({**_call_tags.get(), **tags})
+
+
+def get_call_tags() -> Dict[str, Any]:
+    return dict(_call_tags.get())
+
+
+class ContextPropagatingExecutor(ThreadPoolExecutor):
+    """A thread pool that runs each submitted function in a copy of the submitter's context."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+def _usage_of(response: Any) -> Dict[str, int]:
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+    }
+
+
+class LLMTelemetry:
+    """Gateway middleware that records every call and keeps run-level aggregates."""
+
+    # Label and counter names of the Prometheus series written at the end of the run.
+    _LABELS = ("agent", "section", "deployment", "status")
+    _COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "cached_tokens", "latency_seconds", "scheduler_wait_seconds", "retries", "cost")
+
+    def __init__(self, jsonl_path: str, prometheus_path: str):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._totals: Dict[tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        # (run, section) -> totals. Kept apart from the Prometheus series, which are not labelled by run.
+        self._run_section_totals: Dict[tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def __call__(self, call: LLMCall, call_next: Callable[[], Any]):
+        tags = get_call_tags()
+        start = time.monotonic()
+        response = None
+        error = None
+        try:
+            response = call_next()
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._record(call, tags, response, error, time.monotonic() - start)
+
+    def _record(self, call: LLMCall, tags: Dict[str, Any], response: Any, error: Exception | None, latency: float):
+        usage = _usage_of(response)
+        scheduler_wait = call.metadata.get("scheduler_wait_seconds", 0.0)
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "agent": call.agent_name,
+            "deployment": call.deployment,
+            "run": tags.get("run"),
+            "section": tags.get("section"),
+            "iteration": tags.get("iteration"),
+            "stage": tags.get("stage"),
+            **usage,
+            "latency_seconds": round(latency, 3),
+            "scheduler_wait_seconds": round(scheduler_wait, 3),
+            # Requests are not streamed, so the first token arrives with the whole
+            # response: this is the service time of the attempt that succeeded
+            # (total latency less time queued in the scheduler).
+            "time_to_first_token_seconds": round(max(latency - scheduler_wait, 0.0), 3) if error is None else None,
+            "retries": call.metadata.get("retries", 0),
+            "replayed": call.metadata.get("replayed", False),
+            "cost": getattr(response, "cost", None),
+            "status": "ok" if error is None else "error",
+            "error": type(error).__name__ if error is not None else None,
+        }
+        line = json.dumps(record)
+
+        key = (record["agent"], str(record["section"]), record["deployment"], record["status"])
+        with self._lock:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            for totals in (self._totals[key], self._run_section_totals[(record["run"], str(record["section"]))]):
+                totals["requests"] += 1
+                for counter in ("prompt_tokens", "completion_tokens", "cached_tokens", "latency_seconds", "scheduler_wait_seconds", "retries"):
+                    totals[counter] += record[counter]
+                totals["cost"] += record["cost"] or 0.0
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Returns totals per agent, for the run summary."""
+        by_agent: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        with self._lock:
+            for (agent, _, _, _), totals in self._totals.items():
+                for counter, value in totals.items():
+                    by_agent[agent][counter] += value
+        return {agent: dict(totals) for agent, totals in sorted(by_agent.items())}
+
+    def section_summary(self, run_id: str = None) -> Dict[str, Dict[str, float]]:
+        """Returns totals per section, for the section cost history, of one run's calls or of every call."""
+        by_section: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        with self._lock:
+            for (run, section), totals in self._run_section_totals.items():
+                if run_id is not None and run != run_id:
+                    continue
+                for counter, value in totals.items():
+                    by_section[section][counter] += value
+        return {section: dict(totals) for section, totals in sorted(by_section.items())}
+
+    def write_prometheus_textfile(self):
+        """Writes the aggregated counters in the Prometheus textfile exposition format."""
+        with self._lock:
+            items = sorted(self._totals.items())
+        lines = []
+        for counter in self._COUNTERS:
+            metric = f"ehcp_llm_{counter}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for key, totals in items:
+                labels = ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(self._LABELS, key))
+                lines.append(f"{metric}{{{labels}}} {totals.get(counter, 0.0):g}")
+        temp_path = f"{self.prometheus_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        # Textfile collectors may read at any time, so the file is replaced atomically.
+        os.replace(temp_path, self.prometheus_path)
+        logging.info(f"LLM telemetry written to {self.prometheus_path}")
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+_telemetry: LLMTelemetry | None = None
+
+
+def get_telemetry() -> LLMTelemetry | None:
+    """Returns the run's telemetry middleware, or None if it has not been installed."""
+    return _telemetry
+
+
+def install_telemetry(run_timestamp: str) -> LLMTelemetry:
+    """Creates the run's telemetry middleware and registers it with the LLM gateway."""
+    global _telemetry
+    if _telemetry is None:
+        _telemetry = LLMTelemetry(
+            jsonl_path=os.path.join(config.LOGS_DIR, f"llm_metrics_{run_timestamp}.jsonl"),
+            prometheus_path=os.path.join(config.LOGS_DIR, f"llm_metrics_{run_timestamp}.prom"),
+        )
+        register_middleware("telemetry", _telemetry, order=config.LLM_MIDDLEWARE_ORDER["telemetry"])
+    return _telemetry
@@ -14,12 +14,39 @@ The primary function, `setup_logging`, establishes a dual-logging system:
     only the major milestones of the application's workflow, which is useful
     for getting a quick overview of a run's progress.
 
+Every line logged on behalf of a run is prefixed with its run ID
+(`RunIdFilter`), so the logs of cases run side by side in one process can
+be told apart. `add_run_log_handlers` also writes each run's own lines to a
+full log and a loop trace of its own, which are archived with the run.
 """
 
 import os
 import sys
 import logging
+from typing import List, Tuple
 from . import config 
+from .utils.run_scope import get_run_scope
+
+
+class RunIdFilter(logging.Filter):
+    """Adds `run_tag`, "[<run_id>] " or "" outside any run, to every record a handler emits."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        run_scope = get_run_scope()
+        record.run_tag = f"[{run_scope.run_id}] " if run_scope else ""
+        return True
+
+
+class RunOnlyFilter(logging.Filter):
+    """Passes only the records logged on behalf of one run."""
+
+    def __init__(self, run_id: str):
+        super().__init__()
+        self.run_id = run_id
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        run_scope = get_run_scope()
+        return run_scope is not None and run_scope.run_id == self.run_id
 
 
 def setup_logging(run_timestamp: str) -> tuple[str, str]:
@@ -27,18 +54,21 @@ def setup_logging(run_timestamp: str) -> tuple[str, str]:
     root_logger = logging.getLogger()
     root_logger.handlers.clear()
     root_logger.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(run_tag)s%(message)s')
+    run_id_filter = RunIdFilter()
 
     # File Handler for the full run log
     full_log_filename = f"full_run_{run_timestamp}.log"
     full_log_path = os.path.join(config.LOGS_DIR, full_log_filename)
     file_handler = logging.FileHandler(full_log_path, mode='w', encoding='utf-8')
     file_handler.setFormatter(formatter)
+    file_handler.addFilter(run_id_filter)
     root_logger.addHandler(file_handler)
 
     # Stream Handler for console output
     stream_handler = logging.StreamHandler(sys.stdout)
     stream_handler.setFormatter(formatter)
+    stream_handler.addFilter(run_id_filter)
     root_logger.addHandler(stream_handler)
     
     # Separate logger for the high-level trace
@@ -50,9 +80,38 @@ def setup_logging(run_timestamp: str) -> tuple[str, str]:
     
     loop_file_handler = logging.FileHandler(loop_log_path, mode='w', encoding='utf-8')
     loop_file_handler.setFormatter(formatter)
+    loop_file_handler.addFilter(run_id_filter)
     loop_logger.addHandler(loop_file_handler)
     loop_logger.propagate = False
     
     logging.info(f"Logging initialised. Full log: {full_log_filename}, Loop trace: {loop_log_filename}")
 
-    return full_log_path, loop_log_path
\ No newline at end of file
+    return full_log_path, loop_log_path
+
+
+def add_run_log_handlers(run_id: str, run_timestamp: str) -> List[Tuple[logging.Logger, logging.Handler]]:
+    """
+    Adds a full log and a loop trace that receive only one run's lines,
+    `full_run_{run_timestamp}_{run_id}.log` and `loop_trace_{run_timestamp}_{run_id}.log`.
+    Returns the handlers, to be passed to `remove_run_log_handlers` when the run ends.
+    """
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    run_only_filter = RunOnlyFilter(run_id)
+    handlers = []
+    for logger, log_filename in (
+        (logging.getLogger(), f"full_run_{run_timestamp}_{run_id}.log"),
+        (logging.getLogger('LoopTracer'), f"loop_trace_{run_timestamp}_{run_id}.log"),
+    ):
+        handler = logging.FileHandler(os.path.join(config.LOGS_DIR, log_filename), mode='w', encoding='utf-8')
+        handler.setFormatter(formatter)
+        handler.addFilter(run_only_filter)
+        logger.addHandler(handler)
+        handlers.append((logger, handler))
+    return handlers
+
+
+def remove_run_log_handlers(handlers: List[Tuple[logging.Logger, logging.Handler]]):
+    """Detaches and closes a run's own log handlers."""
+    for logger, handler in handlers:
+        logger.removeHandler(handler)
+        handler.close()
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+convergence.py
+
+This module decides when a section's Write-Validate-Refine loop has stopped
+making progress, so that `process_section` can give up early instead of
+spending every remaining iteration on a section that will not pass.
+
+A `ConvergenceTracker` is kept for each section. After every validation it
+records the draft's content hash, the critical and standard issue counts and
+a fingerprint of each issue in the feedback report. The loop is stopped when:
+- the correction returned the same draft as the one before it (a no-op rewrite);
+- the draft, or the set of issues reported, has returned to what it was two
+  iterations earlier while the critical count has not fallen (an A/B
+  oscillation);
+- the critical count has not reached a new low for
+  `CONVERGENCE_STALL_ITERATIONS` consecutive validations.
+
+Each tracker also records how many iterations its section used and how it
+ended. `iteration_histogram` summarises these for the run summary. The
+trackers are kept per run (`reset_convergence_trackers` starts a run's set),
+so concurrent cases with the same section numbers do not share them.
+"""
+
+import re
+import hashlib
+import contextvars
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List
+
+from .. import config
+from ..utils.utils import parse_feedback_issues, _sanitise_key
+
+
+@dataclass
+class IterationRecord:
+    """What one validation of a section found."""
+    iteration: int
+    draft_hash: str
+    critical: int
+    standard: int
+    issue_fingerprints: FrozenSet[str]
+
+
+def _fingerprint(severity: str, issue: Dict[str, str]) -> str:
+    # Validators rephrase the same finding from one run to the next, so an issue
+    # tied to a field is identified by its field; others by their first words.
+    if issue["field"]:
+        return f"{severity}:{_sanitise_key(issue['field'])}"
+    return f"{severity}:{' '.join(re.findall(r'[a-z0-9]+', issue['text'].lower())[:8])}"
+
+
+class ConvergenceTracker:
+    """Tracks one section's validation history and detects when it has stopped improving."""
+
+    def __init__(self, section_number: str, stall_iterations: int = None):
+        self.section_number = section_number
+        self.stall_iterations = stall_iterations or config.CONVERGENCE_STALL_ITERATIONS
+        self.history: List[IterationRecord] = []
+        self.outcome = "in progress"
+        _run_trackers()[section_number] = self
+
+    def record(self, iteration: int, draft: str, issue_counts: Dict[str, int], feedback_content: str):
+        issues = parse_feedback_issues(feedback_content) or {"critical": [], "standard": []}
+        self.history.append(IterationRecord(
+            iteration=iteration,
+            draft_hash=hashlib.sha256((draft or "").encode("utf-8")).hexdigest(),
+            critical=issue_counts.get("critical", 0),
+            standard=issue_counts.get("standard", 0),
+            issue_fingerprints=frozenset(_fingerprint(severity, issue) for severity, severity_issues in issues.items() for issue in severity_issues),
+        ))
+
+    def stop_reason(self) -> str | None:
+        """Returns why the loop should stop now, or None if it may still converge."""
+        if not config.CONVERGENCE_DETECTION_ENABLED or len(self.history) < 2:
+            return None
+        current, previous = self.history[-1], self.history[-2]
+
+        if current.draft_hash == previous.draft_hash:
+            return f"no-op rewrite (the draft validated in iteration {current.iteration} is identical to the one before it)"
+
+        if len(self.history) >= 3:
+            earlier = self.history[-3]
+            returned = current.draft_hash == earlier.draft_hash or (
+                current.issue_fingerprints and current.issue_fingerprints == earlier.issue_fingerprints
+                and current.issue_fingerprints != previous.issue_fingerprints
+            )
+            if returned and current.critical >= earlier.critical:
+                return f"oscillation (iteration {current.iteration} returned to the state of iteration {earlier.iteration})"
+
+        if len(self.history) > self.stall_iterations:
+            best_before = min(record.critical for record in self.history[:-self.stall_iterations])
+            if min(record.critical for record in self.history[-self.stall_iterations:]) >= best_before:
+                return f"stalled (no fall in critical issues for {self.stall_iterations} iterations, best {best_before})"
+        return None
+
+    def finish(self, outcome: str):
+        """Records how the section's loop ended."""
+        self.outcome = outcome
+
+    @property
+    def iterations(self) -> int:
+        return len(self.history)
+
+
+_trackers: contextvars.ContextVar[Dict[str, ConvergenceTracker] | None] = contextvars.ContextVar("convergence_trackers", default=None)
+
+
+def _run_trackers() -> Dict[str, ConvergenceTracker]:
+    trackers = _trackers.get()
+    if trackers is None:
+        trackers = {}
+        _trackers.set(trackers)
+    return trackers
+
+
+def reset_convergence_trackers():
+    """Starts an empty set of trackers for the run the current asyncio task belongs to."""
+    _trackers.set({})
+
+
+def get_convergence_tracker(section_number: str) -> ConvergenceTracker:
+    """Returns the section's tracker, creating it if the section has none, so a resumed loop keeps its history."""
+    return _run_trackers().get(section_number) or ConvergenceTracker(section_number)
+
+
+def _section_sort_key(section_number: str) -> tuple:
+    # Orders "3.2" after "3" and before "3.10".
+    return tuple((0, int(part)) if part.isdigit() else (1, part) for part in section_number.split("."))
+
+
+def get_section_outcomes() -> Dict[str, Dict[str, object]]:
+    """Returns the iterations used and the outcome of every section tracked in this run."""
+    return {
+        section_number: {"iterations": tracker.iterations, "outcome": tracker.outcome, "critical_history": [record.critical for record in tracker.history]}
+        for section_number, tracker in sorted(_run_trackers().items(), key=lambda item: _section_sort_key(item[0]))
+    }
+
+
+def iteration_histogram() -> Dict[int, int]:
+    """Returns {iterations used: number of sections}."""
+    return dict(sorted(Counter(tracker.iterations for tracker in _run_trackers().values()).items()))
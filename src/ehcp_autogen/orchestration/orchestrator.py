@@ -8,149 +8,534 @@ document section from its initial creation through to its final validation.
 The central function, `process_section`, implements the critical
 "Write-Validate-Refine" loop. This iterative process ensures that each
 document section is repeatedly improved until it meets all validation
-criteria defined in the validation guidance. The module also manages the
-concurrency semaphore to control resource utilisation.
+criteria defined in the validation guidance. Each section (and each
+sub-section) runs in a slot granted by the section scheduler (see
+`scheduling.py`), which limits how many run at once and decides which starts
+next. A `ConvergenceTracker`
+(see `convergence.py`) ends the loop early once a section stops improving.
+
+The loop itself is `run_section_loop_async`. A section declared with
+sub-sections is processed by `process_subsections_async` instead, which runs
+one loop per sub-section in parallel and assembles the results (see
+`subsections.py`). Every validated draft and every outcome is recorded in the
+run's journal (see `run_state.py`), from which a resumed run restarts each
+unfinished section.
 """
 
 
 
-import logging
+import re
 import asyncio
-from typing import Dict
-from autogen import ConversableAgent
+import logging
+from typing import Dict, List, Tuple
+from autogen import ConversableAgent, GroupChatManager
 
 from .. import config
-from ..tasks import get_creation_task, get_correction_task, run_validation_async
-from ..agents.writer import create_writer_team
-from ..utils.utils import download_blob_as_text_async, parse_feedback_and_count_issues, download_all_sources_from_container_async
-
-async def process_section(section_number: str, semaphore: asyncio.Semaphore, llm_config: Dict, llm_config_fast: Dict, prompt_writer: ConversableAgent):
-    """Asynchronously processes a single section, including retries, under a semaphore."""
-    # The semaphore ensures that we only process a fixed number of sections
-    # concurrently (defined by CONCURRENT_SECTIONS in config), preventing
-    # overwhelming the LLM service with too many simultaneous requests.
-    async with semaphore:
-        logging.info(f"Semaphore acquired for section {section_number}. Starting processing.")
-       
-        max_iterations = config.MAX_SECTION_ITERATIONS
-        loop_logger = logging.getLogger('LoopTracer')
-        
-        try:
-            
-            # Get source content for this section, respecting any exclude list
-            section_config = config.get_section_config(section_number)
-            # Using .get() provides a default empty list if 'source_exclude_files'
-            # is not defined for a section, preventing a KeyError.
-            exclude_list = section_config.get("source_exclude_files", []) # Use .get for safety
-            
-            logging.info(f"Fetching source documents for Section {section_number}...")
-            source_content = await download_all_sources_from_container_async(
-                config.PROCESSED_BLOB_CONTAINER, 
-                exclude_files=exclude_list
-            )
+from ..tasks import (
+    get_creation_task,
+    get_correction_task,
+    get_patch_correction_task,
+    run_validation_async,
+    run_incremental_validation_async,
+    run_prevalidation_async,
+    run_consistency_check_async,
+    get_section_retrieval_query,
+)
+from ..agents.writer import create_writer_team, create_document_writer_agent
+from ..agents.agent_pool import get_agent_pool
+from ..llm.telemetry import set_call_tags
+from .convergence import ConvergenceTracker, get_convergence_tracker
+from .run_state import get_run_state_journal
+from .scheduling import SectionScheduler
+from .subsections import get_subsection_numbers, assemble_subsections, find_cross_subsection_issues, attribute_issues
+from ..utils.utils import (
+    download_blob_as_text_async,
+    upload_blob_async,
+    parse_feedback_and_count_issues,
+    parse_feedback_issues,
+    format_feedback_report,
+    parse_field_edits,
+    apply_field_edits,
+    SourceCorpus,
+)
 
-            # ==================================================================
-            # === Initial Document Creation ================
-            # ==================================================================
-            logging.info(f"\n{'='*20} SECTION {section_number} - INITIAL CREATION {'='*20}")
-            
-            # The first output file is version 1
-            current_output_name = f"output_s{section_number}_i1.md"
-
-            writer_manager = create_writer_team(llm_config, llm_config_fast)
-            writer_proxy_agent = writer_manager.groupchat.agent_by_name("Writer_User_Proxy")
-            
-            creation_task = await get_creation_task(section_number, current_output_name, source_content)
-            await writer_proxy_agent.a_initiate_chat(
-                recipient=writer_manager, message=creation_task, clear_history=True
-            )
-            loop_logger.info(f"Section {section_number}: Initial draft '{current_output_name}' created.")
 
-            # ==================================================================
-            # === Validation and Correction Loop =======================
-            # ==================================================================
-            # The loop starts at 1 to align with human-readable iteration numbers (e.g., "Iteration 1").
-            for i in range(1, max_iterations + 1):
-                logging.info(f"\n{'='*20} SECTION {section_number} - CORRECTION ITERATION {i} {'='*20}")
+def create_writer(llm_config: Dict, llm_config_fast: Dict, writer_engine: str = None) -> ConversableAgent:
+    """
+    Creates the writer for a section according to `WRITER_ENGINE`: the full
+    writer team's GroupChatManager, or a standalone Document_Writer.
+    """
+    writer_engine = (writer_engine or config.WRITER_ENGINE).lower()
+    if writer_engine == "groupchat":
+        return create_writer_team(llm_config, llm_config_fast)
+    if writer_engine == "direct":
+        return create_document_writer_agent(llm_config)
+    raise ValueError(f"Unknown writer engine '{writer_engine}'. Expected 'groupchat' or 'direct'.")
+
+def _strip_document_fence(document: str) -> str:
+    """Removes a single markdown code fence wrapped around an entire reply, if present."""
+    fenced = re.match(r"^\s*```[a-zA-Z]*\n(.*)\n```\s*$", document, re.DOTALL)
+    return fenced.group(1) if fenced else document.strip()
+
+async def run_writer_async(writer: ConversableAgent, task: str, output_blob_name: str):
+    """
+    Runs one creation or correction pass and leaves the draft in
+    `output_blob_name` in the output container.
+
+    The writer team saves the draft itself through its proxy's `upload_blob_async`
+    tool. A standalone Document_Writer answers in a single completion and the
+    draft is uploaded here, under the same blob name.
+    """
+    if isinstance(writer, GroupChatManager):
+        writer_proxy_agent = writer.groupchat.agent_by_name("Writer_User_Proxy")
+        await writer_proxy_agent.a_initiate_chat(
+            recipient=writer, message=task, clear_history=True
+        )
+        return
+
+    reply = await writer.a_generate_reply(messages=[{"role": "user", "content": task}])
+    # As with the Prompt_Writer, the reply may be a dict or a plain string.
+    document = reply.get("content", "") if isinstance(reply, dict) else str(reply or "")
+    document = _strip_document_fence(document)
+    if not document:
+        # Without an upload the validator cannot read the draft, which is reported
+        # as a failed validation and retried, exactly as a failed team save would be.
+        logging.error(f"Document_Writer returned an empty draft for '{output_blob_name}'. Nothing was saved.")
+        return
+    await upload_blob_async(config.OUTPUT_BLOB_CONTAINER, output_blob_name, document)
+
+async def run_patch_correction_async(document_writer: ConversableAgent, task: str, previous_draft: str, output_blob_name: str) -> bool:
+    """
+    Asks the Document_Writer for field-level edits, applies them to the previous
+    draft and saves the result as `output_blob_name`.
+
+    Returns False, without saving anything, if the reply is not a patch that
+    can be applied, so the caller can fall back to a full rewrite.
+    """
+    reply = await document_writer.a_generate_reply(messages=[{"role": "user", "content": task}])
+    reply = reply.get("content", "") if isinstance(reply, dict) else str(reply or "")
+    edits = parse_field_edits(reply)
+    if not edits:
+        logging.warning(f"Document_Writer did not return field edits for '{output_blob_name}'. Falling back to a full rewrite.")
+        return False
+
+    patched_draft, unknown_keys = apply_field_edits(previous_draft, edits)
+    if unknown_keys:
+        logging.warning(f"Field edits for '{output_blob_name}' name fields missing from the draft ({', '.join(unknown_keys)}). Falling back to a full rewrite.")
+        return False
+
+    await upload_blob_async(config.OUTPUT_BLOB_CONTAINER, output_blob_name, patched_draft)
+    logging.info(f"Applied {len(edits)} field edit(s) to create '{output_blob_name}'.")
+    return True
+
+async def revise_draft_async(section_number: str, iteration: int, previous_draft: str, feedback_report: str, writer: ConversableAgent, llm_config: Dict, prompt_writer: ConversableAgent, source_content: str) -> str:
+    """
+    Turns a failed draft and its feedback report into the next draft,
+    `output_s{section_number}_i{iteration + 1}.md`, and returns its name.
+    """
+    loop_logger = logging.getLogger('LoopTracer')
+    logging.info(f"--- Critical issues found. Preparing revision request for next iteration with Prompt_Writer. ---")
+
+    prompt_writer_task = f"""
+    Here is a document that failed validation and the feedback report. Create a clean [REVISION_REQUEST] for the Document_Writer.
+
+    **Document to Revise:**
+    {previous_draft}
 
-                # Define filename for the current iteration
-                feedback_name = f"feedback_s{section_number}_i{i}.md"
+    **Feedback Report:**
+    {feedback_report}
+    """
+    # The 'Prompt_Writer' agent acts as a crucial buffer. It translates raw,
+    # potentially negative feedback into a neutral, actionable set of revision
+    # instructions, which makes the correction attempt by the Writer team more reliable.
+    set_call_tags(stage="revision_request")
+    clean_request_message = await prompt_writer.a_generate_reply(messages=[{"role": "user", "content": prompt_writer_task}])
 
-                # --- VALIDATOR TEAM ---
-                # Validates the output of the previous step and creates this iteration's feedback file.
-                await run_validation_async(section_number, llm_config, llm_config_fast, current_output_name, feedback_name, source_content)
+    revision_instructions = clean_request_message.get("content", "") if isinstance(clean_request_message, dict) else str(clean_request_message)
+
+    # Define the name for the NEXT output file
+    next_output_name = f"output_s{section_number}_i{iteration+1}.md"
+
+    # --- PATCH CORRECTION ---
+    # Small revisions are applied as edits to individual fields of the
+    # previous draft, so the writer does not regenerate the whole section.
+    if config.CORRECTION_MODE.lower() == "patch":
+        set_call_tags(stage="patch_correction")
+        patch_task = await get_patch_correction_task(section_number, previous_draft, revision_instructions, source_content)
+        async with get_agent_pool().lease("writer:direct", lambda: create_document_writer_agent(llm_config)) as document_writer:
+            patched = await run_patch_correction_async(document_writer, patch_task, previous_draft, next_output_name)
+        if patched:
+            loop_logger.info(f"Section {section_number}, Iteration {iteration}: Field edits applied to create revised draft '{next_output_name}'.")
+            return next_output_name
+
+    # --- CORRECTION WRITER TEAM ---
+    correction_task = await get_correction_task(section_number, previous_draft, revision_instructions, next_output_name, source_content)
+    set_call_tags(stage="correction")
+    await run_writer_async(writer, correction_task, next_output_name)
+    loop_logger.info(f"Section {section_number}, Iteration {iteration}: Writer team created revised draft '{next_output_name}'.")
+    return next_output_name
+
+async def run_section_loop_async(section_number: str, llm_config: Dict, llm_config_fast: Dict, prompt_writer: ConversableAgent, source_content: str, resume_from: Tuple[str, str, int] = None) -> Tuple[bool, str, int]:
+    """
+    Runs the Write-Validate-Refine loop for a section or sub-section and
+    returns (whether it passed, the name of its last draft, the iteration that
+    draft was validated in).
+
+    `resume_from` is (a draft's blob name, a feedback report on it, its
+    iteration). It re-opens a loop that has already ended: the draft is
+    corrected against the report and the loop continues from the next
+    iteration, with the section's convergence history intact.
+
+    The writer is leased from the agent pool for the whole loop.
+    """
+    writer_engine = config.WRITER_ENGINE.lower()
+    async with get_agent_pool().lease(f"writer:{writer_engine}", lambda: create_writer(llm_config, llm_config_fast, writer_engine)) as writer:
+        return await _run_section_loop_with_writer_async(section_number, writer, llm_config, llm_config_fast, prompt_writer, source_content, resume_from)
+
+async def _run_section_loop_with_writer_async(section_number: str, writer: ConversableAgent, llm_config: Dict, llm_config_fast: Dict, prompt_writer: ConversableAgent, source_content: str, resume_from: Tuple[str, str, int] = None) -> Tuple[bool, str, int]:
+    max_iterations = config.MAX_SECTION_ITERATIONS
+    loop_logger = logging.getLogger('LoopTracer')
+    run_state = get_run_state_journal()
+
+    if resume_from is None:
+        # ==================================================================
+        # === Initial Document Creation ================
+        # ==================================================================
+        logging.info(f"\n{'='*20} SECTION {section_number} - INITIAL CREATION {'='*20}")
+        # Every LLM call made from this section's task is tagged for telemetry.
+        set_call_tags(section=section_number, iteration=0, stage="creation")
+
+        # The first output file is version 1
+        current_output_name = f"output_s{section_number}_i1.md"
+
+        creation_task = await get_creation_task(section_number, current_output_name, source_content)
+        await run_writer_async(writer, creation_task, current_output_name)
+        loop_logger.info(f"Section {section_number}: Initial draft '{current_output_name}' created.")
+        convergence = ConvergenceTracker(section_number)
+        first_iteration = 1
+    else:
+        resumed_output_name, resumed_feedback, resumed_iteration = resume_from
+        convergence = get_convergence_tracker(section_number)
+        if resumed_iteration >= max_iterations:
+            logging.error(f"\n🚫 FAILED: Section {section_number} has no iterations left to correct '{resumed_output_name}'.")
+            convergence.finish("failed: iteration limit")
+            if run_state:
+                await run_state.finish_section(section_number, False)
+            return False, resumed_output_name, resumed_iteration
+        logging.info(f"\n{'='*20} SECTION {section_number} - RESUMED AFTER ITERATION {resumed_iteration} {'='*20}")
+        set_call_tags(section=section_number, iteration=resumed_iteration)
+        resumed_draft = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, resumed_output_name)
+        current_output_name = await revise_draft_async(
+            section_number, resumed_iteration, resumed_draft, resumed_feedback, writer, llm_config, prompt_writer, source_content
+        )
+        first_iteration = resumed_iteration + 1
+
+    # ==================================================================
+    # === Validation and Correction Loop =======================
+    # ==================================================================
+    # The previous draft and its feedback, kept when a validator team or
+    # incremental validation fails so the next iteration can re-check only
+    # the fields the correction changed.
+    previous_validation = None
+    # The loop starts at 1 to align with human-readable iteration numbers (e.g., "Iteration 1").
+    for i in range(first_iteration, max_iterations + 1):
+        logging.info(f"\n{'='*20} SECTION {section_number} - CORRECTION ITERATION {i} {'='*20}")
+
+        # Define filename for the current iteration
+        feedback_name = f"feedback_s{section_number}_i{i}.md"
+
+        # --- PRE-VALIDATION ---
+        # Structural failures are reported by deterministic checks, without
+        # running the validator team.
+        # Each validation step returns the report it saved, so the assessment
+        # below never depends on reading the report back from storage.
+        prevalidation_issues, feedback_content = await run_prevalidation_async(section_number, current_output_name, feedback_name)
+        # A pre-validation report never reviewed the content, so it cannot
+        # vouch for the fields an incremental validation would leave unchecked.
+        prevalidation_failed = bool(feedback_content)
+        if feedback_content:
+            loop_logger.info(f"Section {section_number}, Iteration {i}: Pre-validation failed, validator run skipped. '{feedback_name}' created.")
+
+        # --- INCREMENTAL VALIDATION ---
+        # Only follows a failed validation: a draft that passed (including the
+        # mandatory second loop after a first-attempt pass) is always re-validated in full.
+        if not feedback_content and previous_validation and config.VALIDATION_MODE.lower() == "incremental":
+            set_call_tags(iteration=i, stage="incremental_validation")
+            validated_draft, validated_feedback = previous_validation
+            feedback_content = await run_incremental_validation_async(
+                section_number, llm_config, validated_draft, validated_feedback, current_output_name, feedback_name, source_content
+            )
+            if feedback_content:
+                loop_logger.info(f"Section {section_number}, Iteration {i}: Changed fields re-validated. '{feedback_name}' created.")
+
+        # --- VALIDATOR TEAM ---
+        if not feedback_content:
+            set_call_tags(iteration=i, stage="validation")
+            # Validates the output of the previous step and creates this iteration's feedback file.
+            feedback_content = await run_validation_async(section_number, llm_config, llm_config_fast, current_output_name, feedback_name, source_content)
+            if feedback_content:
                 loop_logger.info(f"Section {section_number}, Iteration {i}: Validator team completed.'{feedback_name}' created.")
-            
-                # --- ASSESSMENT ---
-                feedback_content = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, feedback_name)
-                
-                issue_counts = parse_feedback_and_count_issues(feedback_content)
-                logging.info(f"Section {section_number} Issues Found: Critical={issue_counts.get('critical', 0)}, Standard={issue_counts.get('standard', 0)}")
-
-                # --- SUCCESS CONDITION ---        
-                # If a section passes on the first attempt, we force a second loop. This is a
-                # deliberate robustness check to mitigate the risk of a "lucky pass" and to ensure that
-                # we give an opportunity for any non-critical errors to be corrected.
-                if issue_counts['critical'] == 0 and i >= 2:
-                    logging.info(f"\n✅ Success! Section {section_number} passed validation on iteration {i}.")
-                    loop_logger.info(f"===== Section {section_number} PASSED =====")
-                    return True
-                elif issue_counts['critical'] == 0 and i == 1:
-                    logging.info(f"\n⚠️ Section {section_number} passed on first attempt. Forcing a second loop for robustness.")
-                    loop_logger.info(f"Section {section_number}, Iteration 1: Passed, but continuing to mandatory second loop.")
-
-                # --- PREPARE FOR NEXT ITERATION ---
-                # If we've reached the max number of iterations, fail now.
-                if i >= max_iterations:
-                    break
-
-                logging.info(f"--- Critical issues found. Preparing revision request for next iteration with Prompt_Writer. ---")
-                
-                previous_draft = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, current_output_name)
-                feedback_report = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, feedback_name)
-                
-                prompt_writer_task = f"""
-                Here is a document that failed validation and the feedback report. Create a clean [REVISION_REQUEST] for the Document_Writer.
-
-                **Document to Revise:**
-                {previous_draft}
-
-                **Feedback Report:**
-                {feedback_report}
-                """
-                # The 'Prompt_Writer' agent acts as a crucial buffer. It translates raw,
-                # potentially negative feedback into a neutral, actionable set of revision
-                # instructions, which makes the correction attempt by the Writer team more reliable.
-                clean_request_message = await prompt_writer.a_generate_reply(messages=[{"role": "user", "content": prompt_writer_task}])
-                
-                revision_instructions = clean_request_message.get("content", "") if isinstance(clean_request_message, dict) else str(clean_request_message)
-                
-                # Define the name for the NEXT output file
-                next_output_name = f"output_s{section_number}_i{i+1}.md"
-                correction_task = await get_correction_task(section_number, previous_draft, revision_instructions, next_output_name, source_content)
-
-                # --- CORRECTION WRITER TEAM ---
-                await writer_proxy_agent.a_initiate_chat(
-                    recipient=writer_manager, message=correction_task, clear_history=True
-                )
-                loop_logger.info(f"Section {section_number}, Iteration {i}: Writer team created revised draft '{next_output_name}'.")
-
-                # The current output name is updated to point to the newly created file,
-                # ensuring the next iteration of the loop validates the most recent version.
-                current_output_name = next_output_name
-
-            # If the loop completes without returning True, it means we've hit the
-            # MAX_SECTION_ITERATIONS limit without passing validation.
-            logging.error(f"\n🚫 FAILED: Section {section_number} could not pass after {max_iterations} iterations.")
+            else:
+                loop_logger.info(f"Section {section_number}, Iteration {i}: Validator team produced no report, even after repair.")
+
+        # --- ASSESSMENT ---
+        # Only a validation that produced no report at all is counted as a failure
+        # (99 critical issues) that sends the section through a full correction.
+        feedback_content = feedback_content or ""
+        issue_counts = parse_feedback_and_count_issues(feedback_content)
+        logging.info(f"Section {section_number} Issues Found: Critical={issue_counts.get('critical', 0)}, Standard={issue_counts.get('standard', 0)}")
+        # The draft was written earlier in this run, so this read is served by the blob cache.
+        current_draft = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, current_output_name)
+        convergence.record(i, current_draft, issue_counts, feedback_content)
+        # Journaled before anything else happens to the draft, so a resumed run can restart from it.
+        if run_state:
+            await run_state.record_iteration(section_number, i, current_output_name, current_draft, feedback_name, feedback_content, issue_counts)
+
+        # --- SUCCESS CONDITION ---        
+        # If a section passes on the first attempt, we force a second loop. This is a
+        # deliberate robustness check to mitigate the risk of a "lucky pass" and to ensure that
+        # we give an opportunity for any non-critical errors to be corrected.
+        # With SECOND_LOOP_POLICY "unless_prechecks_clean", a first pass is accepted
+        # when the deterministic pre-checks found nothing either.
+        prechecks_clean = prevalidation_issues is not None and not any(prevalidation_issues.values())
+        skip_second_loop = config.SECOND_LOOP_POLICY.lower() == "unless_prechecks_clean" and prechecks_clean
+        if issue_counts['critical'] == 0 and (i >= 2 or skip_second_loop):
+            logging.info(f"\n✅ Success! Section {section_number} passed validation on iteration {i}.")
+            loop_logger.info(f"===== Section {section_number} PASSED =====")
+            convergence.finish("passed")
+            if run_state:
+                await run_state.finish_section(section_number, True)
+            return True, current_output_name, i
+        elif issue_counts['critical'] == 0 and i == 1:
+            logging.info(f"\n⚠️ Section {section_number} passed on first attempt. Forcing a second loop for robustness.")
+            loop_logger.info(f"Section {section_number}, Iteration 1: Passed, but continuing to mandatory second loop.")
+
+        # --- PREPARE FOR NEXT ITERATION ---
+        # If we've reached the max number of iterations, fail now.
+        if i >= max_iterations:
+            break
+
+        # --- CONVERGENCE CHECK ---
+        # A section that has stopped improving is failed now rather than after
+        # every remaining iteration.
+        stop_reason = convergence.stop_reason()
+        if stop_reason:
+            logging.error(f"\n🚫 FAILED: Section {section_number} stopped after iteration {i}: {stop_reason}.")
+            loop_logger.info(f"Section {section_number}, Iteration {i}: Stopped early, {stop_reason}.")
+            convergence.finish(f"stopped: {stop_reason.split(' (')[0]}")
+            if run_state:
+                await run_state.finish_section(section_number, False)
+            return False, current_output_name, i
+
+        previous_draft = current_draft
+        # The current output name is updated to point to the newly created file,
+        # ensuring the next iteration of the loop validates the most recent version.
+        current_output_name = await revise_draft_async(
+            section_number, i, previous_draft, feedback_content, writer, llm_config, prompt_writer, source_content
+        )
+        previous_validation = (previous_draft, feedback_content) if issue_counts['critical'] > 0 and not prevalidation_failed else None
+
+    # If the loop completes without returning True, it means we've hit the
+    # MAX_SECTION_ITERATIONS limit without passing validation.
+    logging.error(f"\n🚫 FAILED: Section {section_number} could not pass after {max_iterations} iterations.")
+    convergence.finish("failed: iteration limit")
+    if run_state:
+        await run_state.finish_section(section_number, False)
+    return False, current_output_name, max_iterations
+
+async def process_subsections_async(section_number: str, subsection_numbers: List[str], section_scheduler: SectionScheduler, llm_config: Dict, llm_config_fast: Dict, prompt_writer: ConversableAgent, source_corpus: SourceCorpus) -> bool:
+    """
+    Processes a section that is generated in parts (see `subsections.py`).
+
+    Every sub-section runs its own Write-Validate-Refine loop, each in a slot
+    of its own from the section scheduler, so a section in six parts is held
+    to the same CONCURRENT_SECTIONS limit as six sections would be. Their
+    final drafts are then assembled into `output_s{section_number}_iK.md` and,
+    in the section's own slot, checked for consistency with one another and
+    then validated in full against the section's validation guidance.
+    Sub-sections with critical issues are corrected in their own loops and the
+    section is assembled and checked again, up to SUBSECTION_CONSISTENCY_ROUNDS
+    times.
+
+    Every sub-section asks for its slot as soon as the section starts; the
+    section's source content is selected once, by the first to be admitted,
+    and shared by all of them.
+
+    In a resumed run, sub-sections that passed in an earlier attempt are not
+    run again, and the consistency rounds carry on from the last one recorded.
+    """
+    loop_logger = logging.getLogger('LoopTracer')
+    run_state = get_run_state_journal()
+    loop_logger.info(f"Section {section_number}: Generating {len(subsection_numbers)} sub-sections in parallel.")
+
+    source_lock = asyncio.Lock()
+    source_content = None
+
+    async def _source_content() -> str:
+        nonlocal source_content
+        async with source_lock:
+            if source_content is None:
+                source_content = await _select_section_sources_async(section_number, source_corpus)
+        return source_content
+
+    async def _run_subsection(subsection_number: str, resume_from: Tuple[str, str, int] = None) -> Tuple[bool, str, int]:
+        async with section_scheduler.slot(subsection_number):
+            return await run_section_loop_async(subsection_number, llm_config, llm_config_fast, prompt_writer, await _source_content(), resume_from=resume_from)
+
+    async def _start_subsection(subsection_number: str) -> Tuple[bool, str, int]:
+        if run_state and run_state.section_passed(subsection_number):
+            record = run_state.section(subsection_number)
+            loop_logger.info(f"Section {subsection_number}: Passed in an earlier attempt, '{record['output_blob']}' reused.")
+            return True, record["output_blob"], record["iteration"]
+        async with section_scheduler.slot(subsection_number):
+            resume_from = await run_state.resume_point_async(subsection_number) if run_state else None
+            return await run_section_loop_async(subsection_number, llm_config, llm_config_fast, prompt_writer, await _source_content(), resume_from=resume_from)
+
+    # Queued before their tasks are started, so the sub-sections compete for the
+    # first slots with the sections started alongside this one.
+    for subsection_number in subsection_numbers:
+        if not (run_state and run_state.section_passed(subsection_number)):
+            section_scheduler.request(subsection_number)
+    # Each loop runs as its own task, so the telemetry tags it sets stay with its own calls.
+    results = await asyncio.gather(*(_start_subsection(subsection_number) for subsection_number in subsection_numbers))
+    outcomes = dict(zip(subsection_numbers, results))
+
+    first_round = run_state.section(section_number).get("iteration", 0) + 1 if run_state else 1
+    for round_number in range(first_round, config.SUBSECTION_CONSISTENCY_ROUNDS + 1):
+        failed = [subsection_number for subsection_number, (passed, _, _) in outcomes.items() if not passed]
+        if failed:
+            logging.error(f"\n🚫 FAILED: Section {section_number} could not be assembled, as sub-section(s) {', '.join(failed)} did not pass.")
+            if run_state:
+                await run_state.finish_section(section_number, False)
             return False
 
-        # This top-level exception handler catches any unexpected, critical errors
-        # within a section's processing, ensuring that a single section's failure
-        # doesn't crash the entire application. It logs the error and returns False.
-        except Exception as e:
-            logging.critical(f"FATAL ERROR in process_section '{section_number}': {e}", exc_info=True)
-            loop_logger.critical(f"===== Section {section_number} FAILED with a critical exception: {e} =====")
-            return False 
+        # The slot is only held for the checks; it is given back while sub-sections are corrected in slots of their own.
+        async with section_scheduler.slot(section_number):
+            # --- ASSEMBLY ---
+            set_call_tags(section=section_number, iteration=round_number, stage="consistency_check")
+            drafts = {
+                subsection_number: await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, output_name)
+                for subsection_number, (_, output_name, _) in outcomes.items()
+            }
+            output_name = f"output_s{section_number}_i{round_number}.md"
+            feedback_name = f"feedback_s{section_number}_i{round_number}.md"
+            assembled_draft = assemble_subsections(drafts)
+            await upload_blob_async(config.OUTPUT_BLOB_CONTAINER, output_name, assembled_draft)
+            loop_logger.info(f"Section {section_number}, Round {round_number}: Sub-sections assembled into '{output_name}'.")
+
+            # --- CONSISTENCY CHECK ---
+            feedback_content = await run_consistency_check_async(
+                section_number, llm_config, output_name, feedback_name, await _source_content(), find_cross_subsection_issues(drafts)
+            )
+            validated_in_full = feedback_content is None
+            if validated_in_full:
+                # Without readable verdicts, the assembled section is validated in full instead.
+                set_call_tags(stage="validation")
+                feedback_content = await run_validation_async(section_number, llm_config, llm_config_fast, output_name, feedback_name, source_content) or ""
+            issues = parse_feedback_issues(feedback_content)
+            if issues is None:
+                logging.error(f"\n🚫 FAILED: Section {section_number}'s consistency report '{feedback_name}' could not be read.")
+                if run_state:
+                    await run_state.finish_section(section_number, False)
+                return False
+            loop_logger.info(f"Section {section_number}, Round {round_number}: Consistency check found Critical={len(issues['critical'])}, Standard={len(issues['standard'])}.")
+
+            # --- FULL VALIDATION ---
+            # Each part was only validated against its own heading, so a consistent
+            # section is still checked against the rules for the section as a whole.
+            if not issues["critical"] and not validated_in_full:
+                set_call_tags(stage="validation")
+                feedback_name = f"feedback_s{section_number}_i{round_number}_full.md"
+                feedback_content = await run_validation_async(section_number, llm_config, llm_config_fast, output_name, feedback_name, source_content) or ""
+                issues = parse_feedback_issues(feedback_content)
+                if issues is None:
+                    logging.error(f"\n🚫 FAILED: Section {section_number}'s validation report '{feedback_name}' could not be read.")
+                    if run_state:
+                        await run_state.finish_section(section_number, False)
+                    return False
+                loop_logger.info(f"Section {section_number}, Round {round_number}: Full validation found Critical={len(issues['critical'])}, Standard={len(issues['standard'])}.")
+
+        if run_state:
+            await run_state.record_iteration(
+                section_number, round_number, output_name, assembled_draft, feedback_name, feedback_content,
+                {"critical": len(issues["critical"]), "standard": len(issues["standard"])},
+            )
+        if not issues["critical"]:
+            logging.info(f"\n✅ Success! Section {section_number} passed its consistency check and validation in round {round_number}.")
+            loop_logger.info(f"===== Section {section_number} PASSED =====")
+            if run_state:
+                await run_state.finish_section(section_number, True)
+            return True
+        if round_number >= config.SUBSECTION_CONSISTENCY_ROUNDS:
+            break
+
+        # --- SUB-SECTION CORRECTION ---
+        faulted = attribute_issues(issues, drafts)
+        loop_logger.info(f"Section {section_number}, Round {round_number}: Correcting sub-section(s) {', '.join(faulted)}.")
+        results = await asyncio.gather(*(
+            _run_subsection(
+                subsection_number,
+                (
+                    outcomes[subsection_number][1],
+                    format_feedback_report(subsection_issues, "The sub-section does not meet the rules for the section as a whole, or is inconsistent with the other sub-sections."),
+                    outcomes[subsection_number][2],
+                ),
+            )
+            for subsection_number, subsection_issues in faulted.items()
+        ))
+        outcomes.update(zip(faulted, results))
+
+    logging.error(f"\n🚫 FAILED: Section {section_number} was still inconsistent after {config.SUBSECTION_CONSISTENCY_ROUNDS} consistency check(s).")
+    if run_state:
+        await run_state.finish_section(section_number, False)
+    return False
+
+async def _select_section_sources_async(section_number: str, source_corpus: SourceCorpus) -> str:
+    """Returns the source content a section's prompts carry, respecting its exclude list."""
+    section_config = config.get_section_config(section_number)
+    # Using .get() provides a default empty list if 'source_exclude_files'
+    # is not defined for a section, preventing a KeyError.
+    exclude_list = section_config.get("source_exclude_files", []) # Use .get for safety
+
+    # The corpus is downloaded once per run in `run_case_async`; each section only
+    # takes a filtered view of it rather than re-downloading every blob. For
+    # large cases the view is narrowed to the chunks relevant to this section.
+    # It is selected once and reused by every iteration of the section.
+    logging.info(f"Selecting source documents for Section {section_number}...")
+    retrieval_query = await get_section_retrieval_query(section_number)
+    return await source_corpus.get_section_content_async(section_number, exclude_list, retrieval_query)
+
+async def process_section(section_number: str, section_scheduler: SectionScheduler, llm_config: Dict, llm_config_fast: Dict, prompt_writer: ConversableAgent, source_corpus: SourceCorpus):
+    """
+    Asynchronously processes a single section, including retries, once its
+    slot is granted. A section written in sub-sections takes a slot for each
+    sub-section loop and for each of its checks instead.
+    """
+    loop_logger = logging.getLogger('LoopTracer')
+
+    try:
+        # Large sections are written as sub-sections that share the section's source content.
+        subsection_numbers = get_subsection_numbers(section_number)
+        if subsection_numbers:
+            return await process_subsections_async(section_number, subsection_numbers, section_scheduler, llm_config, llm_config_fast, prompt_writer, source_corpus)
+
+        # The slot ensures that we only process a fixed number of sections
+        # concurrently (defined by CONCURRENT_SECTIONS in config), preventing
+        # overwhelming the LLM service with too many simultaneous requests.
+        async with section_scheduler.slot(section_number):
+            logging.info(f"Slot granted for section {section_number}. Starting processing.")
+            source_content = await _select_section_sources_async(section_number, source_corpus)
 
+            # A resumed run restarts the section from its last validated draft.
+            run_state = get_run_state_journal()
+            resume_from = await run_state.resume_point_async(section_number) if run_state else None
+            passed, _, _ = await run_section_loop_async(section_number, llm_config, llm_config_fast, prompt_writer, source_content, resume_from=resume_from)
+            return passed
 
-    
\ No newline at end of file
+    # This top-level exception handler catches any unexpected, critical errors
+    # within a section's processing, ensuring that a single section's failure
+    # doesn't crash the entire application. It logs the error and returns False.
+    except Exception as e:
+        logging.critical(f"FATAL ERROR in process_section '{section_number}': {e}", exc_info=True)
+        loop_logger.critical(f"===== Section {section_number} FAILED with a critical exception: {e} =====")
+        return False
@@ -0,0 +1,205 @@
+"""
+run_state.py
+
+This module keeps a durable journal of a run's progress, so that a run that
+stops part-way can be resumed rather than started again.
+
+The `finally` block of `run_case_async` clears the run's blobs from
+`processed-docs` and `outputs` at the end of every run, and a job that is killed leaves them in an unknown
+state, so a failed run used to be repeated from nothing: sections that had
+already passed were generated again, at full LLM cost. `RunStateJournal`
+records, in `RUN_STATE_CONTAINER` (which is never cleared):
+- the source documents the run was started with, and each document whose
+  pre-processing finished, with a copy of its processed text;
+- for each section and sub-section, the last draft that was validated, its
+  iteration, the critical and standard issues found in it and whether the
+  section passed, with copies of the draft and its feedback report.
+
+The journal also records the prefix of the case's documents in the source
+container, so a resumed run reads the same case. The journal is saved after
+every change. `python -m src.main --resume <run_id>` loads it, restores the copies into the scratch containers and carries on:
+documents already pre-processed and sections already passed are skipped, and
+every other section restarts from its last validated draft, which is
+corrected against its feedback report as the next iteration. Iterations (and
+the consistency rounds of a section with sub-sections) are counted across
+attempts, so a resumed section never gets more than MAX_SECTION_ITERATIONS.
+"""
+
+import json
+import asyncio
+import logging
+import contextvars
+from datetime import datetime
+from typing import Dict, Tuple
+
+from .. import config
+from ..utils.utils import (
+    upload_blob_async,
+    download_blob_as_text_async,
+    copy_blob_async,
+)
+
+
+class RunStateJournal:
+    """The durable record of a run's progress, kept as JSON in the run-state container."""
+
+    def __init__(self, run_id: str, state: Dict = None):
+        self.run_id = run_id
+        self.state = state or {
+            "run_id": run_id,
+            "source_prefix": "",
+            "status": "running",
+            "attempts": 0,
+            "source_md5s": {},
+            "preprocessing": {"completed": False, "documents": {}},
+            "sections": {},
+        }
+        # Saves are serialised, so an older snapshot never overwrites a newer one.
+        self._lock = asyncio.Lock()
+
+    @property
+    def journal_blob_name(self) -> str:
+        return f"{self.run_id}/journal.json"
+
+    def _checkpoint_name(self, kind: str, blob_name: str) -> str:
+        return f"{self.run_id}/checkpoints/{kind}/{blob_name}"
+
+    @classmethod
+    async def load(cls, run_id: str) -> "RunStateJournal | None":
+        """Reads a run's journal, or returns None if the run has none."""
+        journal_text = await download_blob_as_text_async(config.RUN_STATE_CONTAINER, f"{run_id}/journal.json")
+        if not journal_text:
+            return None
+        try:
+            return cls(run_id, json.loads(journal_text))
+        except json.JSONDecodeError as e:
+            logging.error(f"The run-state journal of run '{run_id}' is unreadable. Reason: {e}")
+            return None
+
+    async def _save(self):
+        async with self._lock:
+            self.state["updated_at"] = datetime.now().isoformat(timespec="seconds")
+            await upload_blob_async(config.RUN_STATE_CONTAINER, self.journal_blob_name, json.dumps(self.state, indent=2, sort_keys=True))
+
+    # --- Run ---
+    async def start_attempt(self, source_md5s: Dict[str, str | None]):
+        """Records the start of a run, or of an attempt to resume it, and the sources it uses."""
+        self.state["attempts"] += 1
+        self.state["status"] = "running"
+        self.state["source_md5s"] = source_md5s
+        await self._save()
+
+    async def finish_run(self, succeeded: bool):
+        self.state["status"] = "succeeded" if succeeded else "failed"
+        await self._save()
+
+    @property
+    def succeeded(self) -> bool:
+        return self.state["status"] == "succeeded"
+
+    @property
+    def source_prefix(self) -> str:
+        """The prefix of the case's documents in the source container, which a resumed run reads again."""
+        return self.state.get("source_prefix", "")
+
+    # --- Pre-processing ---
+    async def record_document(self, pdf_blob_name: str, processed_blob_name: str | None):
+        """Records a pre-processed document (None if it was skipped) and keeps a copy of its text."""
+        if processed_blob_name:
+            await copy_blob_async(config.PROCESSED_BLOB_CONTAINER, processed_blob_name, config.RUN_STATE_CONTAINER, self._checkpoint_name("processed", processed_blob_name))
+        self.state["preprocessing"]["documents"][pdf_blob_name] = processed_blob_name
+        await self._save()
+
+    async def finish_preprocessing(self, succeeded: bool):
+        self.state["preprocessing"]["completed"] = succeeded
+        await self._save()
+
+    def preprocessed_documents(self) -> Dict[str, str | None]:
+        """Returns {PDF name: processed blob name, or None if it was skipped} for every document already pre-processed."""
+        return dict(self.state["preprocessing"]["documents"])
+
+    # --- Sections ---
+    async def record_iteration(self, section_number: str, iteration: int, output_blob_name: str, draft: str, feedback_blob_name: str, feedback: str, issue_counts: Dict[str, int]):
+        """Records a validated draft of a section or sub-section, with copies of the draft and its feedback report."""
+        await asyncio.gather(
+            upload_blob_async(config.RUN_STATE_CONTAINER, self._checkpoint_name("outputs", output_blob_name), draft),
+            upload_blob_async(config.RUN_STATE_CONTAINER, self._checkpoint_name("outputs", feedback_blob_name), feedback),
+        )
+        self.state["sections"][str(section_number)] = {
+            "status": "running",
+            "iteration": iteration,
+            "output_blob": output_blob_name,
+            "feedback_blob": feedback_blob_name,
+            "critical": issue_counts.get("critical", 0),
+            "standard": issue_counts.get("standard", 0),
+        }
+        await self._save()
+
+    async def finish_section(self, section_number: str, passed: bool):
+        record = self.state["sections"].setdefault(str(section_number), {"iteration": 0})
+        record["status"] = "passed" if passed else "failed"
+        await self._save()
+
+    def section(self, section_number: str) -> Dict:
+        """Returns what the journal holds on a section, or an empty dict."""
+        return dict(self.state["sections"].get(str(section_number), {}))
+
+    def section_passed(self, section_number: str) -> bool:
+        return self.section(section_number).get("status") == "passed"
+
+    async def resume_point_async(self, section_number: str) -> Tuple[str, str, int] | None:
+        """
+        Returns (last validated draft, its feedback report, its iteration) for
+        `run_section_loop_async`'s `resume_from`, or None if no draft of the
+        section was validated.
+        """
+        record = self.section(section_number)
+        if not record.get("output_blob"):
+            return None
+        feedback = await download_blob_as_text_async(config.RUN_STATE_CONTAINER, self._checkpoint_name("outputs", record["feedback_blob"]))
+        return record["output_blob"], feedback, record["iteration"]
+
+    async def restore_async(self):
+        """
+        Copies the processed documents and the drafts a resumed run needs back
+        into the scratch containers. The assembled drafts of a section with
+        sub-sections are only restored if the section passed, as an unfinished
+        section is assembled again.
+        """
+        restores = [
+            copy_blob_async(config.RUN_STATE_CONTAINER, self._checkpoint_name("processed", processed_blob_name), config.PROCESSED_BLOB_CONTAINER, processed_blob_name)
+            for processed_blob_name in self.state["preprocessing"]["documents"].values() if processed_blob_name
+        ]
+        for section_number, record in self.state["sections"].items():
+            if not record.get("output_blob"):
+                continue
+            has_subsections = any(number.startswith(f"{section_number}.") for number in self.state["sections"])
+            if has_subsections and record.get("status") != "passed":
+                continue
+            restores.append(copy_blob_async(config.RUN_STATE_CONTAINER, self._checkpoint_name("outputs", record["output_blob"]), config.OUTPUT_BLOB_CONTAINER, record["output_blob"]))
+        await asyncio.gather(*restores)
+        logging.getLogger('LoopTracer').info(f"Run state of '{self.run_id}' restored: {len(restores)} checkpointed blobs copied back.")
+
+
+# The journal of the run the current asyncio task belongs to; concurrent cases each have their own.
+_run_state_journal: contextvars.ContextVar[RunStateJournal | None] = contextvars.ContextVar("run_state_journal", default=None)
+
+
+def get_run_state_journal() -> RunStateJournal | None:
+    """Returns the current run's journal, or None if the run keeps none."""
+    return _run_state_journal.get()
+
+
+def create_run_state_journal(run_id: str, source_prefix: str = "") -> RunStateJournal:
+    """Starts a new, empty journal for a run."""
+    run_state = RunStateJournal(run_id)
+    run_state.state["source_prefix"] = source_prefix
+    _run_state_journal.set(run_state)
+    return run_state
+
+
+async def load_run_state_journal(run_id: str) -> RunStateJournal | None:
+    """Loads the journal of an earlier run to resume it, or returns None if it has none."""
+    run_state = await RunStateJournal.load(run_id)
+    _run_state_journal.set(run_state)
+    return run_state
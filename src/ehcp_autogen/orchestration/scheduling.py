@@ -0,0 +1,312 @@
+"""
+scheduling.py
+
+This module decides the order in which sections are started.
+
+Sections differ widely in how long they take. Section 3, for example, is
+written and validated against the needs-categorisation guide and usually needs
+the most iterations. With a FIFO semaphore, sections start in numeric order,
+so a long section can be left waiting behind short ones. The run then ends
+with that one section running on its own.
+
+`SectionScheduler` admits at most `CONCURRENT_SECTIONS` sections at a time.
+Under the default "fifo" policy they start in the order they asked for a slot.
+Under "critical_path", whenever a slot becomes free it starts the waiting
+section with the longest estimated duration: longest processing time first, which keeps the critical
+path, and so the run's makespan, short. Estimates come from `SectionCostModel`:
+- A section with history is estimated from its past runs, kept in
+  `SECTION_HISTORY_PATH` as a moving average of each section's duration,
+  iterations, tokens and LLM latency.
+- A section without history is estimated from the size of its writer and
+  validation guidance, at the seconds-per-KB rate of the sections whose
+  durations are known. That rate includes the sections that have finished
+  in this run, so the remaining sections are re-ranked as sections finish.
+
+Each sub-section of a section written in parts (see `subsections.py`) takes
+a slot of its own, as does the section's consistency check, so a section in
+six parts counts as six towards the limit rather than as one. A section that
+takes its slot more than once is timed by the total time it held a slot.
+
+At the end of the run, `makespan_report` replays the run under both
+policies: the same section durations, on the same slots, with each section
+only eligible from the time it first asked for a slot (once its documents
+were extracted, or its sub-sections had finished). The two simulated
+makespans are comparable with each other; the measured makespan also
+includes the scheduler's own delays.
+"""
+
+import os
+import json
+import time
+import heapq
+import asyncio
+import logging
+import contextvars
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Dict, List
+
+from .. import config
+
+# Metrics kept per section in the history file.
+_HISTORY_METRICS = ("seconds", "iterations", "prompt_tokens", "completion_tokens", "llm_latency_seconds")
+
+
+@lru_cache(maxsize=None)
+def guidance_kb(section_number: str) -> float:
+    """
+    The size, in KB, of the writer and validation guidance a section's prompts
+    carry. A sub-section writes one heading of its section, so it is given
+    its share of the section's guidance.
+    """
+    paths = config.get_section_config(section_number)
+    files = set(paths.get("writer_guidance", [])) | set(paths.get("validation_guidance", []))
+    size_kb = sum(os.path.getsize(path) for path in files if os.path.exists(path)) / 1024 or 1.0
+    if paths.get("heading"):
+        size_kb /= len(config.get_section_config(str(section_number).partition(".")[0]).get("subsections", [])) or 1
+    return size_kb
+
+
+class SectionCostModel:
+    """Estimates how long each section will take, from past runs and from this run so far."""
+
+    def __init__(self, history: Dict[str, Dict[str, float]] = None, smoothing: float = None):
+        self.history = history or {}
+        self.smoothing = smoothing if smoothing is not None else config.SECTION_HISTORY_SMOOTHING
+        # Durations of the sections that have finished in this run.
+        self.observed: Dict[str, float] = {}
+
+    @classmethod
+    def load(cls, path: str = None) -> "SectionCostModel":
+        path = path or config.SECTION_HISTORY_PATH
+        try:
+            with open(path, encoding="utf-8") as f:
+                history = json.load(f).get("sections", {})
+        except FileNotFoundError:
+            history = {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Section history '{path}' could not be read ({e}). Estimating section durations from guidance size.")
+            history = {}
+        return cls(history)
+
+    def observe(self, section_number: str, seconds: float):
+        self.observed[section_number] = seconds
+
+    def _seconds_per_kb(self) -> float:
+        known = {section: record["seconds"] for section, record in self.history.items() if record.get("seconds")}
+        known.update(self.observed)
+        if not known:
+            # Only the ranking matters until a duration is known.
+            return 1.0
+        return sum(known.values()) / sum(guidance_kb(section) for section in known)
+
+    def estimate(self, section_number: str) -> float:
+        """Returns the estimated duration of a section, in seconds."""
+        if section_number in self.observed:
+            return self.observed[section_number]
+        record = self.history.get(section_number)
+        if record and record.get("seconds"):
+            return record["seconds"]
+        return guidance_kb(section_number) * self._seconds_per_kb()
+
+    def update_history(self, section_metrics: Dict[str, Dict[str, float]]):
+        """Folds this run's metrics for each section into its moving averages."""
+        for section_number, metrics in section_metrics.items():
+            record = self.history.get(section_number)
+            if record is None:
+                self.history[section_number] = {"runs": 1, **{name: round(metrics.get(name, 0.0), 3) for name in _HISTORY_METRICS}}
+                continue
+            for name in _HISTORY_METRICS:
+                record[name] = round((1 - self.smoothing) * record.get(name, 0.0) + self.smoothing * metrics.get(name, 0.0), 3)
+            record["runs"] = record.get("runs", 0) + 1
+
+    def save(self, path: str = None):
+        path = path or config.SECTION_HISTORY_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"sections": self.history}, f, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+
+
+def _list_schedule_makespan(order: List[str], released_at: Dict[str, float], durations: Dict[str, float], slots: int) -> float:
+    """
+    The makespan of running sections on `slots` slots, where each free slot
+    goes to the section earliest in `order` of those released by then.
+    """
+    rank = {section_number: index for index, section_number in enumerate(order)}
+    pending = sorted(order, key=released_at.get)
+    slot_free_at = [0.0] * max(slots, 1)
+    ready = []
+    while pending or ready:
+        now = heapq.heappop(slot_free_at)
+        if not ready:
+            now = max(now, released_at[pending[0]])
+        while pending and released_at[pending[0]] <= now:
+            section_number = pending.pop(0)
+            heapq.heappush(ready, (rank[section_number], section_number))
+        _, section_number = heapq.heappop(ready)
+        heapq.heappush(slot_free_at, now + durations[section_number])
+    return max(slot_free_at)
+
+
+class SectionScheduler:
+    """Admits sections to a fixed number of slots, in arrival order or longest estimated section first."""
+
+    def __init__(self, concurrency: int, cost_model: SectionCostModel, policy: str = None):
+        policy = (policy or config.SECTION_SCHEDULING).lower()
+        if policy not in ("critical_path", "fifo"):
+            raise ValueError(f"Unknown section scheduling policy '{policy}'. Expected 'critical_path' or 'fifo'.")
+        self.concurrency = concurrency
+        self.cost_model = cost_model
+        self.policy = policy
+        self._free_slots = concurrency
+        self._waiting: Dict[str, asyncio.Future] = {}
+        # Places queued by `request` that the section's `slot` has not yet claimed.
+        self._requested: Dict[str, asyncio.Future] = {}
+        self._arrival: Dict[str, int] = {}
+        # When each section first asked for a slot.
+        self.arrived_at: Dict[str, float] = {}
+        self.start_order: List[str] = []
+        self.started_at: Dict[str, float] = {}
+        self.finished_at: Dict[str, float] = {}
+        # A section may take its slot several times (a section written in parts, once per consistency round).
+        self._held_since: Dict[str, float] = {}
+        self._held_seconds: Dict[str, float] = defaultdict(float)
+
+    @asynccontextmanager
+    async def slot(self, section_number: str):
+        """Waits until the section is admitted, and frees its slot when it finishes."""
+        await self._acquire(section_number)
+        try:
+            yield
+        finally:
+            self._release(section_number)
+
+    def request(self, section_number: str):
+        """
+        Queues a section for a slot now, from the calling task. Its `slot` then
+        waits for this place in the queue, so a section whose work starts in
+        tasks of its own is queued alongside the sections started with it.
+        """
+        if section_number not in self._requested:
+            self._requested[section_number] = self._enqueue(section_number)
+
+    def _enqueue(self, section_number: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+        self._waiting[section_number] = admitted
+        self._arrival.setdefault(section_number, len(self._arrival))
+        self.arrived_at.setdefault(section_number, time.monotonic())
+        # Deferred, so that all the sections started together are queued before the
+        # first is admitted, rather than the first to arrive taking a slot.
+        loop.call_soon(self._dispatch)
+        return admitted
+
+    async def _acquire(self, section_number: str):
+        admitted = self._requested.pop(section_number, None) or self._enqueue(section_number)
+        try:
+            await admitted
+        except asyncio.CancelledError:
+            if self._waiting.pop(section_number, None) is None and admitted.done() and not admitted.cancelled():
+                self._release(section_number)
+            raise
+
+    def _next_section(self) -> str:
+        if self.policy == "fifo":
+            return min(self._waiting, key=self._arrival.get)
+        return max(self._waiting, key=lambda section_number: (self.cost_model.estimate(section_number), -self._arrival[section_number]))
+
+    def _dispatch(self):
+        while self._free_slots > 0 and self._waiting:
+            section_number = self._next_section()
+            admitted = self._waiting.pop(section_number)
+            if admitted.done():
+                continue
+            self._free_slots -= 1
+            self._held_since[section_number] = time.monotonic()
+            if section_number not in self.started_at:
+                self.started_at[section_number] = self._held_since[section_number]
+                self.start_order.append(section_number)
+            logging.getLogger('LoopTracer').info(
+                f"Section {section_number} started ({self.policy} scheduling, "
+                f"estimated {self.cost_model.estimate(section_number):.1f}s)."
+            )
+            admitted.set_result(None)
+
+    def _release(self, section_number: str):
+        self.finished_at[section_number] = time.monotonic()
+        self._held_seconds[section_number] += self.finished_at[section_number] - self._held_since.pop(section_number)
+        self.cost_model.observe(section_number, self._held_seconds[section_number])
+        self._free_slots += 1
+        self._dispatch()
+
+    def durations(self) -> Dict[str, float]:
+        """Returns how long each finished section held its slot, in seconds."""
+        return dict(self._held_seconds)
+
+    def record_history(self, iterations: Dict[str, int], llm_usage: Dict[str, Dict[str, float]]):
+        """
+        Adds this run's duration, iterations and LLM usage of every finished
+        section to the cost history and saves it. Sub-sections ("3.2") hold
+        slots of their own, so each has its own history; that of their section
+        covers its consistency checks.
+        """
+        llm_usage = {str(section_number): totals for section_number, totals in llm_usage.items()}
+        # Re-read first, so the history saved by a case that finished since this run started is built on, not overwritten.
+        self.cost_model.history = SectionCostModel.load().history
+        self.cost_model.update_history({
+            section_number: {
+                "seconds": seconds,
+                "iterations": iterations.get(section_number, 0),
+                "prompt_tokens": llm_usage.get(section_number, {}).get("prompt_tokens", 0.0),
+                "completion_tokens": llm_usage.get(section_number, {}).get("completion_tokens", 0.0),
+                "llm_latency_seconds": llm_usage.get(section_number, {}).get("latency_seconds", 0.0),
+            }
+            for section_number, seconds in self.durations().items()
+        })
+        try:
+            self.cost_model.save()
+        except OSError as e:
+            logging.warning(f"Section history could not be saved to '{config.SECTION_HISTORY_PATH}'. Reason: {e}")
+
+    def makespan_report(self) -> Dict[str, object]:
+        """
+        Returns the makespan achieved, and the makespans of this run's start
+        order and of FIFO order when both are simulated from the same section
+        durations, release times and number of slots. A section's release
+        time is when it first asked for a slot, so waits on extraction and on
+        sub-sections are the same in both simulations.
+        """
+        durations = self.durations()
+        if not durations:
+            return {}
+        first_arrival = min(self.arrived_at.values())
+        released_at = {section_number: self.arrived_at[section_number] - first_arrival for section_number in durations}
+        start_order = [section_number for section_number in self.start_order if section_number in durations]
+        fifo_order = sorted(durations, key=self._arrival.get)
+        return {
+            "policy": self.policy,
+            "start_order": start_order,
+            "section_seconds": {section_number: round(seconds, 3) for section_number, seconds in durations.items()},
+            "makespan_seconds": round(max(self.finished_at.values()) - first_arrival, 3),
+            "simulated_makespan_seconds": round(_list_schedule_makespan(start_order, released_at, durations, self.concurrency), 3),
+            "fifo_makespan_seconds": round(_list_schedule_makespan(fifo_order, released_at, durations, self.concurrency), 3),
+        }
+
+
+# Each case run by `run_case_async` has its own scheduler and its own CONCURRENT_SECTIONS slots.
+_section_scheduler: contextvars.ContextVar[SectionScheduler | None] = contextvars.ContextVar("section_scheduler", default=None)
+
+
+def get_section_scheduler() -> SectionScheduler | None:
+    """Returns the current run's section scheduler, or None if it has not been created."""
+    return _section_scheduler.get()
+
+
+def create_section_scheduler() -> SectionScheduler:
+    """Creates the current run's section scheduler, with the cost history from `SECTION_HISTORY_PATH`."""
+    section_scheduler = SectionScheduler(config.CONCURRENT_SECTIONS, SectionCostModel.load())
+    _section_scheduler.set(section_scheduler)
+    return section_scheduler
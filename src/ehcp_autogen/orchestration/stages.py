@@ -0,0 +1,168 @@
+"""
+stages.py
+
+This module runs the stages of a run as a dependency graph rather than in
+fixed phases.
+
+A run used to proceed strictly in phases: every PDF was pre-processed before
+any section started, and every section finished before the merge. A section
+only needs the sources left after its `source_exclude_files` are applied, so
+section 3, which excludes `Appendix A.pdf`, had to wait for the appendix's
+extraction all the same. `main_async` now declares each unit of work as a
+stage of a `StageGraph`, with the stages it depends on:
+- `extract:<pdf>` for each source PDF, reported as each document is
+  pre-processed;
+- `section:<n>`, which depends on the extraction of the documents the section
+  uses, so it starts as soon as they are ready;
+- `merge`, which depends on every section, and `render`, which depends on the
+  merge.
+
+A stage starts as soon as all of its dependencies have succeeded, and is
+skipped if any of them failed. With `STAGE_SCHEDULING=phased` every section
+also depends on the whole pre-processing stage, as before.
+
+The graph records when each stage became ready, started and finished.
+`critical_path` walks back from the last stage to finish, each time through
+the dependency that finished last, which gives the chain of stages that set
+the run's wall-clock time.
+
+The graph belongs to the run that created it: it is held in a context
+variable, so each case that `main_async` runs side by side (one `run_case_async`
+task per case) has its own.
+"""
+
+import time
+import asyncio
+import logging
+import contextvars
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple
+
+
+@dataclass
+class StageRecord:
+    """When one stage became ready, started and finished, and how it ended."""
+    name: str
+    depends_on: Tuple[str, ...]
+    status: str = "pending"
+    ready_at: float | None = None
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    @property
+    def seconds(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+class StageGraph:
+    """Starts each stage of a run as soon as the stages it depends on have succeeded."""
+
+    def __init__(self):
+        self.created_at = time.monotonic()
+        self.stages: Dict[str, StageRecord] = {}
+        self._outcomes: Dict[str, asyncio.Future] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def add_stage(self, name: str, run: Callable[[], Awaitable[bool]] = None, depends_on: Iterable[str] = ()):
+        """
+        Adds a stage. `run` is started as soon as every stage in `depends_on` has
+        succeeded, and the stage succeeds if it returns True. A stage without
+        `run` is carried out elsewhere and reported with `finish_stage`.
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' has already been added.")
+        record = StageRecord(name, tuple(depends_on))
+        self.stages[name] = record
+        self._outcomes[name] = asyncio.get_running_loop().create_future()
+        if run is not None:
+            self._tasks.append(asyncio.create_task(self._run_stage(record, run), name=f"stage:{name}"))
+
+    def finish_stage(self, name: str, succeeded: bool, started_at: float = None):
+        """Reports the outcome of a stage carried out outside the graph. Later reports are ignored."""
+        record = self.stages[name]
+        if self._outcomes[name].done():
+            return
+        record.finished_at = time.monotonic()
+        record.ready_at = record.ready_at or self.created_at
+        record.started_at = started_at or record.finished_at
+        record.status = "succeeded" if succeeded else "failed"
+        self._outcomes[name].set_result(succeeded)
+
+    def is_finished(self, name: str) -> bool:
+        return self._outcomes[name].done()
+
+    async def _run_stage(self, record: StageRecord, run: Callable[[], Awaitable[bool]]):
+        dependencies_succeeded = all(await asyncio.gather(*(self._outcomes[name] for name in record.depends_on)))
+        record.ready_at = time.monotonic()
+        if not dependencies_succeeded:
+            record.status = "skipped"
+            self._outcomes[record.name].set_result(False)
+            return
+
+        record.status = "running"
+        record.started_at = time.monotonic()
+        try:
+            succeeded = bool(await run())
+        except Exception as e:
+            logging.critical(f"Stage '{record.name}' failed with an unexpected error: {e}", exc_info=True)
+            succeeded = False
+        record.finished_at = time.monotonic()
+        record.status = "succeeded" if succeeded else "failed"
+        logging.getLogger('LoopTracer').info(f"Stage {record.name} {record.status} after {record.seconds:.2f}s.")
+        self._outcomes[record.name].set_result(succeeded)
+
+    async def run(self) -> Dict[str, bool]:
+        """Waits for every stage to finish and returns whether each succeeded."""
+        await asyncio.gather(*self._tasks)
+        return {name: outcome.result() for name, outcome in self._outcomes.items() if outcome.done()}
+
+    def critical_path(self) -> List[StageRecord]:
+        """The chain of stages, ending with the last to finish, that each waited on the one before."""
+        finished = [record for record in self.stages.values() if record.finished_at is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda record: record.finished_at)]
+        while True:
+            dependencies = [self.stages[name] for name in path[-1].depends_on if self.stages[name].finished_at is not None]
+            if not dependencies:
+                break
+            path.append(max(dependencies, key=lambda record: record.finished_at))
+        return path[::-1]
+
+    def report(self) -> Dict[str, object]:
+        """Returns each stage's timings, relative to the creation of the graph, and the critical path."""
+        def _offset(moment: float | None) -> float | None:
+            return round(moment - self.created_at, 3) if moment is not None else None
+
+        finished_at = [record.finished_at for record in self.stages.values() if record.finished_at is not None]
+        return {
+            "makespan_seconds": _offset(max(finished_at)) if finished_at else 0.0,
+            "stages": {
+                name: {
+                    "status": record.status,
+                    "ready_at": _offset(record.ready_at),
+                    "started_at": _offset(record.started_at),
+                    "finished_at": _offset(record.finished_at),
+                    "seconds": round(record.seconds, 3),
+                }
+                for name, record in self.stages.items()
+            },
+            "critical_path": [record.name for record in self.critical_path()],
+        }
+
+
+_stage_graph: contextvars.ContextVar[StageGraph | None] = contextvars.ContextVar("stage_graph", default=None)
+
+
+def get_stage_graph() -> StageGraph | None:
+    """Returns the current run's stage graph, or None if it has not been created."""
+    return _stage_graph.get()
+
+
+def create_stage_graph() -> StageGraph:
+    """Creates the current run's stage graph. Must be called from the running event loop."""
+    stage_graph = StageGraph()
+    _stage_graph.set(stage_graph)
+    return stage_graph
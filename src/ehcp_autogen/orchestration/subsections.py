@@ -0,0 +1,118 @@
+"""
+subsections.py
+
+This module splits a large section into sub-sections that are written and
+validated in parallel, and puts them back together.
+
+Section 3 is the longest section. It holds six need categories, each with up
+to ten needs with their provision and outcomes, so one draft, and every
+correction of it, is a long generation. A section that lists "subsections" in
+`get_section_config` is instead processed as one sub-section per entry:
+"3.1" for `## Communication & Interaction`, "3.2" for `## Cognition &
+Learning`, and so on. `process_subsections_async` in `orchestrator.py` runs
+each sub-section through its own Write-Validate-Refine loop, all at the same
+time, then:
+- `assemble_subsections` joins the sub-sections' final drafts, in the order
+  of the section's structure, into the section's `output_sN_iK.md`;
+- `find_cross_subsection_issues` checks the assembled parts against one
+  another deterministically (a need recorded under two headings), and
+  `run_consistency_check_async` in `tasks.py` adds an LLM review of the
+  consistency between them;
+- `attribute_issues` assigns each issue found to the sub-section whose draft
+  must change, so that only those sub-sections are corrected before the
+  section is assembled and checked again.
+
+Sub-section drafts are saved as `output_sN.M_iK.md`, a name that
+`merge_output_files_async` ignores, so only the assembled section is merged
+into the final document.
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, List
+
+from .. import config
+from ..utils.utils import iter_markdown_fields, _sanitise_key
+
+_HEADING_PATTERN = re.compile(r"^##\s+(.+?)\s*#*\s*$", re.MULTILINE)
+_NEED_LABEL_PATTERN = re.compile(r"\bNeed\s+\d+$", re.IGNORECASE)
+
+
+def get_subsection_numbers(section_number: str) -> List[str]:
+    """
+    Returns the sub-section numbers of a section that is generated in parts
+    ("3.1", "3.2", ...), or an empty list if it is generated as one document.
+    """
+    if config.SUBSECTION_GENERATION.lower() != "parallel":
+        return []
+    headings = config.get_section_config(section_number).get("subsections", [])
+    return [f"{section_number}.{index}" for index in range(1, len(headings) + 1)]
+
+
+def _heading(subsection_number: str) -> str:
+    return config.get_section_config(subsection_number)["heading"]
+
+
+def _normalise(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def assemble_subsections(drafts: Dict[str, str]) -> str:
+    """
+    Joins sub-section drafts, given in section order, into one section draft.
+
+    Anything a writer put before its sub-section's heading is dropped, and a
+    draft that lacks its heading is given it, so the assembled document always
+    has every heading of the section exactly once and in order.
+    """
+    parts = []
+    for subsection_number, draft in drafts.items():
+        heading = _heading(subsection_number)
+        match = next((match for match in _HEADING_PATTERN.finditer(draft) if _normalise(match.group(1)) == _normalise(heading)), None)
+        body = draft[match.end():] if match else draft
+        parts.append(f"## {heading}\n{body.strip()}")
+    return "\n\n".join(parts) + "\n"
+
+
+def find_cross_subsection_issues(drafts: Dict[str, str]) -> Dict[str, List[Dict[str, str]]]:
+    """
+    Finds needs recorded, word for word, under more than one heading. Under the
+    section 3 validation guidance each is a STANDARD issue, reported on every
+    occurrence after the first.
+    """
+    issues = {"critical": [], "standard": []}
+    first_seen: Dict[str, tuple] = {}
+    for subsection_number, draft in drafts.items():
+        for label, value in iter_markdown_fields(draft):
+            if not _NEED_LABEL_PATTERN.search(label) or not _normalise(value):
+                continue
+            earlier = first_seen.setdefault(_normalise(value), (subsection_number, label))
+            if earlier[0] != subsection_number:
+                issues["standard"].append({
+                    "field": label,
+                    "text": f"The same need is already recorded as `**{earlier[1]}:**` under `## {_heading(earlier[0])}`. A need must be placed under one heading only.",
+                })
+    return issues
+
+
+def attribute_issues(issues: Dict[str, List[Dict[str, str]]], drafts: Dict[str, str]) -> Dict[str, Dict[str, List[Dict[str, str]]]]:
+    """
+    Assigns each issue from a consistency check to the sub-sections that must
+    be corrected for it: the sub-section whose draft has the issue's field, or
+    failing that every sub-section whose heading the issue names, or failing
+    that all of them. Returns {sub-section number: issues} for the
+    sub-sections given at least one critical issue.
+    """
+    owners = {_sanitise_key(label): subsection_number for subsection_number, draft in drafts.items() for label, _ in iter_markdown_fields(draft)}
+    attributed = defaultdict(lambda: {"critical": [], "standard": []})
+    for severity, severity_issues in issues.items():
+        for issue in severity_issues:
+            owner = owners.get(_sanitise_key(issue["field"])) if issue["field"] else None
+            if owner:
+                targets = [owner]
+            else:
+                text = _normalise(issue["text"])
+                targets = [number for number in drafts if _normalise(_heading(number)) in text] or list(drafts)
+            for subsection_number in targets:
+                attributed[subsection_number][severity].append(issue)
+    return {number: attributed[number] for number in drafts if attributed[number]["critical"]}
@@ -10,87 +10,380 @@ single, coherent prompt. By centralising prompt construction here, the main
 orchestration logic in `orchestrator.py` remains clean and focused on workflow
 management rather than prompt engineering.
 
+Every task prompt is laid out by `assemble_task_prompt`: the stable guidance
+and source content first, then the per-call instructions, so that the
+provider's prompt cache can reuse the long shared prefix. The teams and
+agents that run the tasks are leased from the process's agent pool
+(`agents/agent_pool.py`) rather than built for each call.
+
 The module provides functions to create tasks for:
 - Initial document creation (`get_creation_task`).
-- Document correction/revision (`get_correction_task`).
-- Kicking off the validation process (`run_validation_async`).
+- Document correction/revision (`get_correction_task`), or field-level
+  patches to the previous draft (`get_patch_correction_task`).
+- Kicking off the validation process (`run_validation_async`), including
+  repairing a feedback report the team failed to submit, or
+  re-checking only the fields changed since the previous iteration
+  (`run_incremental_validation_async`).
+- Reporting structural failures found by the deterministic pre-validator
+  without running the validator team (`run_prevalidation_async`).
+- Checking a section assembled from sub-sections for consistency between
+  its parts (`run_consistency_check_async`).
 """
 
+import re
 import logging
-from .agents.validator import create_validator_team
+from .agents.validator import create_validator_team, create_fact_checker_agent, create_report_repair_agent
+from .agents.agent_pool import get_agent_pool
 from . import config
-from .utils.utils import read_guidance_files_async
+from .utils.utils import (
+    read_guidance_files_async,
+    download_blob_as_text_async,
+    upload_blob_async,
+    plan_incremental_validation,
+    parse_field_verdicts,
+    format_feedback_report,
+)
+from .utils.prevalidation import get_prevalidator
+from .llm.telemetry import set_call_tags
+from .utils.feedback import (
+    FeedbackReport,
+    FeedbackReportCollector,
+    render_feedback_report,
+    parse_feedback_report_json,
+    record_report_outcome,
+)
 
 
-async def get_creation_task(section_number: str, output_blob_name: str, source_content: str) -> str:
+async def get_section_retrieval_query(section_number: str) -> str:
+    """
+    Builds the query used to retrieve section-relevant source chunks. The field
+    labels and headings from the section's structure are repeated so that they
+    outweigh the general wording of the guidance.
+    """
+    paths = config.get_section_config(section_number)
+    guidance_content = await read_guidance_files_async(paths["writer_guidance"])
+    labels = re.findall(r"^\s*(?:\*\*(.+?):?\*\*|#+\s+(.+))", guidance_content, re.MULTILINE)
+    label_text = " ".join(label or heading for label, heading in labels)
+    return " ".join([label_text] * 3 + [guidance_content])
+
+def _is_direct_writer(writer_engine: str = None) -> bool:
+    """True when the task will be answered by the Document_Writer alone rather than the writer team."""
+    return (writer_engine or config.WRITER_ENGINE).lower() == "direct"
+
+def _subsection_scope(section_number: str, validation: bool = False) -> str:
+    """The instruction that confines a sub-section's task to its own heading, or "" for a whole section."""
+    heading = config.get_section_config(section_number).get("heading")
+    if not heading:
+        return ""
+    section = str(section_number).split(".")[0]
+    if validation:
+        return f"Section '{section}' is written in parts. This document is the part under the `## {heading}` heading only, so the other headings of the structure must not be reported as missing.\n"
+    return f"Section '{section}' is written in parts. Write ONLY the `## {heading}` heading and its fields, as the structure requires them; the other headings are written separately.\n"
+
+def assemble_task_prompt(guidance_content: str, source_content: str, task_instructions: str) -> str:
+    """
+    Lays out a task prompt for provider-side prefix caching.
+
+    Azure OpenAI reuses the longest previously seen prompt prefix, so everything
+    that is stable for a section comes first and in a fixed order: the guidance
+    bundle, then the source corpus. Only `task_instructions` (section number,
+    blob names, revision request, previous draft) varies between calls, and it
+    always comes last. Creation and correction prompts therefore share one cached
+    prefix, as do the validation prompts of every iteration.
+    """
+    return (
+        "Your full instructions and rules are provided below:\n"
+        f"{guidance_content}\n"
+        "Here is the full content of all relevant source documents:\n"
+        f"{source_content}\n"
+        "--- TASK ---\n"
+        f"{task_instructions.strip()}\n"
+    )
+
+async def get_creation_task(section_number: str, output_blob_name: str, source_content: str, writer_engine: str = None) -> str:
     """Asynchronously generates the initial creation task prompt."""
     paths = config.get_section_config(section_number) 
     guidance_content = await read_guidance_files_async(paths["writer_guidance"])
-    
-    return f"""
-    Your task is to generate the summary document for section '{section_number}'.
-    Your full instructions and rules are provided below:
-    {guidance_content}
-    Here is the full content of all relevant source documents needed for this task:
-    {source_content}
-    Once completed, you must save your completed document by calling `upload_blob_async` with container '{config.OUTPUT_BLOB_CONTAINER}' and blob name '{output_blob_name}'.
-    The Planner must now create a plan.
-    """
-
-async def get_correction_task(section_number: str, previous_draft: str, revision_request: str, output_blob_name: str, source_content: str) -> str:
+
+    if _is_direct_writer(writer_engine):
+        # The orchestrator saves the reply itself, so there is no save step or plan.
+        closing_instructions = "Respond with the complete document only. It will be saved for you."
+    else:
+        closing_instructions = f"""Once completed, you must save your completed document by calling `upload_blob_async` with container '{config.OUTPUT_BLOB_CONTAINER}' and blob name '{output_blob_name}'.
+The Planner must now create a plan."""
+
+    task_instructions = f"""
+Your task is to generate the summary document for section '{section_number}', following the instructions and rules above and using the source documents above.
+{_subsection_scope(section_number)}{closing_instructions}
+"""
+    return assemble_task_prompt(guidance_content, source_content, task_instructions)
+
+async def get_correction_task(section_number: str, previous_draft: str, revision_request: str, output_blob_name: str, source_content: str, writer_engine: str = None) -> str:
     """Asynchronously generates the correction task prompt."""
     paths = config.get_section_config(section_number) 
     guidance_content = await read_guidance_files_async(paths["writer_guidance"])
 
-    return f"""
-    The document for section '{section_number}' requires revision. Your general guidance is below:
-    {guidance_content}
+    if _is_direct_writer(writer_engine):
+        closing_instructions = "Respond with the complete revised document only. It will be saved for you."
+    else:
+        closing_instructions = f"**To the Planner:** Ensure the revised text is saved to blob '{output_blob_name}' in container '{config.OUTPUT_BLOB_CONTAINER}' and then terminate."
 
-    Here is the full content of all relevant source documents needed for this task:
-    {source_content}
+    task_instructions = f"""
+The document for section '{section_number}' requires revision, following the instructions and rules above and using the source documents above.
+{_subsection_scope(section_number)}
+**To the Document_Writer:** You are not starting from scratch. Apply the instructions in the [REVISION_REQUEST] block to the [PREVIOUS_DRAFT] provided below. Preserve all correct information and only change what is requested.
 
-    **To the Document_Writer:** You are not starting from scratch. Apply the instructions in the [REVISION_REQUEST] block to the [PREVIOUS_DRAFT] provided below. Preserve all correct information and only change what is requested.
+{revision_request}
 
-    {revision_request}
+[PREVIOUS_DRAFT]
+{previous_draft}
 
-    [PREVIOUS_DRAFT]
-    {previous_draft}    
-    
-    **To the Planner:** Ensure the revised text is saved to blob '{output_blob_name}' in container '{config.OUTPUT_BLOB_CONTAINER}' and then terminate.
-    
+{closing_instructions}
+"""
+    return assemble_task_prompt(guidance_content, source_content, task_instructions)
+
+async def get_patch_correction_task(section_number: str, previous_draft: str, revision_request: str, source_content: str) -> str:
     """
+    Asynchronously generates a correction task that asks the Document_Writer for
+    field-level edits to the previous draft rather than the whole document. It
+    shares the creation task's guidance and source prefix.
+    """
+    paths = config.get_section_config(section_number)
+    guidance_content = await read_guidance_files_async(paths["writer_guidance"])
+
+    task_instructions = f"""
+The document for section '{section_number}' requires revision, following the instructions and rules above and using the source documents above.
+{_subsection_scope(section_number)}
+**To the Document_Writer:** You are not starting from scratch. Apply the instructions in the [REVISION_REQUEST] block to the [PREVIOUS_DRAFT] provided below, but do not repeat the document. Respond ONLY with a [FIELD_EDITS] block containing one `**Key:** value` entry for each field that must change:
+- Use the exact `**Key:**` label from the previous draft.
+- Give the complete new value of the field; it replaces the old value entirely.
+- Leave out every field that does not change.
+- End the block with [END_FIELD_EDITS].
+If the revision requires adding, removing or renaming fields or headings, respond with the single word FULL_REWRITE instead.
+
+{revision_request}
+
+[PREVIOUS_DRAFT]
+{previous_draft}
+"""
+    return assemble_task_prompt(guidance_content, source_content, task_instructions)
 
-async def run_validation_async(section_number: str, llm_config: dict, llm_config_fast: dict, output_blob_name: str, feedback_blob_name: str, source_content: str):
+async def run_validation_async(section_number: str, llm_config: dict, llm_config_fast: dict, output_blob_name: str, feedback_blob_name: str, source_content: str) -> str | None:
     """
     Asynchronously runs the validator team for a section.
+
+    The Quality_Assessor's structured report is saved as `feedback_blob_name`
+    (rendered as markdown) and alongside it as JSON, and the markdown report is
+    returned. If the team ends without an accepted report, only the report step
+    is repaired; the team is run again only if it produced no findings at all.
+    Returns None if no report could be obtained.
     """
 
     logging.info(f"\n--- Kicking off Validator Team for Section {section_number} ---")
     paths = config.get_section_config(section_number)
     guidance_content = await read_guidance_files_async(paths["validation_guidance"])
 
-    validator_manager = create_validator_team(llm_config, llm_config_fast)
-    validator_proxy_agent = validator_manager.groupchat.agent_by_name("Validator_User_Proxy")
-
-    validator_task = f"""
-    You task is to validate the document '{output_blob_name}'. 
-    Your full isntructions and rules are below:
-    {guidance_content}
-    
-    Here is the full content of all relevant source documents you must use for validation:
-    {source_content}
-
-    **Workflow:**
-    1. Call `download_blob_as_text_async` on container '{config.OUTPUT_BLOB_CONTAINER}' to read '{output_blob_name}'.
-    2. The `Fact_Checker` will now perform its review using the source content provided above.
-    3. The `Quality_Assessor` will create the final report.
-    4. Call `upload_blob_async` on container '{config.OUTPUT_BLOB_CONTAINER}' to save the report as '{feedback_blob_name}'.
-    5. `Quality_Assessor` terminates.
-    Begin.
-    """
-    await validator_proxy_agent.a_initiate_chat(
-        recipient=validator_manager, 
-        message=validator_task, 
-        clear_history=True
+    task_instructions = f"""
+Your task is to validate the document '{output_blob_name}' for section '{section_number}', following the instructions and rules above and using the source documents above.
+{_subsection_scope(section_number, validation=True)}
+**Workflow:**
+1. Call `download_blob_as_text_async` on container '{config.OUTPUT_BLOB_CONTAINER}' to read '{output_blob_name}'.
+2. The `Fact_Checker` will now perform its review using the source content provided above.
+3. The `Quality_Assessor` will submit the final report with `submit_feedback_report`.
+4. `Quality_Assessor` terminates.
+Begin.
+"""
+    validator_task = assemble_task_prompt(guidance_content, source_content, task_instructions)
+
+    def _create_validator_team():
+        report_collector = FeedbackReportCollector()
+        return report_collector, create_validator_team(llm_config, llm_config_fast, report_collector)
+
+    report = None
+    for attempt in range(1, config.VALIDATOR_TEAM_ATTEMPTS + 1):
+        async with get_agent_pool().lease("validator_team", _create_validator_team) as (report_collector, validator_manager):
+            validator_proxy_agent = validator_manager.groupchat.agent_by_name("Validator_User_Proxy")
+            await validator_proxy_agent.a_initiate_chat(
+                recipient=validator_manager, 
+                message=validator_task, 
+                clear_history=True
+            )
+            report = report_collector.report
+            findings = _report_step_transcript(validator_manager.groupchat.messages) if report is None else ""
+        if report is not None:
+            record_report_outcome("submitted")
+            break
+
+        if findings:
+            logging.warning(f"Validator team did not submit a valid report for '{output_blob_name}'. Repairing the report step only.")
+            set_call_tags(stage="report_repair")
+            report = await _repair_feedback_report_async(llm_config_fast, findings)
+            if report is not None:
+                record_report_outcome("repaired")
+                break
+        logging.warning(f"No feedback report could be obtained for '{output_blob_name}' (team run {attempt} of {config.VALIDATOR_TEAM_ATTEMPTS}).")
+
+    if report is None:
+        record_report_outcome("missing")
+        return None
+
+    feedback_report = render_feedback_report(report)
+    await upload_blob_async(config.OUTPUT_BLOB_CONTAINER, feedback_blob_name, feedback_report)
+    await upload_blob_async(config.OUTPUT_BLOB_CONTAINER, re.sub(r"\.md$", ".json", feedback_blob_name), report.model_dump_json(indent=2))
+    return feedback_report
+
+def _report_step_transcript(messages: list) -> str:
+    """
+    Collects what the Fact_Checker found and what the Quality_Assessor tried to
+    submit, including any rejection of its submission. Returns "" if the
+    Fact_Checker never reported, as there is then nothing to build a report from.
+    """
+    if not any(message.get("name") == "Fact_Checker" and message.get("content") for message in messages):
+        return ""
+    parts = []
+    for message in messages:
+        name = message.get("name")
+        if name == "Fact_Checker" and message.get("content"):
+            parts.append(f"[FACT_CHECKER_FINDINGS]\n{message['content']}")
+        elif name == "Quality_Assessor":
+            for tool_call in message.get("tool_calls") or []:
+                parts.append(f"[ATTEMPTED_REPORT]\n{tool_call['function']['arguments']}")
+            if message.get("content") and message["content"].strip() != "TERMINATE":
+                parts.append(f"[QUALITY_ASSESSOR]\n{message['content']}")
+        for response in message.get("tool_responses") or []:
+            if (response.get("content") or "").startswith("Error:"):
+                parts.append(f"[REJECTION]\n{response['content']}")
+    return "\n\n".join(parts)
+
+async def _repair_feedback_report_async(llm_config: dict, findings: str) -> FeedbackReport | None:
+    """
+    Asks the Report_Repairer (in JSON mode) to restructure the team's findings
+    as a `FeedbackReport`, feeding back why each unusable reply was rejected.
+    """
+    messages = [{"role": "user", "content": f"Restructure these validation findings as a feedback report.\n\n{findings}"}]
+    for attempt in range(1, config.FEEDBACK_REPORT_REPAIR_ATTEMPTS + 1):
+        async with get_agent_pool().lease("report_repairer", lambda: create_report_repair_agent(llm_config)) as report_repairer:
+            reply = await report_repairer.a_generate_reply(messages=messages)
+        reply = reply.get("content", "") if isinstance(reply, dict) else str(reply or "")
+        try:
+            return parse_feedback_report_json(reply)
+        except ValueError as e:
+            # Covers both json.JSONDecodeError and pydantic's ValidationError.
+            logging.warning(f"Report_Repairer reply {attempt} was not a valid report: {e}")
+            messages += [
+                {"role": "assistant", "content": reply},
+                {"role": "user", "content": f"That reply was rejected: {e}\nRespond again with only the corrected JSON object."},
+            ]
+    return None
+
+
+async def run_prevalidation_async(section_number: str, output_blob_name: str, feedback_blob_name: str) -> tuple[dict | None, str | None]:
+    """
+    Runs the deterministic structure and formatting checks on a draft and
+    returns (the issues found, the feedback report saved). If any critical
+    check fails, the report is saved as `feedback_blob_name` and the validator
+    team does not need to run; otherwise no report is saved. Returns
+    (None, None) if pre-validation is disabled.
+    """
+    prevalidator = get_prevalidator()
+    if prevalidator is None:
+        return None, None
+    draft = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, output_blob_name)
+    issues = await prevalidator.check_async(section_number, draft)
+    if not issues["critical"]:
+        return issues, None
+
+    logging.info(f"Pre-validation found {len(issues['critical'])} critical structural issue(s) in '{output_blob_name}'. Skipping the validator team.")
+    feedback_report = format_feedback_report(issues, "Automated structure and formatting checks failed, so the content was not reviewed by the validator team.")
+    await upload_blob_async(config.OUTPUT_BLOB_CONTAINER, feedback_blob_name, feedback_report)
+    return issues, feedback_report
+
+async def run_incremental_validation_async(section_number: str, llm_config: dict, previous_draft: str, previous_feedback: str, output_blob_name: str, feedback_blob_name: str, source_content: str) -> str | None:
+    """
+    Validates only the fields of `output_blob_name` that changed since the
+    previous draft, and carries the previous verdicts forward for the rest.
+
+    The changed fields are sent to a standalone Fact_Checker, and the merged
+    feedback report, whose [FEEDBACK_SUMMARY] counts are computed from the
+    merged issue lists, is saved as `feedback_blob_name` and returned. Returns
+    None, without saving anything, when the draft must be validated in full
+    instead.
+    """
+    current_draft = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, output_blob_name)
+    plan = plan_incremental_validation(previous_draft, current_draft, previous_feedback)
+    if plan is None:
+        return None
+
+    logging.info(f"\n--- Incremental validation for Section {section_number}: {len(plan['changed_keys'])} changed field(s) ---")
+    verdicts = {"critical": [], "standard": []}
+    if plan["changed_keys"]:
+        paths = config.get_section_config(section_number)
+        guidance_content = await read_guidance_files_async(paths["validation_guidance"])
+        task_instructions = f"""
+Your task is to re-validate the fields of the document '{output_blob_name}' for section '{section_number}' that changed since the previous version, following the instructions and rules above and using the source documents above.
+{_subsection_scope(section_number, validation=True)}
+Every other field has already been validated and must not be reported on. The whole document is provided under [CURRENT_DOCUMENT] for context only, so that you can check the changed fields for consistency with the rest of it.
+
+Respond ONLY with a [FIELD_VERDICTS] block containing one line per issue found in the changed fields, in the form `- **Key:** CRITICAL: description` or `- **Key:** STANDARD: description`, using the exact label of the changed field. End the block with [END_FIELD_VERDICTS]. If the changed fields have no issues, the block must contain only the line ALL FACTS VERIFIED.
+
+[CHANGED_FIELDS]
+{plan["changed_fields"]}
+
+[CURRENT_DOCUMENT]
+{current_draft}
+"""
+        async with get_agent_pool().lease("fact_checker", lambda: create_fact_checker_agent(llm_config)) as fact_checker:
+            reply = await fact_checker.a_generate_reply(messages=[{"role": "user", "content": assemble_task_prompt(guidance_content, source_content, task_instructions)}])
+        reply = reply.get("content", "") if isinstance(reply, dict) else str(reply or "")
+        verdicts = parse_field_verdicts(reply)
+        if verdicts is None:
+            logging.warning(f"Fact_Checker did not return readable field verdicts for '{output_blob_name}'. Validating the whole draft.")
+            return None
+
+    issues = {severity: plan["carried_issues"][severity] + verdicts[severity] for severity in verdicts}
+    carried_count = sum(len(carried) for carried in plan["carried_issues"].values())
+    feedback_report = format_feedback_report(
+        issues,
+        f"Only the {len(plan['changed_keys'])} field(s) changed since the previous iteration were re-checked; "
+        f"{carried_count} issue(s) in unchanged fields were carried forward.",
     )
-    
\ No newline at end of file
+    await upload_blob_async(config.OUTPUT_BLOB_CONTAINER, feedback_blob_name, feedback_report)
+    return feedback_report
+
+async def run_consistency_check_async(section_number: str, llm_config: dict, output_blob_name: str, feedback_blob_name: str, source_content: str, known_issues: dict) -> str | None:
+    """
+    Checks a section assembled from sub-sections for consistency between its
+    parts, each of which has already been validated on its own.
+
+    A standalone Fact_Checker reviews the assembled document for issues that
+    only show across headings, and its verdicts are merged with `known_issues`
+    (found by the deterministic checks in `subsections.py`). The feedback
+    report is saved as `feedback_blob_name` and returned. Returns None, without
+    saving anything, if the Fact_Checker's verdicts cannot be read.
+    """
+    logging.info(f"\n--- Cross-sub-section consistency check for Section {section_number} ---")
+    paths = config.get_section_config(section_number)
+    guidance_content = await read_guidance_files_async(paths["validation_guidance"])
+    assembled_draft = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, output_blob_name)
+    task_instructions = f"""
+Your task is to check the document '{output_blob_name}' for section '{section_number}' for consistency between its headings, following the instructions and rules above and using the source documents above.
+
+Each heading was written and validated separately, so do not re-check each heading on its own. Report only issues between headings: a need recorded under more than one heading, or under a heading other than the one the categorisation guide requires; provision or outcomes under one heading that contradict those under another; an outcome shared by several needs that is not worded identically in each place; and facts stated differently under different headings.
+
+Respond ONLY with a [FIELD_VERDICTS] block containing one line per issue found, in the form `- **Key:** CRITICAL: description` or `- **Key:** STANDARD: description`, using the exact label of the field the issue should be corrected in. End the block with [END_FIELD_VERDICTS]. If the headings are consistent, the block must contain only the line ALL FACTS VERIFIED.
+
+[CURRENT_DOCUMENT]
+{assembled_draft}
+"""
+    async with get_agent_pool().lease("fact_checker", lambda: create_fact_checker_agent(llm_config)) as fact_checker:
+        reply = await fact_checker.a_generate_reply(messages=[{"role": "user", "content": assemble_task_prompt(guidance_content, source_content, task_instructions)}])
+    reply = reply.get("content", "") if isinstance(reply, dict) else str(reply or "")
+    verdicts = parse_field_verdicts(reply)
+    if verdicts is None:
+        logging.warning(f"Fact_Checker did not return readable consistency verdicts for '{output_blob_name}'.")
+        return None
+
+    issues = {severity: known_issues.get(severity, []) + verdicts[severity] for severity in verdicts}
+    feedback_report = format_feedback_report(issues, "The sub-sections were validated separately; only the consistency between them was checked.")
+    await upload_blob_async(config.OUTPUT_BLOB_CONTAINER, feedback_blob_name, feedback_report)
+    return feedback_report
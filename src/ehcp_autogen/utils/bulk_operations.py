@@ -0,0 +1,360 @@
+"""
+bulk_operations.py
+
+This module carries out storage operations on many blobs at once, for the end
+of a run.
+
+`archive_run_artifacts` keeps a copy of a run's artifacts (source documents,
+final and intermediate outputs, and the run's log files) in
+`ARCHIVE_BLOB_CONTAINER`. It used to copy one blob at a time and return as
+soon as each server-side copy had been started, so the cleanup that follows
+it could delete a blob the service was still copying. Now:
+- artifacts are copied `ARCHIVE_CONCURRENCY` at a time;
+- every copy is awaited until the service reports it complete (see
+  `AzureBlobStorage.copy`), and is verified against the size of its source.
+  A copy that fails or does not match is retried, up to
+  `ARCHIVE_COPY_ATTEMPTS` times;
+- the `ArchiveReport` returned lists any artifact that could not be archived,
+  by container, so the caller only clears the containers whose blobs are all
+  safely archived.
+
+With `ARCHIVE_MODE=bundle`, the artifacts are instead downloaded (with the same
+bound) and streamed into a single compressed tar, uploaded as
+`{run_id}/{run_timestamp}.tar.gz`: one blob per run attempt rather than one
+per artifact. The bundle is verified against the size of the uploaded blob.
+
+Both modes report the bytes archived and the throughput.
+
+`clear_blob_container_async` deletes a container's blobs, or only those under
+a prefix (e.g. one run's files). It used to send one delete per blob, all at
+once, which opened a connection per blob and tripped storage throttling on
+large containers, and it gave up on the first failure. Blobs are now deleted
+in batches of up to `BULK_DELETE_BATCH_SIZE` (one Blob Batch request each on
+Azure, which accepts at most 256), `BULK_DELETE_CONCURRENCY` batches at a
+time. Blobs that could not be deleted are retried with exponential backoff,
+and those still left are reported individually in the `DeleteReport`.
+
+Both work on the current run's blobs only (see `run_scope.py`): a run archives
+its own sources and outputs, under their logical names, and clearing a
+container deletes only the blobs under the run's prefix.
+"""
+
+import io
+import os
+import time
+import asyncio
+import tarfile
+import logging
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from .. import config
+from .storage import get_storage_backend
+from .utils import copy_blob_async, upload_blob_async, list_blobs_async, get_blob_read_cache
+from .run_scope import blob_prefix, scoped_blob_name, unscoped_blob_name
+
+# Stands for the run's local log files in an `ArchiveReport`.
+LOGS_SOURCE = "logs"
+
+
+def _archived_containers() -> Tuple[Tuple[str, str], ...]:
+    """The containers archived for a run, and the folder each is archived under."""
+    return (
+        (config.SOURCE_BLOB_CONTAINER, "source_docs"),
+        (config.FINAL_DOCUMENT_CONTAINER, "outputs"),
+        (config.OUTPUT_BLOB_CONTAINER, "outputs"),
+    )
+
+
+@dataclass
+class ArchiveReport:
+    """What was archived for a run, how fast, and what could not be."""
+    mode: str
+    blobs: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    # {container (or LOGS_SOURCE): names of the artifacts that could not be archived}
+    failed: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def is_verified(self, container_name: str) -> bool:
+        """Whether every artifact of a container was archived, so that it can be cleared."""
+        return not self.failed.get(container_name)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "mode": self.mode,
+            "blobs": self.blobs,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+            "bytes_per_second": round(self.bytes_per_second, 1),
+            "failed": {source: list(names) for source, names in self.failed.items() if names},
+        }
+
+
+async def _list_artifacts_async(run_id: str, run_timestamp: str, report: ArchiveReport) -> List[Tuple[str, str, str, int | None]]:
+    """
+    Returns (container or LOGS_SOURCE, logical name, archive path, size) for
+    every artifact of the run. A container that cannot be listed is reported as
+    failed. Log files are still being written to, so they have no size to be
+    verified against.
+    """
+    artifacts = []
+    for container_name, folder in _archived_containers():
+        prefix = blob_prefix(container_name)
+        try:
+            blob_sizes = await get_storage_backend(container_name).list_blob_sizes(container_name, prefix or None)
+        except Exception as e:
+            logging.error(f"Failed to list container '{container_name}' for archiving. Reason: {e}")
+            report.failed.setdefault(container_name, []).append("*")
+            continue
+        artifacts.extend((container_name, blob_name[len(prefix):], f"{folder}/{blob_name[len(prefix):]}", size) for blob_name, size in blob_sizes.items())
+    # Only the run's own logs (see `add_run_log_handlers`); the process's logs hold every case's lines.
+    for log_file in sorted(os.listdir(config.LOGS_DIR)):
+        if log_file.endswith(f"{run_timestamp}_{run_id}.log"):
+            artifacts.append((LOGS_SOURCE, log_file, f"logs/{log_file}", None))
+    return artifacts
+
+
+def _read_log_file(log_file: str) -> bytes:
+    with open(os.path.join(config.LOGS_DIR, log_file), "rb") as f:
+        return f.read()
+
+
+async def _read_artifact_async(source: str, name: str) -> bytes:
+    if source == LOGS_SOURCE:
+        return await asyncio.get_running_loop().run_in_executor(None, _read_log_file, name)
+    data, _ = await get_storage_backend(source).download(source, scoped_blob_name(source, name))
+    return data
+
+
+async def _archive_copies_async(run_id: str, artifacts: List[Tuple[str, str, str, int | None]], report: ArchiveReport):
+    """Copies each artifact to `{run_id}/{archive path}`, a bounded number at a time, verifying each copy."""
+    archive_container = config.ARCHIVE_BLOB_CONTAINER
+    semaphore = asyncio.Semaphore(config.ARCHIVE_CONCURRENCY)
+
+    async def _archive(source: str, name: str, archive_path: str, size: int | None):
+        dest_blob_name = f"{run_id}/{archive_path}"
+        async with semaphore:
+            for attempt in range(1, config.ARCHIVE_COPY_ATTEMPTS + 1):
+                if source == LOGS_SOURCE:
+                    try:
+                        data = await _read_artifact_async(source, name)
+                        await upload_blob_async(archive_container, dest_blob_name, data)
+                        copied_bytes = len(data)
+                    except Exception as e:
+                        logging.error(f"Failed to archive log file '{name}'. Reason: {e}")
+                        copied_bytes = None
+                else:
+                    copied_bytes = await copy_blob_async(source, name, archive_container, dest_blob_name)
+                if copied_bytes is not None and size in (None, copied_bytes):
+                    report.blobs += 1
+                    report.bytes += copied_bytes
+                    return
+                logging.warning(
+                    f"Archive copy of '{source}/{name}' (attempt {attempt} of {config.ARCHIVE_COPY_ATTEMPTS}) "
+                    f"{'failed' if copied_bytes is None else f'has {copied_bytes} bytes, expected {size}'}."
+                )
+        report.failed.setdefault(source, []).append(name)
+
+    await asyncio.gather(*(_archive(*artifact) for artifact in artifacts))
+
+
+async def _archive_bundle_async(run_id: str, run_timestamp: str, artifacts: List[Tuple[str, str, str, int | None]], report: ArchiveReport):
+    """Streams every artifact into one compressed tar and uploads it as `{run_id}/{run_timestamp}.tar.gz`."""
+    loop = asyncio.get_running_loop()
+    bundle_blob_name = f"{run_id}/{run_timestamp}.tar.gz"
+    # Bounds the artifacts downloaded but not yet written to the bundle.
+    ready: asyncio.Queue = asyncio.Queue(maxsize=config.ARCHIVE_CONCURRENCY)
+    semaphore = asyncio.Semaphore(config.ARCHIVE_CONCURRENCY)
+    archived = []
+
+    async def _fetch(source: str, name: str, archive_path: str, size: int | None):
+        async with semaphore:
+            for attempt in range(1, config.ARCHIVE_COPY_ATTEMPTS + 1):
+                try:
+                    data = await _read_artifact_async(source, name)
+                except Exception as e:
+                    logging.warning(f"Failed to read '{source}/{name}' for the archive bundle (attempt {attempt} of {config.ARCHIVE_COPY_ATTEMPTS}). Reason: {e}")
+                    continue
+                await ready.put((source, name, archive_path, data))
+                return
+        report.failed.setdefault(source, []).append(name)
+
+    def _add_member(bundle: tarfile.TarFile, archive_path: str, data: bytes):
+        member = tarfile.TarInfo(archive_path)
+        member.size = len(data)
+        member.mtime = int(time.time())
+        bundle.addfile(member, io.BytesIO(data))
+
+    with tempfile.SpooledTemporaryFile(max_size=config.ARCHIVE_BUNDLE_SPOOL_BYTES) as spool:
+        bundle = tarfile.open(fileobj=spool, mode="w:gz")
+        fetches = asyncio.gather(*(_fetch(*artifact) for artifact in artifacts))
+        try:
+            # Members are written one at a time, in the order they arrive, while
+            # the remaining artifacts are still being downloaded.
+            while not (fetches.done() and ready.empty()):
+                getter = asyncio.ensure_future(ready.get())
+                await asyncio.wait([getter, fetches], return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                source, name, archive_path, data = getter.result()
+                await loop.run_in_executor(None, _add_member, bundle, archive_path, data)
+                archived.append((source, len(data)))
+            await fetches
+        finally:
+            fetches.cancel()
+        await loop.run_in_executor(None, bundle.close)
+        bundle_bytes = spool.tell()
+        spool.seek(0)
+
+        # The bundle is uploaded from the spool as a stream, so a large bundle is never read into memory whole.
+        archive_backend = get_storage_backend(config.ARCHIVE_BLOB_CONTAINER)
+        try:
+            await archive_backend.upload_stream(config.ARCHIVE_BLOB_CONTAINER, bundle_blob_name, spool, bundle_bytes)
+            uploaded = await archive_backend.list_blob_sizes(config.ARCHIVE_BLOB_CONTAINER, bundle_blob_name)
+            verified = uploaded.get(bundle_blob_name) == bundle_bytes
+        except Exception as e:
+            logging.error(f"Failed to upload the archive bundle '{bundle_blob_name}'. Reason: {e}")
+            verified = False
+    if not verified:
+        for source, _ in archived:
+            report.failed.setdefault(source, []).append(bundle_blob_name)
+        return
+    report.blobs = len(archived)
+    report.bytes = sum(size for _, size in archived)
+    logging.info(f"Archive bundle '{bundle_blob_name}' uploaded: {len(archived)} artifacts, {bundle_bytes:,} bytes compressed.")
+
+
+async def archive_run_artifacts(run_id: str, run_timestamp: str, mode: str = None) -> ArchiveReport:
+    """
+    Archives a run's source documents, outputs and log files into the
+    run-archive container for auditing, and returns what was archived. Only
+    the containers the report verifies may be cleared afterwards.
+    """
+    mode = (mode or config.ARCHIVE_MODE).lower()
+    if mode not in ("copy", "bundle"):
+        raise ValueError(f"Unknown archive mode '{mode}'. Expected 'copy' or 'bundle'.")
+    logging.info(f"--- Archiving artifacts for Run ID: {run_id} ---")
+    report = ArchiveReport(mode)
+    start_time = time.monotonic()
+    try:
+        artifacts = await _list_artifacts_async(run_id, run_timestamp, report)
+        if mode == "bundle":
+            await _archive_bundle_async(run_id, run_timestamp, artifacts, report)
+        else:
+            await _archive_copies_async(run_id, artifacts, report)
+    except Exception as e:
+        logging.error(f"A critical error occurred during artifact archiving for Run ID {run_id}. Reason: {e}", exc_info=True)
+        for container_name, _ in _archived_containers():
+            report.failed.setdefault(container_name, []).append("*")
+    report.seconds = time.monotonic() - start_time
+
+    failed_count = sum(len(names) for names in report.failed.values())
+    logging.getLogger('LoopTracer').info(
+        f"Archived {report.blobs} artifacts ({report.bytes:,} bytes) for run {run_id} in {report.seconds:.2f}s "
+        f"({report.bytes_per_second / 1024 / 1024:.1f} MB/s, {mode} mode); {failed_count} not archived."
+    )
+    logging.info(f"--- Archiving for Run ID {run_id} complete. ---")
+    return report
+
+
+# ==============================================================================
+# BULK DELETE
+# ==============================================================================
+
+@dataclass
+class DeleteReport:
+    """What was deleted from a container, and why any blob could not be."""
+    container_name: str
+    deleted: int = 0
+    seconds: float = 0.0
+    # {blob name: reason it could not be deleted}
+    failed: Dict[str, str] = field(default_factory=dict)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "container": self.container_name,
+            "deleted": self.deleted,
+            "seconds": round(self.seconds, 3),
+            "failed": dict(self.failed),
+        }
+
+
+def _batches(blob_names: List[str], batch_size: int) -> List[List[str]]:
+    return [blob_names[start:start + batch_size] for start in range(0, len(blob_names), batch_size)]
+
+
+async def delete_blobs_async(container_name: str, blob_names: List[str]) -> DeleteReport:
+    """
+    Deletes blobs of one container, given by their logical names, in batches,
+    a bounded number of batches at a time, retrying those that could not be deleted.
+    """
+    report = DeleteReport(container_name)
+    start_time = time.monotonic()
+    backend = get_storage_backend(container_name)
+    semaphore = asyncio.Semaphore(config.BULK_DELETE_CONCURRENCY)
+    batch_size = min(config.BULK_DELETE_BATCH_SIZE, 256)
+
+    async def _delete_batch(batch: List[str]) -> Dict[str, str]:
+        async with semaphore:
+            try:
+                failures = await backend.delete_batch(container_name, [scoped_blob_name(container_name, blob_name) for blob_name in batch])
+                return {unscoped_blob_name(container_name, blob_name): reason for blob_name, reason in failures.items()}
+            except Exception as e:
+                # The whole request failed (e.g. throttled); every blob in it is retried.
+                return {blob_name: str(e) for blob_name in batch}
+
+    remaining = list(blob_names)
+    failures: Dict[str, str] = {}
+    for attempt in range(1, config.BULK_DELETE_ATTEMPTS + 1):
+        if attempt > 1:
+            await asyncio.sleep(config.BULK_DELETE_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 2))
+            logging.warning(f"Retrying the deletion of {len(remaining)} blob(s) from '{container_name}' (attempt {attempt} of {config.BULK_DELETE_ATTEMPTS}).")
+        failures = {}
+        for batch_failures in await asyncio.gather(*(_delete_batch(batch) for batch in _batches(remaining, batch_size))):
+            failures.update(batch_failures)
+        report.deleted += len(remaining) - len(failures)
+        remaining = [blob_name for blob_name in remaining if blob_name in failures]
+        if not remaining:
+            break
+    report.failed = {blob_name: failures[blob_name] for blob_name in remaining}
+    report.seconds = time.monotonic() - start_time
+
+    blob_cache = get_blob_read_cache()
+    if blob_cache is not None:
+        # Only the blobs asked for are dropped (by their names in storage), so the
+        # cached blobs of other runs in the container stay cached. Dropping one
+        # that could not be deleted costs, at worst, a re-read.
+        blob_cache.invalidate_many(container_name, [scoped_blob_name(container_name, blob_name) for blob_name in blob_names])
+    return report
+
+
+async def clear_blob_container_async(container_name: str, name_starts_with: str = None) -> DeleteReport:
+    """
+    Deletes every blob of the current run in a container, or only those whose
+    names start with `name_starts_with`, and returns what was deleted. Each
+    blob that could not be deleted is logged with its reason.
+    """
+    scoped_prefix = scoped_blob_name(container_name, name_starts_with or "")
+    scope = f"'{container_name}'" + (f" under '{scoped_prefix}'" if scoped_prefix else "")
+    logging.info(f"--- Starting cleanup of blob container {scope} ---")
+    blob_names = await list_blobs_async(container_name, name_starts_with)
+    if not blob_names:
+        logging.info(f"Container {scope} is already empty. No cleanup needed.")
+        return DeleteReport(container_name)
+
+    logging.info(f"Found {len(blob_names)} blobs to delete in container {scope}.")
+    report = await delete_blobs_async(container_name, blob_names)
+    for blob_name, reason in report.failed.items():
+        logging.error(f"Failed to delete blob '{container_name}/{blob_name}'. Reason: {reason}")
+    logging.info(
+        f"--- Cleanup of container {scope} complete: {report.deleted} deleted in {report.seconds:.2f}s, "
+        f"{len(report.failed)} could not be deleted. ---"
+    )
+    return report
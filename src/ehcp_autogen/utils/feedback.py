@@ -0,0 +1,135 @@
+"""
+feedback.py
+
+This module defines the structured feedback report that the validator team's
+Quality_Assessor submits.
+
+Instead of writing the markdown report itself, the Quality_Assessor calls the
+`submit_feedback_report` tool with a `FeedbackReport`: an overall status, a
+one-sentence assessment and a list of issues, each with its severity, the field
+it concerns and the source document it relies on. The report is checked against
+this schema before it is accepted. A report that does not fit (a missing
+severity, say, or a FAIL with no critical issue) is rejected with the reason,
+and the Quality_Assessor corrects just that tool call.
+
+An accepted report is rendered by `render_feedback_report` into the standard
+markdown report, so its [FEEDBACK_SUMMARY] counts always match its issue lists.
+`run_validation_async` in `tasks.py` saves both the markdown and the JSON, and
+repairs a report that could not be collected from the team.
+"""
+
+import re
+import json
+from collections import Counter
+from typing import Annotated, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from .utils import format_feedback_report
+
+
+class FeedbackIssue(BaseModel):
+    """One issue found in a draft."""
+    severity: Literal["critical", "standard"] = Field(description="'critical' for an issue that makes the document unusable, otherwise 'standard'.")
+    field: Optional[str] = Field(None, description="The bold label of the field the issue concerns, exactly as it appears in the document, or null if it concerns no single field.")
+    description: str = Field(min_length=1, description="What is wrong and what the correct content is.")
+    source_reference: Optional[str] = Field(None, description="The source document (and page or heading, if known) that the issue relies on, or null.")
+
+    @field_validator("severity", mode="before")
+    @classmethod
+    def _normalise_severity(cls, value):
+        return value.strip().lower() if isinstance(value, str) else value
+
+    @field_validator("field", "source_reference", mode="before")
+    @classmethod
+    def _blank_to_none(cls, value):
+        if isinstance(value, str):
+            value = value.strip().strip("*").rstrip(":").strip()
+        return value or None
+
+
+class FeedbackReport(BaseModel):
+    """The Quality_Assessor's consolidated verdict on a draft."""
+    overall_status: Literal["PASS", "FAIL"] = Field(description="FAIL if there is at least one critical issue, otherwise PASS.")
+    assessment: str = Field(min_length=1, description="A one-sentence summary of the document's quality.")
+    issues: List[FeedbackIssue] = Field(description="Every issue found, critical and standard. Empty if there are none.")
+
+    @field_validator("overall_status", mode="before")
+    @classmethod
+    def _normalise_status(cls, value):
+        return value.strip().upper() if isinstance(value, str) else value
+
+    @model_validator(mode="after")
+    def _status_matches_issues(self):
+        has_critical = any(issue.severity == "critical" for issue in self.issues)
+        if (self.overall_status == "FAIL") != has_critical:
+            raise ValueError("overall_status must be FAIL if, and only if, at least one issue is critical.")
+        return self
+
+    def issues_by_severity(self) -> Dict[str, List[Dict[str, str]]]:
+        """Returns the issues in the shape used by `parse_feedback_issues`."""
+        issues = {"critical": [], "standard": []}
+        for issue in self.issues:
+            text = issue.description.strip()
+            if issue.source_reference:
+                text += f" (Source: {issue.source_reference})"
+            issues[issue.severity].append({"field": issue.field, "text": text})
+        return issues
+
+
+def render_feedback_report(report: FeedbackReport) -> str:
+    """Renders a structured report as the standard markdown feedback report."""
+    return format_feedback_report(report.issues_by_severity(), report.assessment)
+
+
+def parse_feedback_report_json(text: str) -> FeedbackReport:
+    """
+    Reads a `FeedbackReport` from a JSON reply, ignoring any code fence or text
+    around the object. Raises `ValueError` (or pydantic's `ValidationError`,
+    a subclass) if it cannot be read or does not fit the schema.
+    """
+    text = re.sub(r"^\s*```[a-zA-Z]*\n|\n```\s*$", "", text or "")
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("The reply does not contain a JSON object.")
+    data = json.loads(text[start:end + 1])
+    # The object may be the report itself, or the arguments of a tool call.
+    if isinstance(data, dict) and set(data) == {"report"}:
+        data = data["report"]
+    return FeedbackReport.model_validate(data)
+
+
+# Counts of how each validator run's report was obtained, for the run summary.
+_report_outcomes = Counter()
+
+
+def record_report_outcome(outcome: str):
+    """Records how a report was obtained: "submitted", "repaired" or "missing"."""
+    _report_outcomes[outcome] += 1
+
+
+def feedback_report_stats() -> Dict[str, int]:
+    return {outcome: _report_outcomes[outcome] for outcome in ("submitted", "repaired", "missing")}
+
+
+class FeedbackReportCollector:
+    """Receives the report that the Quality_Assessor submits through its `submit_feedback_report` tool."""
+
+    def __init__(self):
+        self.report: FeedbackReport | None = None
+
+        def submit_feedback_report(report: Annotated[FeedbackReport, "The complete, consolidated feedback report."]) -> str:
+            """Submits the final feedback report for the document under review. It is saved automatically."""
+            self.report = report
+            counts = Counter(issue.severity for issue in report.issues)
+            return (
+                f"Feedback report accepted ({report.overall_status}: {counts['critical']} critical, "
+                f"{counts['standard']} standard issue(s)). Reply TERMINATE."
+            )
+
+        # A plain function rather than a method, as AutoGen sets attributes on the tools it registers.
+        self.submit_feedback_report = submit_feedback_report
+
+    def reset(self):
+        """Forgets the last report, so a pooled validator team can collect the next one."""
+        self.report = None
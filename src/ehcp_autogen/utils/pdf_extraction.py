@@ -0,0 +1,51 @@
+"""
+pdf_extraction.py
+
+This module contains the CPU-bound PDF text extraction work used by the
+pre-processing pipeline (`preprocess_all_pdfs_async` in `utils.py`).
+
+Text extraction with `pypdf` is pure Python and holds the GIL, so running it
+on the event loop (or in a thread) stalls every other coroutine. Instead, the
+functions here are executed in a `ProcessPoolExecutor`. A large document is
+split into contiguous page ranges so that a single long report can use every
+available core, and the page texts are re-joined in page order so the result
+is identical to extracting the whole document in one pass.
+
+The functions in this module are deliberately free of application imports
+(config, Azure clients) so that they are cheap and safe to import in worker
+processes.
+"""
+
+import io
+import math
+from typing import List, Tuple
+
+import pypdf
+
+
+def count_pdf_pages(pdf_bytes: bytes) -> int:
+    """Returns the number of pages in a PDF. Runs inside a worker process."""
+    return len(pypdf.PdfReader(io.BytesIO(pdf_bytes)).pages)
+
+
+def extract_page_range(pdf_bytes: bytes, start: int, stop: int) -> str:
+    """
+    Extracts and concatenates the text of pages [start, stop) of a PDF.
+    Runs inside a worker process.
+    """
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    return "".join(reader.pages[i].extract_text() or "" for i in range(start, stop))
+
+
+def plan_page_ranges(page_count: int, max_workers: int, min_pages_per_task: int) -> List[Tuple[int, int]]:
+    """
+    Splits a document into contiguous page ranges, one per worker where possible.
+
+    Every task receives its own copy of the PDF bytes, so the number of ranges is
+    kept as small as possible while still occupying all workers. Short documents
+    are never split below `min_pages_per_task` pages.
+    """
+    if page_count <= 0:
+        return []
+    pages_per_task = max(math.ceil(page_count / max(max_workers, 1)), min_pages_per_task, 1)
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
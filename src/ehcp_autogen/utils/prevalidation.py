@@ -0,0 +1,263 @@
+"""
+prevalidation.py
+
+This module runs deterministic checks on a draft before it reaches the LLM
+validator team.
+
+Many failed validations are structural: a heading or field from the section's
+`_structure_sN.md` partial is missing or out of order, placeholder or
+conversational text has been left in, or a field that must be a paragraph has
+been written as a bulleted list. Each of these is a CRITICAL issue under the
+validation guidance, and each can be detected without a model.
+
+`compile_section_rules` turns a section's structure partial into the ordered
+lists of required headings and fields, and adds the field-level rules from the
+section's validation guidance (`_SECTION_RULES`) and the universal rules from
+`_validator_common_rules.md`. `check_draft` applies them and returns issues in
+the same shape as `parse_feedback_issues`, labelled with their field where
+there is one.
+
+When a draft fails a critical check, `run_prevalidation_async` in `tasks.py`
+writes the feedback report itself and the validator team is not run. Drafts
+that pass are validated by the LLM team as usual, so these checks only ever
+add failures that the team would also have reported.
+"""
+
+import re
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from .. import config
+from .utils import read_guidance_files_async, iter_markdown_fields, _sanitise_key
+
+# Field-level rules from each section's validation guidance that can be checked
+# mechanically (see instructions/validation_guidance_sN.md).
+_SECTION_RULES = {
+    "1": {
+        "required_values": ["Name", "Date of Birth", "Education setting"],
+        # At least one parent or carer must be named.
+        "required_one_of": [["Parent 1 Name", "Parent 2 Name"]],
+        "date_fields": ["Date of Birth"],
+    },
+    "2": {
+        "paragraph_fields": ["Child Views", "Family Views", "Interests", "Strengths", "Aspirations"],
+        "word_limits": {"History": 500, "Child Views": 500, "Family Views": 500, "Interests": 500, "Strengths": 500, "Aspirations": 500},
+    },
+}
+
+# The universal rules allow no more than this little content beyond the headers.
+MIN_CONTENT_CHARS = 50
+
+# A required heading, either on its own line or quoted in backticks in a numbered list.
+_STRUCTURE_HEADING_PATTERN = re.compile(r"^(?:\d+\.\s+)?`?##\s+([^`\n]+?)`?\s*$", re.MULTILINE)
+_STRUCTURE_FIELD_PATTERN = re.compile(r"^\*\*(.+?):\*\*\s*$", re.MULTILINE)
+# A field label quoted in backticks in the prose of a structure partial (section 3).
+_STRUCTURE_INLINE_FIELD_PATTERN = re.compile(r"`\*\*([^`*]+?):\*\*`")
+# Numbered labels ("Need 1") are examples of repeatable sets, which may be absent.
+_NUMBERED_LABEL_PATTERN = re.compile(r"\s\d+$")
+_DRAFT_HEADING_PATTERN = re.compile(r"^##\s+(.+?)\s*#*\s*$", re.MULTILINE)
+_BULLET_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+", re.MULTILINE)
+_DATE_PATTERN = re.compile(r"^\d{2}/\d{2}/\d{4}$")
+_PLACEHOLDER_PATTERN = re.compile(r"\[\s*INSERT\b", re.IGNORECASE)
+_CONVERSATIONAL_PATTERN = re.compile(
+    r"\b(?:information|details?)\s+(?:was\s+|were\s+|is\s+|are\s+)?not\s+(?:provided|available|stated|given)\b"
+    r"|\bnot\s+(?:provided|stated|mentioned)\s+in\s+the\s+source",
+    re.IGNORECASE,
+)
+_NOT_APPLICABLE_PATTERN = re.compile(r"^\s*n/?a\.?\s*$", re.IGNORECASE)
+_CITATION_PATTERN = re.compile(r"\[\s*Source\b[^\]]*\]", re.IGNORECASE)
+
+
+@dataclass
+class SectionRules:
+    """The mechanically checkable rules for one section."""
+    headings: List[str]
+    fields: List[str]
+    required_values: List[str] = field(default_factory=list)
+    required_one_of: List[List[str]] = field(default_factory=list)
+    date_fields: List[str] = field(default_factory=list)
+    paragraph_fields: List[str] = field(default_factory=list)
+    word_limits: Dict[str, int] = field(default_factory=dict)
+
+
+def _normalise_heading(heading: str) -> str:
+    heading = heading.replace("’", "'").replace("‘", "'").strip().rstrip(":").lower()
+    return " ".join(heading.split())
+
+
+def _per_heading_fields(structure: str, headings: List[str]) -> Dict[str, List[str]]:
+    """
+    Reads the fields of a partial that describes them per heading in prose,
+    quoting example labels in backticks (`**Social Care Strengths:**`). Each
+    unnumbered example label that starts with a heading gives a field suffix
+    ("Strengths") that every heading is required to have, in the order the
+    suffixes are first given.
+    """
+    suffixes = []
+    for label in _STRUCTURE_INLINE_FIELD_PATTERN.findall(structure):
+        label = label.strip()
+        if _NUMBERED_LABEL_PATTERN.search(label):
+            continue
+        for heading in headings:
+            if _normalise_heading(label).startswith(_normalise_heading(heading) + " "):
+                suffix = label[len(heading):].strip()
+                if suffix not in suffixes:
+                    suffixes.append(suffix)
+                break
+    return {heading: [f"{heading} {suffix}" for suffix in suffixes] for heading in headings}
+
+
+def parse_structure(structure: str) -> List[tuple]:
+    """
+    Reads a structure partial into its layout: a list of (heading, [field
+    labels]) in the required order. Fields listed before any heading are
+    grouped under None. A partial that lists its headings but gives their
+    fields only as examples in prose (section 3) has them read from there.
+    """
+    layout = [(None, [])]
+    for match in re.finditer(f"{_STRUCTURE_HEADING_PATTERN.pattern}|{_STRUCTURE_FIELD_PATTERN.pattern}", structure, re.MULTILINE):
+        heading, label = match.group(1), match.group(2)
+        if heading:
+            layout.append((heading.strip(), []))
+        else:
+            layout[-1][1].append(label.strip())
+    layout = [entry for entry in layout if entry[0] or entry[1]]
+    if layout and not any(labels for _, labels in layout):
+        fields = _per_heading_fields(structure, [heading for heading, _ in layout])
+        layout = [(heading, fields[heading]) for heading, _ in layout]
+    return layout
+
+
+_rules_by_section: Dict[str, SectionRules] = {}
+
+
+async def compile_section_rules(section_number: str) -> SectionRules:
+    """Builds (once per run) the rules for a section from its structure partial and validation guidance."""
+    section_number = str(section_number)
+    if section_number not in _rules_by_section:
+        section_config = config.get_section_config(section_number)
+        structure_path = section_config.get("structure")
+        structure = await read_guidance_files_async([structure_path]) if structure_path else ""
+        layout = parse_structure(structure)
+        if section_config.get("heading"):
+            # A sub-section's draft holds only its own heading of the section's structure.
+            layout = [(heading, labels) for heading, labels in layout if heading and _normalise_heading(heading) == _normalise_heading(section_config["heading"])]
+        if layout and not any(labels for _, labels in layout):
+            # The field-presence and field-order checks would silently pass every draft.
+            logging.warning(f"The structure of section {section_number} compiled to no fields; only its headings will be pre-validated.")
+        _rules_by_section[section_number] = SectionRules(
+            headings=[heading for heading, _ in layout if heading],
+            fields=[label for _, labels in layout for label in labels],
+            **_SECTION_RULES.get(section_number.split(".")[0], {}),
+        )
+    return _rules_by_section[section_number]
+
+
+def _out_of_order(required: List[str], present: List[str]) -> bool:
+    """True if the required items that are present do not appear in the required order."""
+    required_present = [item for item in required if item in present]
+    return [item for item in present if item in required] != required_present
+
+
+def check_draft(draft: str, rules: SectionRules) -> Dict[str, List[Dict[str, str]]]:
+    """
+    Applies a section's rules to a draft. Returns {"critical": [...], "standard": [...]},
+    each issue being {"field": label or None, "text": description}.
+    """
+    issues = {"critical": [], "standard": []}
+
+    def _report(severity: str, label: str | None, text: str):
+        issues[severity].append({"field": label, "text": text})
+
+    # --- Structure ---
+    draft_headings = [_normalise_heading(heading) for heading in _DRAFT_HEADING_PATTERN.findall(draft)]
+    required_headings = [_normalise_heading(heading) for heading in rules.headings]
+    for heading, normalised in zip(rules.headings, required_headings):
+        if normalised not in draft_headings:
+            _report("critical", None, f"The required heading `## {heading}` is missing.")
+    if _out_of_order(required_headings, draft_headings):
+        _report("critical", None, "The headings are not in the order required by the section structure.")
+
+    draft_fields = list(iter_markdown_fields(draft))
+    values = {_sanitise_key(label): value for label, value in draft_fields}
+    draft_keys = [_sanitise_key(label) for label, _ in draft_fields]
+    required_keys = [_sanitise_key(label) for label in rules.fields]
+    for label, key in zip(rules.fields, required_keys):
+        if key not in values:
+            _report("critical", None, f"The required field `**{label}:**` is missing.")
+    if _out_of_order(required_keys, draft_keys):
+        _report("critical", None, "The fields are not in the order required by the section structure.")
+
+    # --- Universal rules ---
+    content = _DRAFT_HEADING_PATTERN.sub("", draft)
+    content = re.sub(r"^\*\*.+?:\*\*", "", content, flags=re.MULTILINE)
+    content = re.sub(r"<!--.*?-->", "", content, flags=re.DOTALL)
+    if len("".join(content.split())) < MIN_CONTENT_CHARS:
+        _report("critical", None, f"The document has less than {MIN_CONTENT_CHARS} characters of content beyond its headers.")
+
+    for label, value in draft_fields:
+        if _PLACEHOLDER_PATTERN.search(value):
+            _report("critical", label, "Contains placeholder text such as `[INSERT]`.")
+        if _CONVERSATIONAL_PATTERN.search(value):
+            _report("critical", label, "Contains conversational text about missing information; the field must be left blank instead.")
+        elif _NOT_APPLICABLE_PATTERN.match(value):
+            _report("standard", label, "Contains \"N/A\"; the field must be left blank instead.")
+        if _CITATION_PATTERN.search(value):
+            _report("standard", label, "Contains an inline source citation.")
+
+    # --- Section-specific rules ---
+    labels = {_sanitise_key(label): label for label, _ in draft_fields}
+    for label in rules.required_values:
+        key = _sanitise_key(label)
+        if key in values and not values[key]:
+            _report("critical", labels[key], "This mandatory field is empty.")
+    for group in rules.required_one_of:
+        present = [_sanitise_key(label) for label in group if _sanitise_key(label) in values]
+        if present and not any(values[key] for key in present):
+            _report("critical", labels[present[0]], f"At least one of {', '.join(f'`**{label}:**`' for label in group)} must be filled.")
+    for label in rules.date_fields:
+        key = _sanitise_key(label)
+        if values.get(key) and not _DATE_PATTERN.match(values[key]):
+            _report("critical", labels[key], "The date must be in DD/MM/CCYY format.")
+    for label in rules.paragraph_fields:
+        key = _sanitise_key(label)
+        if values.get(key) and _BULLET_PATTERN.search(values[key]):
+            _report("critical", labels[key], "This field must be written as a paragraph, not a bulleted list.")
+    for label, limit in rules.word_limits.items():
+        key = _sanitise_key(label)
+        word_count = len(values.get(key, "").split())
+        if word_count > limit:
+            _report("critical", labels[key], f"This field has {word_count} words; it must not exceed {limit}.")
+
+    return issues
+
+
+class PreValidator:
+    """Runs the deterministic checks and counts the validator runs they made unnecessary."""
+
+    def __init__(self):
+        self.drafts_checked = 0
+        self.validator_runs_saved = 0
+
+    async def check_async(self, section_number: str, draft: str) -> Dict[str, List[Dict[str, str]]]:
+        rules = await compile_section_rules(section_number)
+        issues = check_draft(draft, rules)
+        self.drafts_checked += 1
+        if issues["critical"]:
+            self.validator_runs_saved += 1
+        return issues
+
+    def stats(self) -> Dict[str, int]:
+        return {"drafts_checked": self.drafts_checked, "validator_runs_saved": self.validator_runs_saved}
+
+
+_prevalidator: PreValidator | None = None
+
+
+def get_prevalidator() -> PreValidator | None:
+    """Returns the run's pre-validator, or None if pre-validation is disabled."""
+    global _prevalidator
+    if _prevalidator is None and config.PREVALIDATION_ENABLED:
+        _prevalidator = PreValidator()
+    return _prevalidator
@@ -0,0 +1,187 @@
+"""
+retrieval.py
+
+This module provides a local, dependency-free retrieval stage over the
+processed source documents.
+
+For large cases the concatenated source corpus dominates prompt size (and can
+exceed the model's context window), yet each section only needs a fraction of
+it. The functions here split every processed `.txt` source into overlapping
+chunks, build an in-memory BM25 keyword index over them once per run, and then
+select the chunks most relevant to a section's guidance and field labels up to
+a token budget.
+
+Every chunk keeps its provenance (file name and character offsets) and is
+rendered with an excerpt marker, so the Fact_Checker can still cite exactly
+where a fact came from.
+
+The index is used by `SourceCorpus.get_section_content_async` in `utils.py`
+according to `SOURCE_RETRIEVAL_MODE` in `config.py`, which builds one per
+distinct set of `source_exclude_files`, over the documents that set leaves.
+"""
+
+import re
+import math
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+# Rough characters-per-token ratio, used consistently for budgeting.
+CHARS_PER_TOKEN = 4
+
+# Very common words carry no retrieval signal and only slow scoring down.
+_STOPWORDS = frozenset("""
+a an and are as at be been but by for from has have he her his i if in into is it its of on or our she
+so than that the their them then there these they this to was we were which who will with you your
+""".split())
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximates the number of tokens in a string."""
+    return len(text) // CHARS_PER_TOKEN
+
+
+def tokenise(text: str) -> List[str]:
+    """Lower-cases text and splits it into index terms, dropping stopwords."""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in _STOPWORDS]
+
+
+@dataclass(frozen=True)
+class SourceChunk:
+    """A contiguous slice of one source document, with its provenance."""
+    filename: str
+    document_index: int
+    start: int
+    end: int
+    text: str
+
+
+def chunk_document(filename: str, document_index: int, text: str, chunk_chars: int, overlap_chars: int) -> List[SourceChunk]:
+    """
+    Splits a document into overlapping chunks of roughly `chunk_chars` characters.
+    Chunk boundaries are moved back to the nearest line break or space so that
+    words are not cut in half.
+    """
+    chunks = []
+    start = 0
+    text_length = len(text)
+    while start < text_length:
+        end = min(start + chunk_chars, text_length)
+        if end < text_length:
+            boundary = max(text.rfind("\n", start + chunk_chars // 2, end), text.rfind(" ", start + chunk_chars // 2, end))
+            if boundary > start:
+                end = boundary
+        chunk_text = text[start:end].strip()
+        if chunk_text:
+            chunks.append(SourceChunk(filename, document_index, start, end, chunk_text))
+        if end >= text_length:
+            break
+        start = max(end - overlap_chars, start + 1)
+    return chunks
+
+
+class BM25Index:
+    """An in-memory Okapi BM25 index over source chunks."""
+
+    def __init__(self, chunks: List[SourceChunk], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+
+        for chunk_id, chunk in enumerate(chunks):
+            terms = tokenise(chunk.text)
+            self._lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self._postings[term].append((chunk_id, frequency))
+
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        document_count = len(chunks)
+        self._idf = {
+            term: math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Tuple[str, str]], chunk_chars: int, overlap_chars: int) -> "BM25Index":
+        """Builds an index from (filename, text) pairs, preserving document order."""
+        chunks = []
+        for document_index, (filename, text) in enumerate(documents):
+            chunks.extend(chunk_document(filename, document_index, text, chunk_chars, overlap_chars))
+        return cls(chunks)
+
+    def score(self, query: str) -> Dict[int, float]:
+        """Returns a BM25 score for every chunk that shares at least one term with the query."""
+        scores: Dict[int, float] = defaultdict(float)
+        for term, query_frequency in Counter(tokenise(query)).items():
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for chunk_id, frequency in self._postings[term]:
+                length_norm = 1 - self.b + self.b * self._lengths[chunk_id] / (self._average_length or 1)
+                scores[chunk_id] += query_frequency * idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        return scores
+
+
+def select_chunks(index: BM25Index, query: str, token_budget: int, exclude_files_lower: frozenset = frozenset()) -> List[SourceChunk]:
+    """
+    Picks the chunks most relevant to `query` until `token_budget` is reached.
+
+    The opening chunk of every document is always taken first, because report
+    headers carry the names, dates and authorship that most sections need. The
+    result is returned in document order so that excerpts read naturally.
+    """
+    def _is_excluded(chunk: SourceChunk) -> bool:
+        filename_lower = chunk.filename.lower()
+        return filename_lower in exclude_files_lower or filename_lower.replace(".txt", "") in exclude_files_lower
+
+    candidates = [chunk_id for chunk_id, chunk in enumerate(index.chunks) if not _is_excluded(chunk)]
+    scores = index.score(query)
+
+    opening_chunks = []
+    seen_documents = set()
+    for chunk_id in candidates:
+        document_index = index.chunks[chunk_id].document_index
+        if document_index not in seen_documents:
+            seen_documents.add(document_index)
+            opening_chunks.append(chunk_id)
+
+    ranked = sorted((chunk_id for chunk_id in candidates if scores.get(chunk_id, 0.0) > 0), key=lambda chunk_id: -scores[chunk_id])
+
+    selected = set()
+    used_tokens = 0
+    for chunk_id in opening_chunks + ranked:
+        if chunk_id in selected:
+            continue
+        chunk_tokens = estimate_tokens(index.chunks[chunk_id].text)
+        if used_tokens + chunk_tokens > token_budget:
+            continue
+        selected.add(chunk_id)
+        used_tokens += chunk_tokens
+
+    return [index.chunks[chunk_id] for chunk_id in sorted(selected, key=lambda chunk_id: (index.chunks[chunk_id].document_index, index.chunks[chunk_id].start))]
+
+
+def format_chunks(chunks: List[SourceChunk]) -> str:
+    """
+    Renders selected chunks grouped by file, in the same START/END OF FILE
+    framing as the full corpus, with a provenance marker on every excerpt.
+    """
+    parts = [
+        "NOTE: The source documents below are EXCERPTS selected for relevance to this section. "
+        "Each excerpt is labelled with its file and character offsets; cite these when referring to a source.\n\n"
+    ]
+    current_filename = None
+    for chunk in chunks:
+        if chunk.filename != current_filename:
+            if current_filename is not None:
+                parts.append(f"--- END OF FILE {current_filename} ---\n\n")
+            current_filename = chunk.filename
+            parts.append(f"--- START OF FILE {chunk.filename} (EXCERPTS) ---\n\n")
+        parts.append(f"[EXCERPT {chunk.filename} chars {chunk.start}-{chunk.end}]\n{chunk.text}\n\n")
+    if current_filename is not None:
+        parts.append(f"--- END OF FILE {current_filename} ---\n\n")
+    return "".join(parts)
@@ -0,0 +1,87 @@
+"""
+run_scope.py
+
+This module gives each run (one case) its own namespace in the shared blob
+containers, so that several cases can run at the same time, in one process or
+on separate replicas.
+
+Container names are global and the pipeline's blob names (`output_s1_i1.md`,
+`final_document.md`, `fail.txt`) carry no run ID, so two runs writing to the
+same containers would overwrite each other's drafts and delete each other's
+files at cleanup. A run now sets its `RunScope` at the start, and every blob
+helper in `utils.py` and `bulk_operations.py` maps the names it is given
+(the "logical" names the orchestrator, the tasks and the agents' tools use)
+to physical names in storage:
+- in the containers listed in `RUN_SCOPED_CONTAINERS` (`processed-docs`,
+  `outputs`, `final-document`), under `{run_id}/`;
+- in the source container, under the case's source prefix, so a case only
+  sees its own documents;
+- in every other container, unchanged.
+
+Listings are made under the prefix and return logical names, so a run never
+sees another run's blobs, and clearing a container at the end of a run only
+deletes that run's blobs.
+
+The scope is held in a `contextvars.ContextVar`, like the telemetry tags, so
+it follows the run into every task it starts and, through
+`ContextPropagatingExecutor`, into the threads that execute the agents' tool
+calls. Code running outside any run sees unscoped names.
+"""
+
+import contextvars
+from dataclasses import dataclass
+
+from .. import config
+
+
+@dataclass(frozen=True)
+class RunScope:
+    """The run ID and source prefix that a run's blob names are scoped by."""
+    run_id: str
+    source_prefix: str = ""
+
+    def prefix(self, container_name: str) -> str:
+        """The prefix of this run's blobs in a container ("" if the container is not scoped)."""
+        if container_name == config.SOURCE_BLOB_CONTAINER:
+            return self.source_prefix
+        if container_name in config.RUN_SCOPED_CONTAINERS:
+            return f"{self.run_id}/"
+        return ""
+
+
+_run_scope: contextvars.ContextVar[RunScope | None] = contextvars.ContextVar("run_scope", default=None)
+
+
+def normalise_source_prefix(source_prefix: str | None) -> str:
+    """Returns a case's source prefix as a folder ("case-17" -> "case-17/"), or "" for the whole container."""
+    source_prefix = (source_prefix or "").strip("/")
+    return f"{source_prefix}/" if source_prefix else ""
+
+
+def set_run_scope(run_id: str, source_prefix: str = None) -> RunScope:
+    """Scopes every blob name used from the current asyncio task from now on to a run."""
+    run_scope = RunScope(run_id, normalise_source_prefix(source_prefix))
+    _run_scope.set(run_scope)
+    return run_scope
+
+
+def get_run_scope() -> RunScope | None:
+    """Returns the scope of the current run, or None outside any run."""
+    return _run_scope.get()
+
+
+def blob_prefix(container_name: str) -> str:
+    """The prefix of the current run's blobs in a container."""
+    run_scope = _run_scope.get()
+    return run_scope.prefix(container_name) if run_scope else ""
+
+
+def scoped_blob_name(container_name: str, blob_name: str) -> str:
+    """Maps a logical blob name to its name in storage."""
+    return f"{blob_prefix(container_name)}{blob_name}"
+
+
+def unscoped_blob_name(container_name: str, blob_name: str) -> str:
+    """Maps a blob's name in storage back to its logical name."""
+    prefix = blob_prefix(container_name)
+    return blob_name[len(prefix):] if prefix and blob_name.startswith(prefix) else blob_name
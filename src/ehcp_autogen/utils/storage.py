@@ -0,0 +1,391 @@
+"""
+storage.py
+
+This module defines the storage interface behind the blob utilities in
+`utils.py` and its three implementations:
+- `AzureBlobStorage`: Azure Blob Storage through the singleton async
+  `BlobServiceClient`. This is the production backend.
+- `LocalStorage`: a directory per container under `LOCAL_STORAGE_DIR`. Writes
+  are atomic (a temporary file is renamed into place) and large files can be
+  read through `mmap`.
+- `MemoryStorage`: a process-wide dictionary, for tests and benchmarks that
+  must run without Azure or disk I/O.
+
+The backend is chosen per container in `config.py`: `STORAGE_BACKEND` is the
+default and `STORAGE_CONTAINER_BACKENDS` overrides it for individual
+containers, so scratch containers (`processed-docs`, `outputs`) can live on
+local disk while final deliverables stay in Azure. Callers (and the agents'
+tools) keep using `upload_blob_async`, `download_blob_as_text_async` and the
+other helpers in `utils.py`, which resolve the backend for each call.
+"""
+
+import os
+import mmap
+import shutil
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+import itertools
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Dict, List, Tuple
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotModifiedError
+from azure.storage.blob.aio import BlobServiceClient
+
+from .. import config
+
+
+class StorageBackend(ABC):
+    """The operations the pipeline needs from a blob store."""
+
+    # Remote backends benefit from the run's in-memory read cache; local ones do not.
+    is_remote = False
+
+    @abstractmethod
+    async def list_blobs(self, container_name: str, name_starts_with: str = None) -> List[str]:
+        """Returns the names of all blobs in a container, or of those whose names start with `name_starts_with`."""
+
+    @abstractmethod
+    async def list_blob_md5s(self, container_name: str, name_starts_with: str = None) -> Dict[str, str | None]:
+        """Returns a mapping of blob name to MD5 hex digest (None if unknown), for the blobs whose names start with `name_starts_with`."""
+
+    @abstractmethod
+    async def list_blob_sizes(self, container_name: str, name_starts_with: str = None) -> Dict[str, int]:
+        """Returns a mapping of blob name to size in bytes, for the blobs whose names start with `name_starts_with`."""
+
+    @abstractmethod
+    async def upload(self, container_name: str, blob_name: str, data: bytes, overwrite: bool = True) -> str | None:
+        """Writes a blob and returns its new ETag."""
+
+    @abstractmethod
+    async def download(self, container_name: str, blob_name: str, if_none_match: str = None) -> Tuple[bytes | None, str | None]:
+        """
+        Reads a blob and returns (content, etag). If `if_none_match` equals the
+        blob's current ETag, the content is not transferred and None is returned.
+        """
+
+    @abstractmethod
+    async def delete(self, container_name: str, blob_name: str):
+        """Deletes a blob."""
+
+    @abstractmethod
+    async def copy(self, source_container_name: str, source_blob_name: str, dest_container_name: str, dest_blob_name: str) -> int:
+        """Copies a blob within this backend and returns the copy's size, once the copy is complete."""
+
+    async def upload_stream(self, container_name: str, blob_name: str, stream: BinaryIO, length: int, overwrite: bool = True) -> str | None:
+        """
+        Writes a blob from a file object of `length` bytes, without holding it
+        in memory where the backend allows, and returns its new ETag.
+        """
+        return await self.upload(container_name, blob_name, stream.read(), overwrite=overwrite)
+
+    async def delete_batch(self, container_name: str, blob_names: List[str]) -> Dict[str, str]:
+        """
+        Deletes several blobs of one container and returns {blob name: reason}
+        for those that could not be deleted. A blob that no longer exists
+        counts as deleted.
+        """
+        failures = {}
+        for blob_name in blob_names:
+            try:
+                await self.delete(container_name, blob_name)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                failures[blob_name] = str(e)
+        return failures
+
+
+# ==============================================================================
+# AZURE BLOB STORAGE
+# ==============================================================================
+
+class AzureBlobStorage(StorageBackend):
+    """Azure Blob Storage, through a single async client for the whole application."""
+
+    is_remote = True
+
+    def __init__(self):
+        self._blob_service_client = None
+
+    def _get_blob_service_client(self) -> BlobServiceClient:
+        # Only one BlobServiceClient is created for the application lifecycle so
+        # that every blob operation reuses the same connection pool.
+        if self._blob_service_client is None:
+            logging.info("Initialising singleton async BlobServiceClient...")
+            if not all([config.AZURE_STORAGE_ACCOUNT_URL, config.AZURE_STORAGE_ACCOUNT_KEY]):
+                raise ValueError("Storage account URL or Key is not set in the environment.")
+            self._blob_service_client = BlobServiceClient(
+                account_url=config.AZURE_STORAGE_ACCOUNT_URL,
+                credential=config.AZURE_STORAGE_ACCOUNT_KEY
+            )
+            logging.info("Async BlobServiceClient initialised successfully.")
+        return self._blob_service_client
+
+    def _get_container_client(self, container_name: str):
+        return self._get_blob_service_client().get_container_client(container_name)
+
+    async def list_blobs(self, container_name: str, name_starts_with: str = None) -> List[str]:
+        return [blob.name async for blob in self._get_container_client(container_name).list_blobs(name_starts_with=name_starts_with)]
+
+    async def list_blob_md5s(self, container_name: str, name_starts_with: str = None) -> Dict[str, str | None]:
+        blob_md5s = {}
+        async for blob in self._get_container_client(container_name).list_blobs(name_starts_with=name_starts_with):
+            content_md5 = blob.content_settings.content_md5 if blob.content_settings else None
+            blob_md5s[blob.name] = bytes(content_md5).hex() if content_md5 else None
+        return blob_md5s
+
+    async def list_blob_sizes(self, container_name: str, name_starts_with: str = None) -> Dict[str, int]:
+        return {blob.name: blob.size async for blob in self._get_container_client(container_name).list_blobs(name_starts_with=name_starts_with)}
+
+    async def upload(self, container_name: str, blob_name: str, data: bytes, overwrite: bool = True) -> str | None:
+        blob_client = self._get_container_client(container_name).get_blob_client(blob_name)
+        upload_result = await blob_client.upload_blob(data, overwrite=overwrite)
+        return upload_result.get("etag")
+
+    async def upload_stream(self, container_name: str, blob_name: str, stream: BinaryIO, length: int, overwrite: bool = True) -> str | None:
+        # The SDK reads the stream in blocks and stages them, so only a few blocks are in memory at once.
+        blob_client = self._get_container_client(container_name).get_blob_client(blob_name)
+        upload_result = await blob_client.upload_blob(stream, length=length, overwrite=overwrite)
+        return upload_result.get("etag")
+
+    async def download(self, container_name: str, blob_name: str, if_none_match: str = None) -> Tuple[bytes | None, str | None]:
+        blob_client = self._get_container_client(container_name).get_blob_client(blob_name)
+        try:
+            if if_none_match:
+                downloader = await blob_client.download_blob(etag=if_none_match, match_condition=MatchConditions.IfModified)
+            else:
+                downloader = await blob_client.download_blob()
+        except ResourceNotModifiedError:
+            return None, if_none_match
+        return await downloader.readall(), downloader.properties.etag
+
+    async def delete(self, container_name: str, blob_name: str):
+        await self._get_container_client(container_name).delete_blob(blob_name)
+
+    async def delete_batch(self, container_name: str, blob_names: List[str]) -> Dict[str, str]:
+        # One Blob Batch request (at most 256 blobs). Sub-responses come back in
+        # the order the blobs were given.
+        responses = await self._get_container_client(container_name).delete_blobs(*blob_names, raise_on_any_failure=False)
+        failures = {}
+        index = 0
+        async for response in responses:
+            if response.status_code not in (202, 404):
+                failures[blob_names[index]] = f"HTTP {response.status_code} {response.reason}"
+            index += 1
+        return failures
+
+    async def copy(self, source_container_name: str, source_blob_name: str, dest_container_name: str, dest_blob_name: str) -> int:
+        # A server-side copy: the content never passes through this process.
+        source_blob_url = f"{config.AZURE_STORAGE_ACCOUNT_URL}/{source_container_name}/{source_blob_name}"
+        dest_blob_client = self._get_container_client(dest_container_name).get_blob_client(dest_blob_name)
+        await dest_blob_client.start_copy_from_url(source_blob_url)
+        # The service may complete the copy asynchronously. It is polled until it
+        # ends, so the source is never deleted while the copy is still reading it.
+        deadline = time.monotonic() + config.BLOB_COPY_TIMEOUT_SECONDS
+        properties = await dest_blob_client.get_blob_properties()
+        while properties.copy.status == "pending":
+            if time.monotonic() > deadline:
+                await dest_blob_client.abort_copy(properties.copy.id)
+                raise TimeoutError(f"Copy of '{source_container_name}/{source_blob_name}' did not complete within {config.BLOB_COPY_TIMEOUT_SECONDS}s.")
+            await asyncio.sleep(config.BLOB_COPY_POLL_SECONDS)
+            properties = await dest_blob_client.get_blob_properties()
+        if properties.copy.status != "success":
+            raise RuntimeError(f"Copy of '{source_container_name}/{source_blob_name}' ended with status '{properties.copy.status}': {properties.copy.status_description}")
+        return properties.size
+
+
+# ==============================================================================
+# LOCAL FILESYSTEM
+# ==============================================================================
+
+class LocalStorage(StorageBackend):
+    """
+    Stores each container as a directory under `root_dir`. Blob names may
+    contain "/" and are stored as nested paths. File I/O runs in the default
+    executor so it never blocks the event loop.
+    """
+
+    _TEMP_PREFIX = ".tmp-"
+
+    def __init__(self, root_dir: str, mmap_min_bytes: int | None = None):
+        self.root_dir = root_dir
+        self.mmap_min_bytes = mmap_min_bytes
+
+    def _blob_path(self, container_name: str, blob_name: str) -> str:
+        container_dir = os.path.abspath(os.path.join(self.root_dir, container_name))
+        blob_path = os.path.abspath(os.path.join(container_dir, *blob_name.split("/")))
+        if os.path.commonpath([container_dir, blob_path]) != container_dir:
+            raise ValueError(f"Blob name '{blob_name}' resolves outside container '{container_name}'.")
+        return blob_path
+
+    @staticmethod
+    def _etag(blob_path: str) -> str:
+        stat = os.stat(blob_path)
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _list_sync(self, container_name: str, name_starts_with: str = None) -> List[str]:
+        container_dir = os.path.join(self.root_dir, container_name)
+        blob_names = []
+        for dir_path, _, file_names in os.walk(container_dir):
+            for file_name in file_names:
+                if file_name.startswith(self._TEMP_PREFIX):
+                    continue
+                relative_path = os.path.relpath(os.path.join(dir_path, file_name), container_dir)
+                blob_names.append(relative_path.replace(os.sep, "/"))
+        # Azure lists blobs in lexicographic order; keep the same order here.
+        return sorted(blob_name for blob_name in blob_names if blob_name.startswith(name_starts_with or ""))
+
+    def _read_sync(self, blob_path: str) -> bytes:
+        with open(blob_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if self.mmap_min_bytes is not None and size >= max(self.mmap_min_bytes, 1):
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return mapped[:]
+            return f.read()
+
+    def _write_sync(self, blob_path: str, data: bytes | BinaryIO, overwrite: bool) -> str:
+        if not overwrite and os.path.exists(blob_path):
+            raise FileExistsError(f"Blob '{blob_path}' already exists.")
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        # Write to a temporary file in the same directory, then rename it into
+        # place, so a concurrent reader never sees a partially written blob.
+        fd, temp_path = tempfile.mkstemp(prefix=self._TEMP_PREFIX, dir=os.path.dirname(blob_path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f)
+            os.replace(temp_path, blob_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return self._etag(blob_path)
+
+    def _md5s_sync(self, container_name: str, name_starts_with: str | None) -> Dict[str, str | None]:
+        return {
+            blob_name: hashlib.md5(self._read_sync(self._blob_path(container_name, blob_name))).hexdigest()
+            for blob_name in self._list_sync(container_name, name_starts_with)
+        }
+
+    async def list_blobs(self, container_name: str, name_starts_with: str = None) -> List[str]:
+        return await self._run(self._list_sync, container_name, name_starts_with)
+
+    async def list_blob_md5s(self, container_name: str, name_starts_with: str = None) -> Dict[str, str | None]:
+        return await self._run(self._md5s_sync, container_name, name_starts_with)
+
+    def _sizes_sync(self, container_name: str, name_starts_with: str | None) -> Dict[str, int]:
+        return {
+            blob_name: os.path.getsize(self._blob_path(container_name, blob_name))
+            for blob_name in self._list_sync(container_name, name_starts_with)
+        }
+
+    async def list_blob_sizes(self, container_name: str, name_starts_with: str = None) -> Dict[str, int]:
+        return await self._run(self._sizes_sync, container_name, name_starts_with)
+
+    async def upload(self, container_name: str, blob_name: str, data: bytes, overwrite: bool = True) -> str | None:
+        return await self._run(self._write_sync, self._blob_path(container_name, blob_name), data, overwrite)
+
+    async def upload_stream(self, container_name: str, blob_name: str, stream: BinaryIO, length: int, overwrite: bool = True) -> str | None:
+        return await self._run(self._write_sync, self._blob_path(container_name, blob_name), stream, overwrite)
+
+    async def download(self, container_name: str, blob_name: str, if_none_match: str = None) -> Tuple[bytes | None, str | None]:
+        blob_path = self._blob_path(container_name, blob_name)
+        etag = await self._run(self._etag, blob_path)
+        if if_none_match and if_none_match == etag:
+            return None, etag
+        return await self._run(self._read_sync, blob_path), etag
+
+    async def delete(self, container_name: str, blob_name: str):
+        await self._run(os.remove, self._blob_path(container_name, blob_name))
+
+    async def copy(self, source_container_name: str, source_blob_name: str, dest_container_name: str, dest_blob_name: str) -> int:
+        data, _ = await self.download(source_container_name, source_blob_name)
+        await self.upload(dest_container_name, dest_blob_name, data)
+        return len(data)
+
+
+# ==============================================================================
+# IN-MEMORY
+# ==============================================================================
+
+class MemoryStorage(StorageBackend):
+    """Keeps every container in a dictionary for the lifetime of the process."""
+
+    def __init__(self):
+        self._containers: Dict[str, Dict[str, Tuple[bytes, str]]] = {}
+        self._etag_counter = itertools.count(1)
+
+    def _container(self, container_name: str) -> Dict[str, Tuple[bytes, str]]:
+        return self._containers.setdefault(container_name, {})
+
+    def _get(self, container_name: str, blob_name: str) -> Tuple[bytes, str]:
+        try:
+            return self._container(container_name)[blob_name]
+        except KeyError:
+            raise FileNotFoundError(f"Blob '{container_name}/{blob_name}' does not exist.") from None
+
+    async def list_blobs(self, container_name: str, name_starts_with: str = None) -> List[str]:
+        return sorted(blob_name for blob_name in self._container(container_name) if blob_name.startswith(name_starts_with or ""))
+
+    async def list_blob_md5s(self, container_name: str, name_starts_with: str = None) -> Dict[str, str | None]:
+        return {blob_name: hashlib.md5(data).hexdigest() for blob_name, (data, _) in sorted(self._container(container_name).items()) if blob_name.startswith(name_starts_with or "")}
+
+    async def list_blob_sizes(self, container_name: str, name_starts_with: str = None) -> Dict[str, int]:
+        return {blob_name: len(data) for blob_name, (data, _) in sorted(self._container(container_name).items()) if blob_name.startswith(name_starts_with or "")}
+
+    async def upload(self, container_name: str, blob_name: str, data: bytes, overwrite: bool = True) -> str | None:
+        container = self._container(container_name)
+        if not overwrite and blob_name in container:
+            raise FileExistsError(f"Blob '{container_name}/{blob_name}' already exists.")
+        etag = f'"{next(self._etag_counter):x}"'
+        container[blob_name] = (bytes(data), etag)
+        return etag
+
+    async def download(self, container_name: str, blob_name: str, if_none_match: str = None) -> Tuple[bytes | None, str | None]:
+        data, etag = self._get(container_name, blob_name)
+        if if_none_match and if_none_match == etag:
+            return None, etag
+        return data, etag
+
+    async def delete(self, container_name: str, blob_name: str):
+        self._get(container_name, blob_name)
+        del self._container(container_name)[blob_name]
+
+    async def copy(self, source_container_name: str, source_blob_name: str, dest_container_name: str, dest_blob_name: str) -> int:
+        data, _ = self._get(source_container_name, source_blob_name)
+        await self.upload(dest_container_name, dest_blob_name, data)
+        return len(data)
+
+
+# ==============================================================================
+# BACKEND SELECTION
+# ==============================================================================
+
+_backends: Dict[str, StorageBackend] = {}
+
+
+def _create_backend(backend_name: str) -> StorageBackend:
+    if backend_name == "azure":
+        return AzureBlobStorage()
+    if backend_name == "local":
+        return LocalStorage(config.LOCAL_STORAGE_DIR, config.LOCAL_STORAGE_MMAP_MIN_BYTES)
+    if backend_name == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend '{backend_name}'. Expected 'azure', 'local' or 'memory'.")
+
+
+def get_storage_backend(container_name: str) -> StorageBackend:
+    """Returns the (shared) backend configured for a container."""
+    backend_name = config.STORAGE_CONTAINER_BACKENDS.get(container_name, config.STORAGE_BACKEND).lower()
+    if backend_name not in _backends:
+        _backends[backend_name] = _create_backend(backend_name)
+    return _backends[backend_name]
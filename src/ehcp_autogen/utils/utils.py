@@ -6,12 +6,17 @@ the main application logic. It abstracts away common, low-level operations
 into well-defined, asynchronous functions.
 
 The utilities are categorised into several key areas:
-1.  **Azure Blob Storage Utilities:** A suite of async functions for all blob
-    operations (list, upload, download, clear, copy), managed through a 
-    singleton BlobServiceClient.
+1.  **Blob Storage Utilities:** A suite of async functions for all blob
+    operations (list, upload, download, copy), dispatched to the storage
+    backend configured for each container (`storage.py`), with a run-scoped read-through cache
+    (`BlobReadCache`) for blobs that are read repeatedly. Blob names are
+    scoped to the current run (`run_scope.py`), so concurrent cases share the
+    containers without seeing each other's blobs. Operations on many
+    blobs at once (archiving a run, clearing a container) are in `bulk_operations.py`.
 2.  **Data Pipeline Utilities:** High-level functions that orchestrate complex
     data workflows, such as the PDF pre-processing pipeline
-    (`preprocess_all_pdfs_async`) and the final merging of sectional outputs
+    (`preprocess_all_pdfs_async`), the per-run source corpus shared by all
+    sections (`SourceCorpus`, with optional section-relevant retrieval) and the final merging of sectional outputs
     (`merge_output_files_async`).
 3.  **Parsing and Text Utilities:** Functions for cleaning text, sanitising
     strings for use as keys, and parsing structured data from markdown
@@ -24,67 +29,182 @@ The utilities are categorised into several key areas:
 
 import os
 import re
-import pypdf
+import json
+import time
+import hashlib
+import inspect
 import logging
-from typing import List, Dict
+import pypdf
+from typing import Awaitable, Callable, List, Dict
 import src.ehcp_autogen.config as config
 import asyncio
-import io
-from azure.storage.blob.aio import BlobServiceClient
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from docxtpl import DocxTemplate
+from .pdf_extraction import count_pdf_pages, extract_page_range, plan_page_ranges
+from .retrieval import BM25Index, estimate_tokens, select_chunks, format_chunks
+from .storage import get_storage_backend
+from .run_scope import blob_prefix, scoped_blob_name
 
 # ==============================================================================
-# 1. AZURE BLOB STORAGE UTILITIES
+# 1. BLOB STORAGE UTILITIES
 # ==============================================================================
-# Low-level functions for interacting with Azure Blob Storage.
-# Includes a singleton client to manage the connection efficiently.
+# Low-level functions for reading and writing blobs. Each call is dispatched to
+# the storage backend configured for its container (Azure, local disk or
+# memory; see `storage.py`), so the signatures used by the agents' tools do not
+# depend on where a container actually lives.
+
+class BlobReadCache:
+    """
+    A run-scoped, in-memory read-through cache for blobs in the containers listed
+    in `BLOB_CACHE_CONTAINERS`.
 
-_blob_service_client = None
+    Within one run the same blobs are read many times: a section's feedback
+    report is read for parsing and again for the Prompt_Writer, a draft is read
+    straight after the writer team uploaded it, and the merged document is read
+    back just after it was written. Every upload made through `upload_blob_async`
+    (including the agents' tool calls) writes through to this cache and bumps the
+    entry's version, so those reads are served from memory.
 
-async def _get_blob_service_client():
-    # This singleton pattern ensures that we create only one BlobServiceClient
-    # instance for the entire application lifecycle. This is more efficient than
-    # creating a new client for every blob operation, as it reuses the connection pool.
+    Each entry keeps the ETag the service returned. When `BLOB_CACHE_REVALIDATE`
+    is enabled, a hit is confirmed with an If-None-Match request that transfers
+    no content unless the blob changed outside this process. Entries are evicted
+    least-recently-used once `BLOB_CACHE_MAX_BYTES` is exceeded. Containers on a
+    local or in-memory storage backend bypass the cache.
     """
-    Gets the singleton async instance of the BlobServiceClient.
-    If it doesn't exist, it creates one.
+
+    def __init__(self, containers: List[str], max_bytes: int, revalidate: bool):
+        self.containers = set(containers)
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        # (container, blob) -> {"data": bytes, "etag": str | None, "version": int}
+        self._entries: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.bytes_served = 0
+
+    def is_cacheable(self, container_name: str) -> bool:
+        return container_name in self.containers
+
+    def get(self, container_name: str, blob_name: str) -> Dict | None:
+        entry = self._entries.get((container_name, blob_name))
+        if entry is not None:
+            self._entries.move_to_end((container_name, blob_name))
+        return entry
+
+    def put(self, container_name: str, blob_name: str, data: bytes, etag: str | None):
+        key = (container_name, blob_name)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous["data"])
+        self._entries[key] = {"data": data, "etag": etag, "version": (previous["version"] + 1) if previous else 1}
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted["data"])
+
+    def invalidate(self, container_name: str, blob_name: str = None):
+        """Drops one blob, or every blob of a container if `blob_name` is None."""
+        for key in [key for key in self._entries if key[0] == container_name and blob_name in (None, key[1])]:
+            self._bytes -= len(self._entries.pop(key)["data"])
+
+    def invalidate_many(self, container_name: str, blob_names: List[str]):
+        """Drops the given blobs of a container, leaving its other blobs cached."""
+        for blob_name in blob_names:
+            entry = self._entries.pop((container_name, blob_name), None)
+            if entry is not None:
+                self._bytes -= len(entry["data"])
+
+    def record_hit(self, data: bytes):
+        self.hits += 1
+        self.bytes_served += len(data)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns hit/miss counts for the run summary."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "bytes_served": self.bytes_served,
+            "entries": len(self._entries),
+            "cached_bytes": self._bytes,
+        }
+
+_blob_read_cache = None
+
+def get_blob_read_cache() -> BlobReadCache | None:
+    """Returns the run's blob read cache, or None if caching is disabled."""
+    global _blob_read_cache
+    if _blob_read_cache is None and config.BLOB_CACHE_ENABLED:
+        _blob_read_cache = BlobReadCache(config.BLOB_CACHE_CONTAINERS, config.BLOB_CACHE_MAX_BYTES, config.BLOB_CACHE_REVALIDATE)
+    return _blob_read_cache
+
+async def _read_blob_bytes_async(container_name: str, blob_name: str) -> bytes:
     """
-    global _blob_service_client
-    if _blob_service_client is None:
-        logging.info("Initialising singleton async BlobServiceClient...")
-        if not all([config.AZURE_STORAGE_ACCOUNT_URL, config.AZURE_STORAGE_ACCOUNT_KEY]):
-            raise ValueError("Storage account URL or Key is not set in the environment.")
-        
-        # Create an async client.
-        client = BlobServiceClient(
-            account_url=config.AZURE_STORAGE_ACCOUNT_URL,
-            credential=config.AZURE_STORAGE_ACCOUNT_KEY
-        )
-        _blob_service_client = client
-        logging.info("Async BlobServiceClient initialised successfully.")
-    return _blob_service_client
-
-async def get_blob_container_client(container_name: str):
-    """Helper to connect to a specific Azure Blob Storage container using the async singleton client."""
-    blob_service_client = await _get_blob_service_client()
-    return blob_service_client.get_container_client(container_name)
-
-async def list_blobs_async(container_name: str) -> List[str]:
-    """Asynchronously lists the names of all blobs in a container."""
-    logging.info(f"Listing blobs in container: {container_name}")
+    Reads a blob's content through the run's blob cache. Raises on failure so the
+    public download helpers keep their own error handling.
+    """
+    blob_name = scoped_blob_name(container_name, blob_name)
+    backend = get_storage_backend(container_name)
+    blob_cache = get_blob_read_cache()
+    if blob_cache is None or not backend.is_remote or not blob_cache.is_cacheable(container_name):
+        data, _ = await backend.download(container_name, blob_name)
+        return data
+
+    entry = blob_cache.get(container_name, blob_name)
+    if entry is not None and not (blob_cache.revalidate and entry["etag"]):
+        blob_cache.record_hit(entry["data"])
+        return entry["data"]
+
+    data, etag = await backend.download(container_name, blob_name, if_none_match=entry["etag"] if entry else None)
+    if data is None:
+        blob_cache.revalidated += 1
+        blob_cache.record_hit(entry["data"])
+        return entry["data"]
+    blob_cache.misses += 1
+    blob_cache.put(container_name, blob_name, data, etag)
+    return data
+
+async def list_blobs_async(container_name: str, name_starts_with: str = None) -> List[str]:
+    """Asynchronously lists the names of all blobs in a container, or of those whose names start with `name_starts_with`."""
+    logging.info(f"Listing blobs in container: {container_name}" + (f" (prefix '{name_starts_with}')" if name_starts_with else ""))
+    prefix = blob_prefix(container_name)
     try:
-        container_client = await get_blob_container_client(container_name)
-        return [blob.name async for blob in container_client.list_blobs()]
+        blob_names = await get_storage_backend(container_name).list_blobs(container_name, f"{prefix}{name_starts_with or ''}" or None)
+        return [blob_name[len(prefix):] for blob_name in blob_names]
     except Exception as e:
         logging.error(f"Failed to list blobs in container '{container_name}'. Reason: {e}")
         return []
 
+async def list_blob_md5s_async(container_name: str) -> Dict[str, str | None]:
+    """
+    Asynchronously lists all blobs in a container together with their Content-MD5.
+    Returns a mapping of blob name to hex digest, or None where the service has no
+    MD5 recorded for the blob (e.g. some large block uploads).
+    """
+    logging.info(f"Listing blobs with properties in container: {container_name}")
+    prefix = blob_prefix(container_name)
+    try:
+        blob_md5s = await get_storage_backend(container_name).list_blob_md5s(container_name, prefix or None)
+        return {blob_name[len(prefix):]: content_md5 for blob_name, content_md5 in blob_md5s.items()}
+    except Exception as e:
+        logging.error(f"Failed to list blobs in container '{container_name}'. Reason: {e}")
+        return {}
+
 async def upload_blob_async(container_name: str, blob_name: str, data: str | bytes, overwrite: bool = True):
     """Asynchronously uploads string or byte data to a blob."""
+    blob_name = scoped_blob_name(container_name, blob_name)
     logging.info(f"Uploading to blob: {container_name}/{blob_name}")
     try:
-        container_client = await get_blob_container_client(container_name)
-        await container_client.upload_blob(name=blob_name, data=data, overwrite=overwrite)
+        backend = get_storage_backend(container_name)
+        data = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        etag = await backend.upload(container_name, blob_name, data, overwrite=overwrite)
+        blob_cache = get_blob_read_cache()
+        if blob_cache is not None and backend.is_remote and blob_cache.is_cacheable(container_name):
+            # Write-through: the next read of this blob is served from memory.
+            blob_cache.put(container_name, blob_name, data, etag)
     except Exception as e:
         logging.error(f"Failed to upload blob '{blob_name}'. Reason: {e}")
         raise
@@ -93,10 +213,7 @@ async def download_blob_as_text_async(container_name: str, blob_name: str) -> st
     """Asynchronously downloads a blob and returns its content as a UTF-8 string."""
     logging.info(f"Downloading text blob: {container_name}/{blob_name}")
     try:
-        container_client = await get_blob_container_client(container_name)
-        blob_client = container_client.get_blob_client(blob_name)
-        downloader = await blob_client.download_blob()
-        return (await downloader.readall()).decode("utf-8")
+        return (await _read_blob_bytes_async(container_name, blob_name)).decode("utf-8")
     except Exception as e:
         logging.error(f"Failed to download blob '{blob_name}' as text. Reason: {e}")
         return ""
@@ -105,10 +222,7 @@ async def download_blob_as_bytes_async(container_name: str, blob_name: str) -> b
     """Asynchronously downloads a blob and returns its content as raw bytes."""
     logging.info(f"Downloading bytes blob: {container_name}/{blob_name}")
     try:
-        container_client = await get_blob_container_client(container_name)
-        blob_client = container_client.get_blob_client(blob_name)
-        downloader = await blob_client.download_blob()
-        return await downloader.readall()
+        return await _read_blob_bytes_async(container_name, blob_name)
     except Exception as e:
         logging.error(f"Failed to download blob '{blob_name}' as bytes. Reason: {e}")
         return b""
@@ -118,167 +232,106 @@ async def download_all_sources_from_container_async(container_name: str, exclude
     Asynchronously lists all blobs in a container, downloads
     their text content, and returns it as a single concatenated string.
     This is the primary tool for providing source context to agents. Optionally excludes specified files.
-    """
-    logging.info(f"--- Concurrently downloading all source documents from container: {container_name} ---")
-
-    if exclude_files is None:
-        exclude_files = []
-
-    # A case-insensitive comparison is used for the exclusion list to make the
-    # configuration more robust against user input variations (e.g., 'appendix a.pdf').
-    exclude_files_lower = [f.lower() for f in exclude_files]
-
-    logging.info(f"--- Downloading source documents from container: {container_name} ---")
-    if exclude_files_lower:
-        logging.info(f"--- Excluding files: {exclude_files} ---")
-    
-    # Get the list of all blob names to be downloaded.
-    blob_names = await list_blobs_async(container_name)
-    
-    if not blob_names:
-        logging.warning(f"No blobs found in container '{container_name}'.")
-        return "ERROR: No source documents found in the specified container."
-    
-    full_content = ""
-    # The source files are downloaded and concatenated serially (one after another)
-    # rather than concurrently. This is a deliberate design choice to guarantee
-    # that the order of documents in the final concatenated string is predictable.
-    for blob_name in blob_names:
-        filename = os.path.basename(blob_name)
-        # Check against both the full filename (e.g., 'appendix a.pdf.txt') and the
-        # name without the '.txt' extension to provide flexibility in the config file.
-        if filename.lower() in exclude_files_lower or filename.lower().replace(".txt", "") in exclude_files_lower:
-            logging.info(f"Skipping excluded source file: {filename}")
-            continue
-
-        logging.info(f"Reading source file: {blob_name}")
-        full_content += f"--- START OF FILE {filename} ---\n\n"
-        full_content += await download_blob_as_text_async(container_name, blob_name)
-        full_content += f"\n\n--- END OF FILE {filename} ---\n\n"
-        
-    logging.info(f"--- Finished downloading {len(blob_names)} source documents. Formatting content. ---")
 
-    return full_content
-
-async def clear_blob_container_async(container_name: str):
-    """
-    Asynchronously and concurrently deletes all blobs within a specified container.
+    Prefer loading a `SourceCorpus` once per run and calling `get_content` for
+    each section; this helper is kept for one-off callers.
     """
-    logging.info(f"--- Starting cleanup of blob container: {container_name} ---")
-    try:
-        container_client = await get_blob_container_client(container_name)
-        blob_names = [blob.name async for blob in container_client.list_blobs()]
-
-        if not blob_names:
-            logging.info(f"Container '{container_name}' is already empty. No cleanup needed.")
-            return
-
-        logging.info(f"Found {len(blob_names)} blobs to delete in container '{container_name}'.")
-        
-        # Create a list of deletion tasks (coroutines)
-        delete_tasks = [container_client.delete_blob(blob_name) for blob_name in blob_names]
-        
-        # Execute all deletion tasks concurrently
-        await asyncio.gather(*delete_tasks)
-            
-        logging.info(f"--- Cleanup of container '{container_name}' complete. ---")
-    except Exception as e:
-        logging.error(f"Failed to clear container '{container_name}'. Reason: {e}", exc_info=True)
+    source_corpus = await SourceCorpus.load(container_name)
+    return source_corpus.get_content(exclude_files)
 
 async def copy_blob_async(
     source_container_name: str,
     source_blob_name: str,
     dest_container_name: str,
     dest_blob_name: str
-):
-    """Asynchronously copies a blob from a source to a destination."""
-    logging.info(f"Archiving blob from '{source_container_name}/{source_blob_name}' to '{dest_container_name}/{dest_blob_name}'")
-    try:
-        source_blob_url = f"{config.AZURE_STORAGE_ACCOUNT_URL}/{source_container_name}/{source_blob_name}"
-        
-        dest_container_client = await get_blob_container_client(dest_container_name)
-        dest_blob_client = dest_container_client.get_blob_client(dest_blob_name)
-        
-        # Use the native async method
-        await dest_blob_client.start_copy_from_url(source_blob_url)
-    except Exception as e:
-        logging.error(f"Failed to copy blob '{source_blob_name}'. Reason: {e}", exc_info=True)
-
-async def archive_run_artifacts(run_id: str, run_timestamp: str):
+) -> int | None:
     """
-    Copies all important files from a run into a dedicated folder
-    in the run-archive container for auditing purposes.
+    Asynchronously copies a blob from a source to a destination. Returns the
+    size of the completed copy, or None if the copy failed.
     """
-    logging.info(f"--- Archiving artifacts for Run ID: {run_id} ---")
-    archive_container = config.ARCHIVE_BLOB_CONTAINER
-    
+    source_blob_name = scoped_blob_name(source_container_name, source_blob_name)
+    dest_blob_name = scoped_blob_name(dest_container_name, dest_blob_name)
+    logging.info(f"Archiving blob from '{source_container_name}/{source_blob_name}' to '{dest_container_name}/{dest_blob_name}'")
     try:
-        # 1. Archive Source Documents
-        source_container = config.SOURCE_BLOB_CONTAINER
-        source_blobs = await list_blobs_async(source_container)
-        for blob_name in source_blobs:
-            dest_blob_name = f"{run_id}/source_docs/{blob_name}"
-            await copy_blob_async(source_container, blob_name, archive_container, dest_blob_name)
-
-        # 2. Archive Final Outputs
-        final_docs_container = config.FINAL_DOCUMENT_CONTAINER
-        final_blobs = await list_blobs_async(final_docs_container)
-        for blob_name in final_blobs:
-            dest_blob_name = f"{run_id}/outputs/{blob_name}"
-            await copy_blob_async(final_docs_container, blob_name, archive_container, dest_blob_name)
-
-        # 2. Archive All Outputs
-        output_container = config.OUTPUT_BLOB_CONTAINER
-        output_blobs = await list_blobs_async(output_container)
-        for blob_name in output_blobs:
-            dest_blob_name = f"{run_id}/outputs/{blob_name}"
-            await copy_blob_async(output_container, blob_name, archive_container, dest_blob_name)
-
-        # 3. Archive Log Files
-        log_files = [f for f in os.listdir(config.LOGS_DIR) if run_timestamp in f]
-        for log_file in log_files:
-            log_file_path = os.path.join(config.LOGS_DIR, log_file)
-            dest_blob_name = f"{run_id}/logs/{log_file}"
-            with open(log_file_path, "rb") as log_data:
-                await upload_blob_async(archive_container, dest_blob_name, log_data.read())
-        
-        logging.info(f"--- Archiving for Run ID {run_id} complete. ---")
-
+        source_backend = get_storage_backend(source_container_name)
+        dest_backend = get_storage_backend(dest_container_name)
+        if source_backend is dest_backend:
+            # Within one backend the copy is native (server-side for Azure).
+            copied_bytes = await dest_backend.copy(source_container_name, source_blob_name, dest_container_name, dest_blob_name)
+        else:
+            # e.g. archiving a local scratch output to Azure: the content is streamed through this process.
+            data, _ = await source_backend.download(source_container_name, source_blob_name)
+            await dest_backend.upload(dest_container_name, dest_blob_name, data)
+            copied_bytes = len(data)
+        blob_cache = get_blob_read_cache()
+        if blob_cache is not None:
+            blob_cache.invalidate(dest_container_name, dest_blob_name)
+        return copied_bytes
     except Exception as e:
-        logging.error(f"A critical error occurred during artifact archiving for Run ID {run_id}. Reason: {e}", exc_info=True)
-
+        logging.error(f"Failed to copy blob '{source_blob_name}'. Reason: {e}", exc_info=True)
+        return None
 
 # ==============================================================================
 # 2. DATA PIPELINE UTILITIES
 # ==============================================================================
 # High-level functions that orchestrate the application's data workflow.
 
-async def preprocess_all_pdfs_async() -> bool:
-    """Asynchronously downloads, processes, and re-uploads all PDFs."""
+async def preprocess_all_pdfs_async(source_md5s: Dict[str, str | None] = None, on_document_ready: Callable[[str, str | None, float], Awaitable[None]] = None) -> bool:
+    """
+    Asynchronously downloads, processes, and re-uploads all PDFs.
+
+    Documents move through a bounded concurrent pipeline: downloads and uploads
+    overlap on the event loop, while text extraction runs in a process pool at
+    page granularity so a single long report can use every core.
+
+    `source_md5s` is the source container's listing, if the caller already has
+    it. `on_document_ready` is awaited as soon as each PDF is finished, with the
+    PDF's name, its processed blob's name (None if the PDF was skipped) and the
+    time its processing started, so work that needs only some documents can
+    start before the rest are done.
+    """
     logging.info("--- Starting PDF Pre-processing from Blob Storage ---")
+    loop_logger = logging.getLogger('LoopTracer')
+    start_time = time.monotonic()
     try:
         source_container = config.SOURCE_BLOB_CONTAINER
-        processed_container = config.PROCESSED_BLOB_CONTAINER
-        pdf_blob_names = await list_blobs_async(source_container)
-        pdf_blob_names = [name for name in pdf_blob_names if name.lower().endswith('.pdf')]
+        # The listing includes each blob's Content-MD5, which lets the extraction
+        # cache recognise unchanged PDFs without downloading them.
+        if source_md5s is None:
+            source_md5s = await list_blob_md5s_async(source_container)
+        pdf_blob_names = [name for name in source_md5s if name.lower().endswith('.pdf')]
 
         if not pdf_blob_names:
             logging.warning(f"No PDF files found in container '{source_container}'.")
             return True
 
-        for pdf_blob_name in pdf_blob_names:
-            logging.info(f"Processing blob: {pdf_blob_name}")
-            pdf_bytes = await download_blob_as_bytes_async(source_container, pdf_blob_name)
-            if not pdf_bytes:
-                logging.warning(f"Skipping empty blob: {pdf_blob_name}")
-                continue
+        extraction_cache = ExtractionCache.create() if config.EXTRACTION_CACHE_ENABLED else None
 
-            reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
-            extracted_text = "".join(page.extract_text() or "" for page in reader.pages)
-            cleaned_content = _clean_text(extracted_text)
-            
-            output_blob_name = pdf_blob_name + ".txt"
-            await upload_blob_async(processed_container, output_blob_name, cleaned_content)
+        max_workers = config.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+        # The semaphore bounds how many documents are held in memory at once; the
+        # process pool bounds how much CPU-bound extraction runs in parallel.
+        semaphore = asyncio.Semaphore(config.PDF_PREPROCESS_CONCURRENCY)
+        with ProcessPoolExecutor(max_workers=max_workers) as process_pool:
+
+            async def _preprocess_and_report(pdf_blob_name: str) -> Dict | None:
+                timings = await _preprocess_pdf_async(pdf_blob_name, semaphore, process_pool, max_workers, extraction_cache, source_md5s.get(pdf_blob_name))
+                if on_document_ready:
+                    await on_document_ready(pdf_blob_name, timings["output_blob"] if timings else None, timings["started_at"] if timings else time.monotonic())
+                return timings
+
+            document_timings = await asyncio.gather(*[_preprocess_and_report(pdf_blob_name) for pdf_blob_name in pdf_blob_names])
+
+        for timings in document_timings:
+            if timings:
+                loop_logger.info(
+                    f"Pre-processed '{timings['blob']}' (cache {timings['cache']}): {timings['pages']} pages in {timings['page_tasks']} tasks | "
+                    f"download {timings['download_seconds']:.2f}s, extract {timings['extract_seconds']:.2f}s, "
+                    f"clean {timings['clean_seconds']:.2f}s, upload {timings['upload_seconds']:.2f}s"
+                )
+        loop_logger.info(f"Pre-processed {len(pdf_blob_names)} PDFs in {time.monotonic() - start_time:.2f}s using {max_workers} extraction workers.")
+
+        if extraction_cache:
+            loop_logger.info(f"Extraction cache: {extraction_cache.hits} hits, {extraction_cache.misses} misses (fingerprint {extraction_cache.fingerprint}).")
 
         logging.info("--- PDF Pre-processing Finished ---")
         return True
@@ -286,6 +339,354 @@ async def preprocess_all_pdfs_async() -> bool:
         logging.critical(f"A critical error occurred during PDF pre-processing: {e}", exc_info=True)
         return False
 
+async def _preprocess_pdf_async(
+    pdf_blob_name: str,
+    semaphore: asyncio.Semaphore,
+    process_pool: ProcessPoolExecutor,
+    max_workers: int,
+    extraction_cache: "ExtractionCache" = None,
+    content_md5: str = None
+) -> Dict | None:
+    """
+    Downloads, extracts, cleans and uploads a single PDF. (Helper function, prefixed with _).
+    Returns a per-stage timing breakdown, or None if the blob was skipped.
+    """
+    async with semaphore:
+        logging.info(f"Processing blob: {pdf_blob_name}")
+        loop = asyncio.get_running_loop()
+        output_blob_name = pdf_blob_name + ".txt"
+        timings = {
+            "blob": pdf_blob_name, "output_blob": output_blob_name, "started_at": time.monotonic(), "cache": "off", "pages": 0, "page_tasks": 0,
+            "download_seconds": 0.0, "extract_seconds": 0.0, "clean_seconds": 0.0, "upload_seconds": 0.0
+        }
+
+        # When the listing already told us the content hash, a cache hit skips the
+        # PDF download as well as the extraction.
+        if extraction_cache and content_md5:
+            if await _publish_cached_extraction_async(extraction_cache, content_md5, pdf_blob_name, output_blob_name, timings):
+                return timings
+
+        stage_start = time.monotonic()
+        pdf_bytes = await download_blob_as_bytes_async(config.SOURCE_BLOB_CONTAINER, pdf_blob_name)
+        timings["download_seconds"] = time.monotonic() - stage_start
+        if not pdf_bytes:
+            logging.warning(f"Skipping empty blob: {pdf_blob_name}")
+            return None
+
+        if extraction_cache and not content_md5:
+            content_md5 = hashlib.md5(pdf_bytes).hexdigest()
+            if await _publish_cached_extraction_async(extraction_cache, content_md5, pdf_blob_name, output_blob_name, timings):
+                return timings
+
+        # Page ranges are extracted in parallel and re-joined in page order, which
+        # produces exactly the same text as extracting the document in one pass.
+        stage_start = time.monotonic()
+        page_count = await loop.run_in_executor(process_pool, count_pdf_pages, pdf_bytes)
+        page_ranges = plan_page_ranges(page_count, max_workers, config.PDF_MIN_PAGES_PER_TASK)
+        page_texts = await asyncio.gather(*[
+            loop.run_in_executor(process_pool, extract_page_range, pdf_bytes, start, stop)
+            for start, stop in page_ranges
+        ])
+        extracted_text = "".join(page_texts)
+        timings["pages"] = page_count
+        timings["page_tasks"] = len(page_ranges)
+        timings["extract_seconds"] = time.monotonic() - stage_start
+
+        # Cleaning runs over the whole document (blank-line collapsing can span a page
+        # boundary), so it happens after the join, off the event loop.
+        stage_start = time.monotonic()
+        cleaned_content = await loop.run_in_executor(None, _clean_text, extracted_text)
+        timings["clean_seconds"] = time.monotonic() - stage_start
+
+        stage_start = time.monotonic()
+        await upload_blob_async(config.PROCESSED_BLOB_CONTAINER, output_blob_name, cleaned_content)
+        timings["upload_seconds"] = time.monotonic() - stage_start
+
+        if extraction_cache:
+            timings["cache"] = "miss"
+            await extraction_cache.put(content_md5, pdf_blob_name, cleaned_content)
+
+        return timings
+
+async def _publish_cached_extraction_async(extraction_cache: "ExtractionCache", content_md5: str, pdf_blob_name: str, output_blob_name: str, timings: Dict) -> bool:
+    """
+    Copies a previously extracted text into the processed container if the cache
+    holds one for this content hash. (Helper function, prefixed with _).
+    """
+    stage_start = time.monotonic()
+    cached_text = await extraction_cache.get(content_md5, pdf_blob_name)
+    if cached_text is None:
+        return False
+    timings["download_seconds"] += time.monotonic() - stage_start
+
+    stage_start = time.monotonic()
+    await upload_blob_async(config.PROCESSED_BLOB_CONTAINER, output_blob_name, cached_text)
+    timings["upload_seconds"] = time.monotonic() - stage_start
+    timings["cache"] = "hit"
+    return True
+
+class ExtractionCache:
+    """
+    A content-addressed cache of extracted PDF text, shared between runs.
+
+    Extracted text is stored in `EXTRACTION_CACHE_CONTAINER`, with one small
+    JSON entry per PDF MD5 (`entries/{md5}.json`) pointing to its text blob.
+    Entries are written one at a time, so cases pre-processing at the same
+    time, in one process or on separate replicas, never overwrite each
+    other's entries. Every entry records the extraction fingerprint it was
+    produced with; the fingerprint combines `EXTRACTION_CACHE_VERSION`, the
+    pypdf version and the source of the extraction and cleaning functions, so
+    changing `_clean_text` invalidates existing entries automatically. Setting
+    `EXTRACTION_CACHE_REFRESH` forces every PDF to be re-extracted and its
+    entry overwritten.
+    """
+
+    def __init__(self, refresh: bool = False):
+        self.refresh = refresh
+        self.fingerprint = self.compute_fingerprint()
+        self.hits = 0
+        self.misses = 0
+        self._loop_logger = logging.getLogger('LoopTracer')
+
+    @staticmethod
+    def compute_fingerprint() -> str:
+        """Identifies the extraction code and settings that produced a cached text."""
+        fingerprint_source = "\n".join([
+            str(config.EXTRACTION_CACHE_VERSION),
+            pypdf.__version__,
+            inspect.getsource(extract_page_range),
+            inspect.getsource(_clean_text),
+        ])
+        return hashlib.sha256(fingerprint_source.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def create(cls) -> "ExtractionCache":
+        """Returns a cache for this pre-processing run, honouring EXTRACTION_CACHE_REFRESH."""
+        if config.EXTRACTION_CACHE_REFRESH:
+            logging.info("EXTRACTION_CACHE_REFRESH is set. All PDFs will be re-extracted.")
+        return cls(refresh=config.EXTRACTION_CACHE_REFRESH)
+
+    @staticmethod
+    def _entry_blob_name(content_md5: str) -> str:
+        return f"entries/{content_md5}.json"
+
+    def _text_blob_name(self, content_md5: str) -> str:
+        return f"text/{self.fingerprint}/{content_md5}.txt"
+
+    async def get(self, content_md5: str, pdf_blob_name: str) -> str | None:
+        """Returns the cached text for a PDF hash, or None on a miss."""
+        if self.refresh:
+            return None
+        entry_text = await download_blob_as_text_async(config.EXTRACTION_CACHE_CONTAINER, self._entry_blob_name(content_md5))
+        if not entry_text:
+            return None
+        try:
+            entry = json.loads(entry_text)
+        except json.JSONDecodeError as e:
+            logging.warning(f"Extraction cache entry for md5 {content_md5} is unreadable and will be rebuilt. Reason: {e}")
+            return None
+        if entry.get("fingerprint") != self.fingerprint:
+            return None
+        cached_text = await download_blob_as_text_async(config.EXTRACTION_CACHE_CONTAINER, entry["text_blob"])
+        # The download helper returns "" on failure, so an empty result is only
+        # trusted when the cached extraction really was empty.
+        if not cached_text and entry.get("chars", 0) > 0:
+            return None
+        self.hits += 1
+        self._loop_logger.info(f"Extraction cache HIT for '{pdf_blob_name}' (md5 {content_md5}).")
+        return cached_text
+
+    async def put(self, content_md5: str, pdf_blob_name: str, cleaned_text: str):
+        """Stores a freshly extracted text, then the entry that points to it."""
+        self.misses += 1
+        self._loop_logger.info(f"Extraction cache MISS for '{pdf_blob_name}' (md5 {content_md5}).")
+        try:
+            text_blob_name = self._text_blob_name(content_md5)
+            await upload_blob_async(config.EXTRACTION_CACHE_CONTAINER, text_blob_name, cleaned_text)
+            entry = {
+                "fingerprint": self.fingerprint,
+                "text_blob": text_blob_name,
+                "source_blob": pdf_blob_name,
+                "chars": len(cleaned_text),
+            }
+            await upload_blob_async(config.EXTRACTION_CACHE_CONTAINER, self._entry_blob_name(content_md5), json.dumps(entry, indent=2))
+        except Exception as e:
+            # The cache is an optimisation only; a failed write must not fail pre-processing.
+            logging.warning(f"Failed to store extraction cache entry for '{pdf_blob_name}'. Reason: {e}")
+
+class SourceCorpus:
+    """
+    A per-run, in-memory snapshot of the processed source documents.
+
+    The corpus is downloaded once (concurrently, but kept in the container's
+    listing order) and each section then asks for a filtered view based on its
+    `source_exclude_files`. Views are built once per distinct exclusion list
+    and shared between sections, so sections with the same exclusions hold a
+    reference to the same string rather than a copy of it.
+
+    A corpus created with `expecting` starts empty and is filled by
+    `add_document_async` as each document is pre-processed, so a section can
+    use it as soon as the documents it needs are in. Documents are always kept
+    in listing order, whatever order they arrive in.
+    """
+
+    # Returned in place of the corpus when the container is empty, preserving the
+    # behaviour of the original per-section download.
+    EMPTY_CORPUS_MESSAGE = "ERROR: No source documents found in the specified container."
+
+    def __init__(self, container_name: str, documents: List[tuple[str, str]], download_seconds: float = 0.0):
+        self.container_name = container_name
+        # Each entry is a (filename, text) pair, in listing order.
+        self.documents = documents
+        self.download_seconds = download_seconds
+        self.total_bytes = sum(len(text.encode("utf-8")) for _, text in documents)
+        # Views are keyed by the exclusions and the number of documents in when built.
+        self._views: Dict[tuple, str] = {}
+        self.views_served = 0
+        # The position of each expected document, for a corpus filled as documents arrive.
+        self._positions: Dict[str, int] = {}
+        # A retrieval index is only built if a section actually needs it. Each is
+        # built from the documents a set of exclusions leaves, so it does not
+        # depend on whether excluded documents had arrived when it was built.
+        self._indexes: Dict[frozenset, BM25Index] = {}
+        self._index_lock = asyncio.Lock()
+
+    @classmethod
+    async def load(cls, container_name: str, max_concurrency: int = None) -> "SourceCorpus":
+        """Lists and concurrently downloads every source blob in the container."""
+        max_concurrency = max_concurrency or config.SOURCE_DOWNLOAD_CONCURRENCY
+        logging.info(f"--- Loading source corpus from container: {container_name} ---")
+        start_time = time.monotonic()
+
+        blob_names = await list_blobs_async(container_name)
+        if not blob_names:
+            logging.warning(f"No blobs found in container '{container_name}'.")
+            return cls(container_name, [])
+
+        # The semaphore bounds the number of open downloads. `asyncio.gather` returns
+        # results in the order the coroutines were passed in, so the corpus order is
+        # identical to the listing order regardless of which download finishes first.
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _download(blob_name: str) -> str:
+            async with semaphore:
+                return await download_blob_as_text_async(container_name, blob_name)
+
+        contents = await asyncio.gather(*[_download(blob_name) for blob_name in blob_names])
+        documents = [(os.path.basename(blob_name), text) for blob_name, text in zip(blob_names, contents)]
+
+        corpus = cls(container_name, documents, download_seconds=time.monotonic() - start_time)
+        logging.info(
+            f"--- Source corpus loaded: {len(documents)} documents, {corpus.total_bytes:,} bytes "
+            f"in {corpus.download_seconds:.2f}s ---"
+        )
+        return corpus
+
+    @classmethod
+    def expecting(cls, container_name: str, blob_names: List[str]) -> "SourceCorpus":
+        """Creates an empty corpus that the given blobs will be added to, in the order of their names."""
+        corpus = cls(container_name, [])
+        corpus._positions = {os.path.basename(blob_name): position for position, blob_name in enumerate(sorted(blob_names))}
+        return corpus
+
+    async def add_document_async(self, blob_name: str):
+        """Downloads a processed blob and adds it to the corpus in its listing position."""
+        start_time = time.monotonic()
+        text = await download_blob_as_text_async(self.container_name, blob_name)
+        self.download_seconds += time.monotonic() - start_time
+        filename = os.path.basename(blob_name)
+        self.documents.append((filename, text))
+        self.documents.sort(key=lambda document: (self._positions.get(document[0], len(self._positions)), document[0]))
+        self.total_bytes += len(text.encode("utf-8"))
+
+    @classmethod
+    def included_blobs(cls, blob_names: List[str], exclude_files: List[str] = None) -> List[str]:
+        """Returns the blobs that a section with these `source_exclude_files` uses."""
+        exclude_files_lower = frozenset(f.lower() for f in (exclude_files or []))
+        return [blob_name for blob_name in blob_names if not cls._is_excluded(os.path.basename(blob_name), exclude_files_lower)]
+
+    @staticmethod
+    def _is_excluded(filename: str, exclude_files_lower: frozenset) -> bool:
+        # Check against both the full filename (e.g., 'appendix a.pdf.txt') and the
+        # name without the '.txt' extension to provide flexibility in the config file.
+        filename_lower = filename.lower()
+        return filename_lower in exclude_files_lower or filename_lower.replace(".txt", "") in exclude_files_lower
+
+    def get_content(self, exclude_files: List[str] = None) -> str:
+        """Returns the concatenated source text, skipping any excluded files."""
+        if not self.documents:
+            return self.EMPTY_CORPUS_MESSAGE
+
+        # A case-insensitive comparison is used for the exclusion list to make the
+        # configuration more robust against user input variations (e.g., 'appendix a.pdf').
+        exclude_files_lower = frozenset(f.lower() for f in (exclude_files or []))
+        self.views_served += 1
+        view_key = (exclude_files_lower, len(self.documents))
+
+        if view_key not in self._views:
+            if exclude_files_lower:
+                logging.info(f"--- Building source view excluding files: {sorted(exclude_files_lower)} ---")
+            parts = []
+            for filename, text in self.documents:
+                if self._is_excluded(filename, exclude_files_lower):
+                    logging.info(f"Skipping excluded source file: {filename}")
+                    continue
+                parts.append(f"--- START OF FILE {filename} ---\n\n{text}\n\n--- END OF FILE {filename} ---\n\n")
+            self._views[view_key] = "".join(parts)
+
+        return self._views[view_key]
+
+    async def _get_index_async(self, exclude_files_lower: frozenset) -> BM25Index:
+        """Builds the BM25 retrieval index for a set of exclusions on first use, off the event loop."""
+        async with self._index_lock:
+            if exclude_files_lower not in self._indexes:
+                start_time = time.monotonic()
+                loop = asyncio.get_running_loop()
+                documents = [(filename, text) for filename, text in self.documents if not self._is_excluded(filename, exclude_files_lower)]
+                index = await loop.run_in_executor(
+                    None, BM25Index.from_documents, documents, config.RETRIEVAL_CHUNK_CHARS, config.RETRIEVAL_CHUNK_OVERLAP_CHARS
+                )
+                self._indexes[exclude_files_lower] = index
+                logging.info(f"--- Retrieval index built: {len(index.chunks)} chunks in {time.monotonic() - start_time:.2f}s ---")
+        return self._indexes[exclude_files_lower]
+
+    async def get_section_content_async(self, section_number: str, exclude_files: List[str], retrieval_query: str) -> str:
+        """
+        Returns the source text a section's prompts should contain, according to
+        `SOURCE_RETRIEVAL_MODE`:
+        - "full": every non-excluded document, as `get_content` returns it.
+        - "retrieval": the chunks most relevant to `retrieval_query`, up to `SOURCE_TOKEN_BUDGET`.
+        - "auto": the full text if it fits within the budget, otherwise retrieval.
+        """
+        full_content = self.get_content(exclude_files)
+        retrieval_mode = config.SOURCE_RETRIEVAL_MODE.lower()
+        full_tokens = estimate_tokens(full_content)
+        if not self.documents or retrieval_mode == "full" or (retrieval_mode == "auto" and full_tokens <= config.SOURCE_TOKEN_BUDGET):
+            return full_content
+
+        exclude_files_lower = frozenset(f.lower() for f in (exclude_files or []))
+        index = await self._get_index_async(exclude_files_lower)
+        chunks = select_chunks(index, retrieval_query, config.SOURCE_TOKEN_BUDGET, exclude_files_lower)
+        section_content = format_chunks(chunks)
+        logging.getLogger('LoopTracer').info(
+            f"Section {section_number}: retrieval selected {len(chunks)} of {len(index.chunks)} source chunks "
+            f"(~{estimate_tokens(section_content):,} of ~{full_tokens:,} tokens)."
+        )
+        return section_content
+
+    def stats(self) -> Dict[str, float]:
+        """Returns download and reuse statistics for the run summary."""
+        return {
+            "documents": len(self.documents),
+            "total_bytes": self.total_bytes,
+            "download_seconds": round(self.download_seconds, 3),
+            "views_served": self.views_served,
+            "distinct_views": len(self._views),
+            # Every view after the first would previously have re-downloaded the whole corpus.
+            "downloads_avoided": max(self.views_served - 1, 0) * len(self.documents),
+            "bytes_not_redownloaded": max(self.views_served - 1, 0) * self.total_bytes,
+        }
+
 async def read_guidance_files_async(file_paths: list) -> str:
     """Asynchronously reads local guidance files without blocking."""
     loop = asyncio.get_running_loop()
@@ -427,6 +828,158 @@ def parse_feedback_and_count_issues(feedback_content: str) -> Dict[str, int]:
 
     return counts
 
+# Matches the "**Critical Issues:**" and "**Standard Issues:**" lists of a feedback report.
+_ISSUE_LIST_PATTERN = re.compile(r'^\*\*(Critical|Standard) Issues:\*\*(.*?)(?=^\*\*[^*\n]+:\*\*\s*$|^#|^\[|\Z)', re.DOTALL | re.MULTILINE | re.IGNORECASE)
+# An issue that names its field: "- **Key:** description".
+_FIELD_ISSUE_PATTERN = re.compile(r'^(?:[-*]|\d+[.)])\s+\*\*(.+?):\*\*\s*(.*)$', re.DOTALL)
+_LIST_MARKER_PATTERN = re.compile(r'^(?:[-*]|\d+[.)])\s+')
+
+def parse_feedback_issues(feedback_content: str) -> Dict[str, List[Dict[str, str]]] | None:
+    """
+    Extracts the individual issues from a feedback report's "Critical Issues"
+    and "Standard Issues" lists. Each issue is {"field": key label or None,
+    "text": description}.
+
+    Returns None if the lists are missing or disagree with the counts in the
+    [FEEDBACK_SUMMARY] block, since the issues then cannot be relied upon.
+    """
+    issues = {"critical": [], "standard": []}
+    found_lists = set()
+    for match in _ISSUE_LIST_PATTERN.finditer(feedback_content or ""):
+        severity = match.group(1).lower()
+        found_lists.add(severity)
+        for line in match.group(2).strip().splitlines():
+            line = line.strip()
+            if not line or line.rstrip(".").lower() == "none":
+                continue
+            if _LIST_MARKER_PATTERN.match(line):
+                field_match = _FIELD_ISSUE_PATTERN.match(line)
+                if field_match:
+                    issues[severity].append({"field": field_match.group(1).strip(), "text": field_match.group(2).strip()})
+                else:
+                    issues[severity].append({"field": None, "text": _LIST_MARKER_PATTERN.sub("", line)})
+            elif issues[severity]:
+                # A continuation of the previous issue's description.
+                issues[severity][-1]["text"] += f" {line}"
+            else:
+                issues[severity].append({"field": None, "text": line})
+
+    counts = parse_feedback_and_count_issues(feedback_content)
+    if found_lists != {"critical", "standard"} or any(len(issues[severity]) != counts.get(severity) for severity in issues):
+        return None
+    return issues
+
+def parse_field_verdicts(reply: str) -> Dict[str, List[Dict[str, str]]] | None:
+    """
+    Extracts the issues from a Fact_Checker's [FIELD_VERDICTS] block, where each
+    line reads "- **Key:** CRITICAL: description" (or STANDARD). Returns None if
+    there is no block or a line cannot be read.
+    """
+    block = re.search(r'\[FIELD_VERDICTS\](.*?)(?:\[END_FIELD_VERDICTS\]|\Z)', reply or "", re.DOTALL)
+    if not block:
+        return None
+    verdicts = {"critical": [], "standard": []}
+    for line in block.group(1).strip().splitlines():
+        line = line.strip()
+        if not line or line.upper() == "ALL FACTS VERIFIED":
+            continue
+        field_match = _FIELD_ISSUE_PATTERN.match(line)
+        severity_match = re.match(r'^(CRITICAL|STANDARD)\s*:\s*(.*)$', field_match.group(2), re.IGNORECASE) if field_match else None
+        if not severity_match:
+            return None
+        verdicts[severity_match.group(1).lower()].append({"field": field_match.group(1).strip(), "text": severity_match.group(2).strip()})
+    return verdicts
+
+def diff_markdown_fields(previous_content: str, current_content: str) -> Dict[str, List[str]]:
+    """
+    Compares two drafts in the `parse_markdown_to_dict` key space. Returns the
+    sanitised keys that were "changed", "added" and "removed".
+    """
+    previous_fields = parse_markdown_to_dict(previous_content)
+    current_fields = parse_markdown_to_dict(current_content)
+    return {
+        "changed": [key for key in current_fields if key in previous_fields and current_fields[key] != previous_fields[key]],
+        "added": [key for key in current_fields if key not in previous_fields],
+        "removed": [key for key in previous_fields if key not in current_fields],
+    }
+
+def plan_incremental_validation(previous_draft: str, current_draft: str, previous_feedback: str) -> Dict[str, any] | None:
+    """
+    Works out what an incremental validation of `current_draft` must re-check,
+    given the previous draft and its feedback report.
+
+    Returns None when the whole draft must be validated again: fields were added
+    or removed, or the previous issues cannot be read or are not all tied to a
+    field of the draft. Otherwise returns:
+    - "changed_keys": the sanitised keys of the fields whose value changed.
+    - "changed_fields": those fields' **Key:** value blocks, as written in the draft.
+    - "carried_issues": the previous issues of the unchanged fields, by severity.
+    """
+    field_diff = diff_markdown_fields(previous_draft, current_draft)
+    if field_diff["added"] or field_diff["removed"]:
+        logging.info(f"Fields were added or removed ({', '.join(field_diff['added'] + field_diff['removed'])}). Validating the whole draft.")
+        return None
+
+    previous_issues = parse_feedback_issues(previous_feedback)
+    if previous_issues is None:
+        logging.info("The previous feedback report's issues could not be read. Validating the whole draft.")
+        return None
+    current_keys = set(parse_markdown_to_dict(current_draft))
+    if any(issue["field"] is None or _sanitise_key(issue["field"]) not in current_keys for issues in previous_issues.values() for issue in issues):
+        logging.info("The previous feedback report has issues that are not tied to a field of the draft. Validating the whole draft.")
+        return None
+
+    changed_keys = set(field_diff["changed"])
+    return {
+        "changed_keys": field_diff["changed"],
+        "changed_fields": "".join(match.group(0) for match in _KEY_VALUE_PATTERN.finditer(current_draft) if _sanitise_key(match.group(1).strip()) in changed_keys).strip(),
+        "carried_issues": {
+            severity: [issue for issue in issues if _sanitise_key(issue["field"]) not in changed_keys]
+            for severity, issues in previous_issues.items()
+        },
+    }
+
+def format_feedback_report(issues: Dict[str, List[Dict[str, str]]], assessment: str) -> str:
+    """
+    Writes issues in the standard feedback report format, with the
+    [FEEDBACK_SUMMARY] counts taken from the issue lists themselves.
+    """
+    def _issue_list(severity: str) -> str:
+        if not issues[severity]:
+            return "None"
+        return "\n".join(f"- **{issue['field']}:** {issue['text']}" if issue["field"] else f"- {issue['text']}" for issue in issues[severity])
+
+    passed = not issues["critical"]
+    return f"""[FEEDBACK_SUMMARY]
+Overall Status: {"PASS" if passed else "FAIL"}
+Critical: {len(issues["critical"])}
+Standard: {len(issues["standard"])}
+[END_FEEDBACK_SUMMARY]
+
+### Detailed Feedback
+
+**Overall Assessment:**
+The document {"PASSES" if passed else "FAILS"}. {assessment}
+
+**Critical Issues:**
+{_issue_list("critical")}
+
+**Standard Issues:**
+{_issue_list("standard")}
+"""
+
+# This regex is designed to find key-value pairs. It looks for a **Key:** at the
+# start of a line (`^`), captures the key (`.*?`), and then captures all content
+# (`.*?`) until it hits the next key, a markdown header, a horizontal rule,
+# or the end of the file (`\Z`). This makes it robust to multi-line values.
+_KEY_VALUE_PATTERN = re.compile(r'^\*\*(.*?):\*\*(.*?)(?=^\*\*|^##\s|---\n|\Z)', re.DOTALL | re.MULTILINE)
+
+def iter_markdown_fields(markdown_content: str):
+    """Yields (raw key, value) for every **Key:** field of a markdown document, in order."""
+    for match in _KEY_VALUE_PATTERN.finditer(markdown_content):
+        # The raw key is something like "Comms & Interaction Need 1"
+        yield match.group(1).strip(), match.group(2).strip()
+
 def parse_markdown_to_dict(markdown_content: str) -> dict[str,any]:
     """
     Parses a markdown document assuming every **Key:** is globally unique.
@@ -435,17 +988,7 @@ def parse_markdown_to_dict(markdown_content: str) -> dict[str,any]:
 
     flat_context = {}
     
-    # This regex is designed to find key-value pairs. It looks for a **Key:** at the
-    # start of a line (`^`), captures the key (`.*?`), and then captures all content
-    # (`.*?`) until it hits the next key, a markdown header, a horizontal rule,
-    # or the end of the file (`\Z`). This makes it robust to multi-line values.
-    pattern = re.compile(r'^\*\*(.*?):\*\*(.*?)(?=^\*\*|^##\s|---\n|\Z)', re.DOTALL | re.MULTILINE)
-    
-    for match in pattern.finditer(markdown_content):
-        # The raw key is something like "Comms & Interaction Need 1"
-        key_raw = match.group(1).strip()
-        value = match.group(2).strip()
-        
+    for key_raw, value in iter_markdown_fields(markdown_content):
         # The sanitiser turns it into "comms_interaction_need_1"
         final_key = _sanitise_key(key_raw)
         
@@ -453,6 +996,46 @@ def parse_markdown_to_dict(markdown_content: str) -> dict[str,any]:
             
     return flat_context
 
+def parse_field_edits(reply: str) -> Dict[str, str]:
+    """
+    Extracts the field-level edits from a writer's [FIELD_EDITS] block.
+    Returns {raw key: new value}, or an empty dict if there is no block.
+    """
+    block = re.search(r'\[FIELD_EDITS\](.*?)(?:\[END_FIELD_EDITS\]|\Z)', reply, re.DOTALL)
+    if not block:
+        return {}
+    return {match.group(1).strip(): match.group(2).strip() for match in _KEY_VALUE_PATTERN.finditer(block.group(1).strip())}
+
+def apply_field_edits(markdown_content: str, edits: Dict[str, str]) -> tuple[str, list[str]]:
+    """
+    Replaces the value of each edited **Key:** in a markdown document, matching
+    keys as `parse_markdown_to_dict` does. Headings, ordering and every other
+    field are left untouched.
+
+    Returns the edited document and the keys that were not found in it.
+    """
+    edits_by_key = {_sanitise_key(key): (key, value) for key, value in edits.items()}
+    applied = set()
+
+    def _replace(match: re.Match) -> str:
+        key = _sanitise_key(match.group(1).strip())
+        if key not in edits_by_key:
+            return match.group(0)
+        applied.add(key)
+        old_value = match.group(2)
+        # The whitespace around the value is kept so the layout of the document is
+        # unchanged, down to the absence of a final newline after the last field.
+        if old_value.strip():
+            leading = old_value[:len(old_value) - len(old_value.lstrip())] or " "
+            trailing = old_value[len(old_value.rstrip()):]
+        else:
+            leading, trailing = " ", old_value
+        return f"**{match.group(1)}:**{leading}{edits_by_key[key][1]}{trailing}"
+
+    edited_content = _KEY_VALUE_PATTERN.sub(_replace, markdown_content)
+    unknown_keys = [raw_key for key, (raw_key, _) in edits_by_key.items() if key not in applied]
+    return edited_content, unknown_keys
+
 
 # ==============================================================================
 # 4. DOCUMENT GENERATION UTILITIES
@@ -6,15 +6,30 @@ generation pipeline. It orchestrates the entire application lifecycle from
 initial setup to final cleanup.
 
 Key Responsibilities:
-- Initialises local directories and a unique run ID for traceability.
-- Executes the high-level, asynchronous workflow:
+- Initialises local directories, logging and the services shared by every
+  case run in the process: the LLM gateway and scheduler, telemetry, the
+  record/replay cache, the agent pool and the Prompt_Writer.
+- Runs one case (`run_case_async`), or a batch of cases concurrently, one per
+  prefix of the source container (`--cases`), at most `CONCURRENT_CASES` at a
+  time. Each case has a unique run ID for traceability, and every blob it
+  writes to `processed-docs`, `outputs` and `final-document` is named under
+  that ID (see `utils/run_scope.py`), so cases never see or clean up each
+  other's files.
+- Executes each case's asynchronous workflow as a graph of stages (see
+  `orchestration/stages.py`), each started as soon as its dependencies are done:
     1. Pre-processes source PDFs from Azure Blob Storage.
-    2. Kicks off the concurrent processing of all document sections.
+    2. Processes each document section concurrently, as soon as the source
+       documents it uses are pre-processed.
     3. Manages the final merge of validated sections.
     4. Generates the final Word document from the merged markdown.
-- Implements a guaranteed `finally` block to ensure that all run artifacts
-  (logs, outputs, source files) are archived and that temporary containers
-  are cleaned up, regardless of whether the run succeeded or failed.
+- Journals each case's progress (see `orchestration/run_state.py`), so that a
+  run that stopped part-way can be resumed with `--resume <run_id>`: documents
+  already pre-processed and sections already passed are skipped, and every
+  other section restarts from its last validated draft.
+- Implements a guaranteed `finally` block in each case to ensure that all run
+  artifacts (logs, outputs, source files) are archived and that the case's
+  temporary blobs are cleaned up once their archive copies are verified,
+  regardless of whether the case succeeded or failed.
 """
 
 import os
@@ -24,117 +39,291 @@ import time
 import asyncio
 import litellm
 import uuid
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Dict, List
 from dotenv import load_dotenv
 
 # The 'src' directory is now the root for the execution.
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from .ehcp_autogen import config 
-from .ehcp_autogen.logging_config import setup_logging
+from .ehcp_autogen import config
+from .ehcp_autogen.logging_config import setup_logging, add_run_log_handlers, remove_run_log_handlers
 from .ehcp_autogen.config import llm_config, llm_config_fast
 from .ehcp_autogen.orchestration.orchestrator import process_section
+from .ehcp_autogen.orchestration.convergence import get_section_outcomes, iteration_histogram, reset_convergence_trackers
+from .ehcp_autogen.orchestration.scheduling import create_section_scheduler, get_section_scheduler
+from .ehcp_autogen.orchestration.stages import create_stage_graph, get_stage_graph
+from .ehcp_autogen.orchestration.run_state import create_run_state_journal, load_run_state_journal
+from .ehcp_autogen.utils.feedback import feedback_report_stats
 from .ehcp_autogen.agents.specialist_agents import create_prompt_writer_agent
+from .ehcp_autogen.agents.agent_pool import get_agent_pool
+from .ehcp_autogen.llm import gateway
+from .ehcp_autogen.llm.scheduler import install_scheduler, get_scheduler
+from .ehcp_autogen.llm.telemetry import install_telemetry, get_telemetry, set_call_tags, ContextPropagatingExecutor
+from .ehcp_autogen.llm.replay import install_replay_cache
 from .ehcp_autogen.utils.utils import (
     preprocess_all_pdfs_async,
+    list_blob_md5s_async,
     merge_output_files_async,
-    clear_blob_container_async,
     parse_markdown_to_dict,
     generate_word_document,
     download_blob_as_text_async,
     upload_blob_async,
-    archive_run_artifacts
+    SourceCorpus,
+    get_blob_read_cache
 )
+from .ehcp_autogen.utils.run_scope import set_run_scope
+from .ehcp_autogen.utils.prevalidation import get_prevalidator
+from .ehcp_autogen.utils.bulk_operations import archive_run_artifacts, clear_blob_container_async
 
 # Load environment variables
 load_dotenv()
 
-async def main_async():
-    """Main async function that contains the entire application lifecycle."""
+
+@dataclass
+class CaseResult:
+    """How one case ended, as returned by `run_case_async`."""
+    run_id: str
+    source_prefix: str = ""
+    succeeded: bool = False
+    seconds: float = 0.0
+    section_outcomes: Dict[str, Dict[str, object]] = field(default_factory=dict)
+    iteration_histogram: Dict[int, int] = field(default_factory=dict)
+    stages: Dict[str, object] = field(default_factory=dict)
+    section_schedule: Dict[str, object] = field(default_factory=dict)
+    archive: Dict[str, object] = field(default_factory=dict)
+
+
+async def run_case_async(run_timestamp: str, prompt_writer, source_prefix: str = None, resume_run_id: str = None) -> CaseResult:
+    """
+    Runs one case: the documents under `source_prefix` in the source container
+    (the whole container if it is empty), from pre-processing to the archived
+    Word document. Must be called from its own asyncio task, as the case's run
+    scope, journal, stage graph and section scheduler are held in context
+    variables. The case's own lines are also written to log files of its own,
+    named after `run_timestamp` and the run ID, which are archived with it.
+
+    With `resume_run_id`, the run of that ID is resumed from its journal
+    instead of a new run being started. It keeps its run ID and reads the
+    source prefix recorded in the journal, so its artifacts are archived
+    alongside those of its earlier attempts.
+    """
     start_time = time.monotonic()
-    run_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     short_uuid = str(uuid.uuid4())[:4]
-    # A unique run_id is generated for each execution to ensure all artifacts
+    # A unique run_id is generated for each case to ensure all artifacts
     # (logs, outputs, archives) from a single run can be traced and audited.
-    run_id = f"{run_timestamp}_{short_uuid}"
-
-    setup_logging(run_timestamp)
-
-    # Caching is disabled to ensure that each run is deterministic and uses the
-    # latest instructions, which is critical during development and for auditability.
-    litellm.caching = False
+    run_id = resume_run_id or f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{short_uuid}"
+    # Every blob name the case uses, and every LLM call it makes, is scoped to its run ID from here on.
+    run_scope = set_run_scope(run_id, source_prefix)
+    set_call_tags(run=run_id)
+    reset_convergence_trackers()
+    run_log_handlers = add_run_log_handlers(run_id, run_timestamp)
 
-    litellm.max_retries = 5
     loop_logger = logging.getLogger('LoopTracer')
     # This flag tracks the overall success of the run, determining whether to
     # upload a 'fail.txt' marker and influencing final log messages.
     process_completed_successfully = False
+    # A resume that is rejected, or that finds the run already complete, makes
+    # no attempt: it leaves no fail marker and archives and clears nothing.
+    run_attempted = not resume_run_id
+    run_state = None
+    case_result = CaseResult(run_id, run_scope.source_prefix)
 
     try:
-        loop_logger.info("Main process started.")
-        
+        loop_logger.info(f"Run started for {f'source prefix {run_scope.source_prefix!r}' if run_scope.source_prefix else 'the whole source container'}.")
+
+        # --- RUN STATE JOURNAL ---
+        # A resumed run reads the same case as its earlier attempts, and
+        # restores their checkpoints into its scratch blobs, which are first
+        # emptied of anything an interrupted attempt left behind.
+        if resume_run_id:
+            run_state = await load_run_state_journal(resume_run_id)
+            if run_state is None:
+                logging.critical(f"Run '{resume_run_id}' cannot be resumed: it has no run-state journal.")
+                return case_result
+            run_scope = set_run_scope(run_id, run_state.source_prefix)
+            case_result.source_prefix = run_scope.source_prefix
+
+        source_md5s = await list_blob_md5s_async(config.SOURCE_BLOB_CONTAINER)
+
+        if resume_run_id:
+            if run_state.succeeded:
+                loop_logger.info(f"Run '{resume_run_id}' has already completed. Nothing to resume.")
+                process_completed_successfully = True
+                return case_result
+            if run_state.state["source_md5s"] != source_md5s:
+                logging.critical(f"Run '{resume_run_id}' cannot be resumed: the source documents have changed since it started.")
+                run_state = None
+                return case_result
+            loop_logger.info(f"Resuming run '{resume_run_id}' (attempt {run_state.state['attempts'] + 1}).")
+            run_attempted = True
+            await clear_blob_container_async(config.PROCESSED_BLOB_CONTAINER)
+            await clear_blob_container_async(config.OUTPUT_BLOB_CONTAINER)
+            await run_state.restore_async()
+        elif config.RUN_STATE_JOURNAL_ENABLED:
+            run_state = create_run_state_journal(run_id, run_scope.source_prefix)
+        if run_state:
+            await run_state.start_attempt(source_md5s)
+
+        # --- STAGE GRAPH ---
+        # Each stage of the run starts as soon as the stages it depends on have
+        # succeeded: a section as soon as the documents it uses are pre-processed,
+        # and the merge as soon as the last section passes.
+        stage_graph = create_stage_graph()
+        pdf_blob_names = [name for name in source_md5s if name.lower().endswith('.pdf')]
+        sections_to_process = [str(i) for i in range(1, config.TOTAL_SECTIONS + 1)]
+        # The source documents each section uses, after its exclusions.
+        section_sources = {
+            sec_id: SourceCorpus.included_blobs(pdf_blob_names, config.get_section_config(sec_id).get("source_exclude_files", []))
+            for sec_id in sections_to_process
+        }
+        # Documents used by the most sections are pre-processed first, so that
+        # sections which exclude a large document need not wait for it.
+        users = Counter(name for names in section_sources.values() for name in names)
+        source_md5s = {name: source_md5s[name] for name in sorted(pdf_blob_names, key=lambda name: -users[name])}
+
+        # --- SOURCE CORPUS ---
+        # The processed sources are downloaded once, each as soon as it is ready, and shared by every section.
+        source_corpus = SourceCorpus.expecting(config.PROCESSED_BLOB_CONTAINER, [f"{name}.txt" for name in pdf_blob_names])
+
+        async def _document_ready(pdf_blob_name: str, processed_blob_name: str | None, started_at: float):
+            if processed_blob_name:
+                await source_corpus.add_document_async(processed_blob_name)
+            stage_graph.finish_stage(f"extract:{pdf_blob_name}", True, started_at)
+            if run_state:
+                await run_state.record_document(pdf_blob_name, processed_blob_name)
+
+        # Documents pre-processed by an earlier attempt were restored above.
+        preprocessed_documents = run_state.preprocessed_documents() if run_state else {}
+
         # --- PRE-PROCESSING ---
-        is_preprocessing_successful = await preprocess_all_pdfs_async()
-        if not is_preprocessing_successful:
-            logging.critical("Pre-processing failed. Aborting main process.")
-            return # This will still trigger the finally block for cleanup
+        async def _preprocess() -> bool:
+            for pdf_blob_name, processed_blob_name in preprocessed_documents.items():
+                if processed_blob_name:
+                    await source_corpus.add_document_async(processed_blob_name)
+                stage_graph.finish_stage(f"extract:{pdf_blob_name}", True)
+            remaining_md5s = {name: md5 for name, md5 in source_md5s.items() if name not in preprocessed_documents}
+            is_preprocessing_successful = True
+            if remaining_md5s:
+                is_preprocessing_successful = await preprocess_all_pdfs_async(remaining_md5s, on_document_ready=_document_ready)
+            if run_state:
+                await run_state.finish_preprocessing(is_preprocessing_successful)
+            # A document that was never reported fails the sections that use it.
+            for pdf_blob_name in pdf_blob_names:
+                stage_graph.finish_stage(f"extract:{pdf_blob_name}", False)
+            if not is_preprocessing_successful:
+                logging.critical("Pre-processing failed. Sections that use the unprocessed documents will not run.")
+                return False
+            loop_logger.info(
+                f"Pre-processing complete. Source corpus loaded: {len(source_corpus.documents)} documents, "
+                f"{source_corpus.total_bytes:,} bytes in {source_corpus.download_seconds:.2f}s."
+            )
+            return True
+
+        stage_graph.add_stage("preprocess", _preprocess)
+        for pdf_blob_name in pdf_blob_names:
+            stage_graph.add_stage(f"extract:{pdf_blob_name}")
 
-        loop_logger.info("Pre-processing complete. Starting agent workflow.")
-        
         # --- CONCURRENT SECTIONAL PROCESSING ---
-        prompt_writer = create_prompt_writer_agent(llm_config_fast)
-        semaphore = asyncio.Semaphore(config.CONCURRENT_SECTIONS)
-        
+        # Admits CONCURRENT_SECTIONS sections at a time, longest estimated first.
+        section_scheduler = create_section_scheduler()
+
         logging.info(f"Starting concurrent processing for {config.TOTAL_SECTIONS} sections...")
-        
-        sections_to_process = [str(i) for i in range(1, config.TOTAL_SECTIONS + 1)]
-        processing_tasks = [
-            process_section(sec_id, semaphore, llm_config, llm_config_fast, prompt_writer)
-            for sec_id in sections_to_process
-        ]
-        
-        section_results = await asyncio.gather(*processing_tasks)
-        process_completed_successfully = all(section_results)
 
-        if not process_completed_successfully:
-            logging.error("Process stopped before final merge due to failures in sectional generation.")
-        else:
-            # --- FINAL MERGE AND WORD DOCUMENT GENERATION ---
+        for sec_id in sections_to_process:
+            # A section that passed in an earlier attempt is not run again; its final draft was restored above.
+            if run_state and run_state.section_passed(sec_id):
+                loop_logger.info(f"Section {sec_id}: Passed in an earlier attempt, skipped.")
+                stage_graph.add_stage(f"section:{sec_id}")
+                stage_graph.finish_stage(f"section:{sec_id}", True)
+                continue
+            source_stages = [f"extract:{name}" for name in section_sources[sec_id]]
+            # In "phased" mode no section starts until every document is pre-processed.
+            if config.STAGE_SCHEDULING.lower() == "phased":
+                source_stages.append("preprocess")
+            stage_graph.add_stage(
+                f"section:{sec_id}",
+                lambda section_number=sec_id: process_section(section_number, section_scheduler, llm_config, llm_config_fast, prompt_writer, source_corpus),
+                source_stages,
+            )
+
+        # --- FINAL MERGE AND WORD DOCUMENT GENERATION ---
+        async def _merge() -> bool:
             logging.info(f"\n{'#'*25} CREATING FINAL DOCUMENT {'#'*25}")
             merge_success = await merge_output_files_async()
-
             if not merge_success:
                 logging.error("Failed to merge sectional documents.")
-                process_completed_successfully = False
-            else:
-                # This sub-try block handles errors in Word generation without losing the successful merge status
-                try:
-                    logging.info("Downloading final markdown from blob...")
-                    final_markdown_content = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, config.FINAL_DOCUMENT_FILENAME)
-                    
-                    logging.info("Parsing final markdown to generate Word document.")
-                    final_data_context = parse_markdown_to_dict(final_markdown_content)
-                    
-                    template_path = os.path.join(config.TEMPLATES_DIR, "template.docx")
-                    temp_output_doc_path = os.path.join(config.OUTPUTS_DIR, "draft_EHCP.docx")
-                    generate_word_document(final_data_context, template_path, temp_output_doc_path)
-
-                    output_blob_name = "draft_EHCP.docx"
-                    logging.info(f"Uploading final Word document to blob: {output_blob_name}")
-                    with open(temp_output_doc_path, "rb") as docx_file:
-                        await upload_blob_async(config.FINAL_DOCUMENT_CONTAINER, output_blob_name, docx_file.read())
-                    
-                    logging.info(f"✅ Final Word document successfully generated and uploaded.")
-                
-                except Exception as e:
-                    logging.error(f"Failed during Word document generation phase. Reason: {e}", exc_info=True)
-                    process_completed_successfully = False
-        
+            return merge_success
+
+        async def _render() -> bool:
+            # Errors in Word generation are caught here, so the merged document is still archived.
+            try:
+                logging.info("Downloading final markdown from blob...")
+                final_markdown_content = await download_blob_as_text_async(config.OUTPUT_BLOB_CONTAINER, config.FINAL_DOCUMENT_FILENAME)
+
+                logging.info("Parsing final markdown to generate Word document.")
+                final_data_context = parse_markdown_to_dict(final_markdown_content)
+
+                template_path = os.path.join(config.TEMPLATES_DIR, "template.docx")
+                # Named after the run, as cases in a batch render at the same time.
+                temp_output_doc_path = os.path.join(config.OUTPUTS_DIR, f"draft_EHCP_{run_id}.docx")
+                generate_word_document(final_data_context, template_path, temp_output_doc_path)
+
+                output_blob_name = "draft_EHCP.docx"
+                logging.info(f"Uploading final Word document to blob: {output_blob_name}")
+                with open(temp_output_doc_path, "rb") as docx_file:
+                    await upload_blob_async(config.FINAL_DOCUMENT_CONTAINER, output_blob_name, docx_file.read())
+                os.remove(temp_output_doc_path)
+
+                logging.info(f"✅ Final Word document successfully generated and uploaded.")
+                return True
+            except Exception as e:
+                logging.error(f"Failed during Word document generation phase. Reason: {e}", exc_info=True)
+                return False
+
+        stage_graph.add_stage("merge", _merge, [f"section:{sec_id}" for sec_id in sections_to_process])
+        stage_graph.add_stage("render", _render, ["merge"])
+
+        stage_results = await stage_graph.run()
+        process_completed_successfully = stage_results.get("render", False)
+        if not all(stage_results.get(f"section:{sec_id}") for sec_id in sections_to_process):
+            logging.error("Process stopped before final merge due to failures in sectional generation.")
+
+        stage_report = stage_graph.report()
+        loop_logger.info(
+            f"Stages ({config.STAGE_SCHEDULING}): makespan {stage_report['makespan_seconds']:.1f}s; critical path "
+            + " -> ".join(f"{record.name} ({record.seconds:.1f}s)" for record in stage_graph.critical_path())
+        )
+
+        schedule_report = section_scheduler.makespan_report()
+        if schedule_report:
+            loop_logger.info(
+                f"Section scheduling ({schedule_report['policy']}): started in order {', '.join(schedule_report['start_order'])}; "
+                f"makespan {schedule_report['makespan_seconds']:.1f}s. Simulated with the same durations and release times: "
+                f"{schedule_report['simulated_makespan_seconds']:.1f}s in this order, {schedule_report['fifo_makespan_seconds']:.1f}s in FIFO order."
+            )
+        # Replayed runs take no model time, and resumed sections only part of
+        # theirs, so either would distort the estimates.
+        llm_telemetry = get_telemetry()
+        if config.LLM_CACHE_MODE != "replay" and not resume_run_id:
+            section_usage = llm_telemetry.section_summary(run_id) if llm_telemetry else {}
+            section_iterations = {section_number: outcome["iterations"] for section_number, outcome in get_section_outcomes().items()}
+            section_scheduler.record_history(section_iterations, section_usage)
+
+        corpus_stats = source_corpus.stats()
+        loop_logger.info(
+            f"Source corpus reuse: {corpus_stats['views_served']} section views from {corpus_stats['distinct_views']} distinct builds; "
+            f"{corpus_stats['downloads_avoided']} blob downloads ({corpus_stats['bytes_not_redownloaded']:,} bytes) avoided."
+        )
+
         # --- FINAL SUMMARY LOGGING ---
         logging.info(f"\n{'#'*25} PROCESS COMPLETE {'#'*25}")
         end_time = time.monotonic()
         total_duration_minutes = (end_time - start_time) / 60
-        
+
         loop_logger.info("=" * 40)
         loop_logger.info("            RUN SUMMARY")
         loop_logger.info("=" * 40)
@@ -143,49 +332,207 @@ async def main_async():
         else:
             loop_logger.info("Overall Status: FAILED / STOPPED EARLY")
         loop_logger.info(f"Total Execution Time: {total_duration_minutes:.2f} minutes")
+        for section_number, section_outcome in get_section_outcomes().items():
+            loop_logger.info(
+                f"Section {section_number}: {section_outcome['outcome']} after {section_outcome['iterations']} iteration(s), "
+                f"critical issues per iteration {section_outcome['critical_history']}"
+            )
+        histogram = iteration_histogram()
+        if histogram:
+            loop_logger.info("Iteration histogram: " + ", ".join(f"{iterations} iteration(s): {sections} section(s)" for iterations, sections in histogram.items()))
         loop_logger.info("=" * 40)
 
+    except Exception as e:
+        # Caught here, so one case's failure does not stop the other cases of a batch.
+        logging.critical(f"Run '{run_id}' failed with an unexpected error: {e}", exc_info=True)
+
     # The 'finally' block is critical. It guarantees that cleanup and archiving
-    # operations run every time, even if a critical, unhandled exception occurs 
+    # operations run every time, even if a critical, unhandled exception occurs
     # during the main process. This prevents leaving the system in a dirty state
     #  for the next run.
     finally:
-        if not process_completed_successfully:
-            try:
-                logging.warning("--- Process failed. Uploading 'fail.txt' to the output container. ---")
-                # The 'fail.txt' file acts as a simple, explicit marker in blob storage,
-                # allowing external systems (Flow) to easily determine if the process 
-                # completed successfully without parsing logs.
-                await upload_blob_async(
-                    container_name=config.OUTPUT_BLOB_CONTAINER,
-                    blob_name="fail.txt",
-                    data=b""  # Upload empty bytes to create an empty file
-                )
-                logging.info("Successfully uploaded 'fail.txt'.")
-            except Exception as e:
-                # Log an error if the fail marker itself fails, but don't crash.
-                logging.error(f"Failed to upload 'fail.txt' failure marker. Reason: {e}", exc_info=True)
-                
-        print("\n--- Archiving run artifacts. ---")
-        await archive_run_artifacts(run_id, run_timestamp)
-
-        print("\n--- Running final cleanup process. ---")
-        await clear_blob_container_async(config.PROCESSED_BLOB_CONTAINER)
-        await clear_blob_container_async(config.OUTPUT_BLOB_CONTAINER)
-        
-        print("\n--- Clearing source documents for next run. ---")
-        #await clear_blob_container_async(config.SOURCE_BLOB_CONTAINER)
+        if run_attempted:
+            if not process_completed_successfully:
+                try:
+                    logging.warning("--- Process failed. Uploading 'fail.txt' to the output container. ---")
+                    # The 'fail.txt' file acts as a simple, explicit marker in blob storage,
+                    # allowing external systems (Flow) to easily determine if the process
+                    # completed successfully without parsing logs. Like every output of
+                    # the run, it is written under the run ID: `outputs/<run_id>/fail.txt`.
+                    await upload_blob_async(
+                        container_name=config.OUTPUT_BLOB_CONTAINER,
+                        blob_name="fail.txt",
+                        data=b""  # Upload empty bytes to create an empty file
+                    )
+                    logging.info("Successfully uploaded 'fail.txt'.")
+                except Exception as e:
+                    # Log an error if the fail marker itself fails, but don't crash.
+                    logging.error(f"Failed to upload 'fail.txt' failure marker. Reason: {e}", exc_info=True)
+
+            if run_state:
+                try:
+                    await run_state.finish_run(process_completed_successfully)
+                    if not process_completed_successfully:
+                        loop_logger.info(f"Run state saved. Resume this run with: python -m src.main --resume {run_id}")
+                except Exception as e:
+                    logging.error(f"Failed to save the run-state journal. Reason: {e}", exc_info=True)
+
+            llm_telemetry = get_telemetry()
+            if llm_telemetry:
+                try:
+                    llm_telemetry.write_prometheus_textfile()
+                except OSError as e:
+                    logging.error(f"Failed to write LLM telemetry textfile. Reason: {e}")
+
+            print(f"\n--- Archiving run artifacts of {run_id}. ---")
+            archive_report = await archive_run_artifacts(run_id, run_timestamp)
+
+            print(f"\n--- Running final cleanup process for {run_id}. ---")
+            # The run's blobs in a container are only cleared once every one of them has been archived.
+            for container_name in (config.PROCESSED_BLOB_CONTAINER, config.OUTPUT_BLOB_CONTAINER):
+                if archive_report.is_verified(container_name):
+                    await clear_blob_container_async(container_name)
+                else:
+                    logging.error(f"Container '{container_name}' was not cleared, as some of its blobs could not be archived: {archive_report.failed[container_name]}")
+
+            print("\n--- Clearing source documents for next run. ---")
+            #await clear_blob_container_async(config.SOURCE_BLOB_CONTAINER)
+
+        case_result.succeeded = process_completed_successfully
+        case_result.seconds = round(time.monotonic() - start_time, 3)
+        case_result.section_outcomes = get_section_outcomes()
+        case_result.iteration_histogram = iteration_histogram()
+        case_result.stages = get_stage_graph().report() if get_stage_graph() else {}
+        case_result.section_schedule = get_section_scheduler().makespan_report() if get_section_scheduler() else {}
+        case_result.archive = archive_report.stats() if run_attempted else {}
+        remove_run_log_handlers(run_log_handlers)
+    return case_result
+
+
+def _log_process_summary(case_results: List[CaseResult], llm_replay_cache):
+    """Logs each case's outcome and the metrics of the services the cases shared."""
+    loop_logger = logging.getLogger('LoopTracer')
+    loop_logger.info("=" * 40)
+    loop_logger.info("            PROCESS SUMMARY")
+    loop_logger.info("=" * 40)
+    for case_result in case_results:
+        loop_logger.info(
+            f"Run {case_result.run_id} ({case_result.source_prefix or 'whole source container'}): "
+            f"{'SUCCESS' if case_result.succeeded else 'FAILED'} in {case_result.seconds / 60:.2f} minutes"
+        )
+    llm_scheduler = get_scheduler()
+    if llm_scheduler:
+        for deployment_metrics in llm_scheduler.metrics().values():
+            loop_logger.info(
+                f"LLM scheduler [{deployment_metrics['deployment']}]: {deployment_metrics['completed_requests']} requests, "
+                f"{deployment_metrics['throttled_responses']} throttled, {deployment_metrics['tokens_used']:,} tokens, "
+                f"mean wait {deployment_metrics['mean_wait_seconds']:.2f}s (max {deployment_metrics['max_wait_seconds']:.2f}s), "
+                f"max queue depth {deployment_metrics['max_queue_depth']}, final concurrency limit {deployment_metrics['concurrency_limit']}"
+            )
+    llm_telemetry = get_telemetry()
+    if llm_telemetry:
+        for agent_name, agent_totals in llm_telemetry.summary().items():
+            loop_logger.info(
+                f"LLM usage [{agent_name}]: {agent_totals['requests']:.0f} calls, {agent_totals['prompt_tokens']:,.0f} prompt tokens "
+                f"({agent_totals['cached_tokens']:,.0f} cached, {agent_totals['cached_tokens'] / max(agent_totals['prompt_tokens'], 1):.0%} hit rate), "
+                f"{agent_totals['completion_tokens']:,.0f} completion tokens, "
+                f"{agent_totals['latency_seconds']:.1f}s total latency, cost {agent_totals['cost']:.4f}"
+            )
+    if llm_replay_cache:
+        replay_stats = llm_replay_cache.stats()
+        loop_logger.info(
+            f"LLM {replay_stats['mode']} cache: {replay_stats['recorded']} recorded, {replay_stats['hits']} replayed "
+            f"({replay_stats['fuzzy_hits']} fuzzy), {replay_stats['misses']} misses."
+        )
+    report_stats = feedback_report_stats()
+    if any(report_stats.values()):
+        loop_logger.info(
+            f"Validator team reports: {report_stats['submitted']} submitted, {report_stats['repaired']} repaired, "
+            f"{report_stats['missing']} missing."
+        )
+    prevalidator = get_prevalidator()
+    if prevalidator:
+        prevalidation_stats = prevalidator.stats()
+        loop_logger.info(
+            f"Pre-validation: {prevalidation_stats['drafts_checked']} drafts checked, "
+            f"{prevalidation_stats['validator_runs_saved']} validator runs saved."
+        )
+    blob_cache = get_blob_read_cache()
+    if blob_cache:
+        cache_stats = blob_cache.stats()
+        loop_logger.info(
+            f"Blob read cache: {cache_stats['hits']} hits ({cache_stats['revalidated']} revalidated), "
+            f"{cache_stats['misses']} misses, {cache_stats['bytes_served']:,} bytes served from memory."
+        )
+    pool_stats = get_agent_pool().stats()
+    loop_logger.info(f"Agent pool: {pool_stats['created']} agents and teams built, {pool_stats['reused']} leases served by a pooled one.")
+    loop_logger.info("=" * 40)
+
+
+async def main_async(source_prefixes: List[str] = None, resume_run_ids: List[str] = None) -> List[CaseResult]:
+    """
+    Main async function that contains the entire application lifecycle.
+
+    Runs one case per prefix in `source_prefixes` and resumes each run in
+    `resume_run_ids`, all concurrently (at most CONCURRENT_CASES at a time),
+    or, given neither, a single case with every document in the source
+    container. Returns the result of each case.
+    """
+    run_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+    setup_logging(run_timestamp)
+
+    # Caching is disabled to ensure that each run is deterministic and uses the
+    # latest instructions, which is critical during development and for auditability.
+    # Recorded completions are only reused when LLM_CACHE_MODE=replay is set explicitly.
+    litellm.caching = False
+
+    litellm.max_retries = 5
+
+    # Every agent's LLM call, from every case, is routed through the gateway, where
+    # the process-wide scheduler enforces each deployment's token and request quotas.
+    gateway.install()
+    if config.LLM_SCHEDULER_ENABLED:
+        install_scheduler()
+    if config.LLM_TELEMETRY_ENABLED:
+        install_telemetry(run_timestamp)
+    llm_replay_cache = install_replay_cache()
+    # AutoGen makes its LLM calls in the default executor; this one carries each
+    # section's telemetry tags and run scope into those worker threads.
+    asyncio.get_running_loop().set_default_executor(ContextPropagatingExecutor(max_workers=config.LLM_EXECUTOR_THREADS))
+
+    # The Prompt_Writer answers each request on its own, so one serves every section of every case.
+    prompt_writer = create_prompt_writer_agent(llm_config_fast)
+
+    cases = [(None, run_id) for run_id in resume_run_ids or []] + [(source_prefix, None) for source_prefix in source_prefixes or []]
+    case_slots = asyncio.Semaphore(config.CONCURRENT_CASES)
+
+    async def _run_case(source_prefix: str | None, resume_run_id: str | None) -> CaseResult:
+        async with case_slots:
+            return await run_case_async(run_timestamp, prompt_writer, source_prefix, resume_run_id)
+
+    logging.getLogger('LoopTracer').info(f"Main process started: {max(len(cases), 1)} case(s), at most {config.CONCURRENT_CASES} at a time.")
+    # Each case runs in its own task, so its run scope and per-run state stay its own.
+    case_results = await asyncio.gather(*(_run_case(*case) for case in cases or [("", None)]))
+
+    _log_process_summary(case_results, llm_replay_cache)
+    return case_results
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates a draft EHCP from the documents in the source container.")
+    parser.add_argument("--cases", metavar="SOURCE_PREFIX", nargs="+", help="Run one case per prefix of the source container (e.g. 'case-17/'), concurrently, in this process.")
+    parser.add_argument("--resume", metavar="RUN_ID", nargs="+", help="Resume runs that stopped part-way, from their run-state journals.")
+    args = parser.parse_args()
+
     try:
         # 'exist_ok=True' prevents an error from being thrown if the directories
         # already exist, making the script safe to run multiple times.
         os.makedirs(config.LOGS_DIR, exist_ok=True)
         os.makedirs(config.OUTPUTS_DIR, exist_ok=True)
-        
-        asyncio.run(main_async())
+
+        asyncio.run(main_async(source_prefixes=args.cases, resume_run_ids=args.resume))
 
     except KeyboardInterrupt:
         print("\nProcess interrupted by user. Shutting down.")
     except Exception as e:
-        logging.critical(f"A fatal, unhandled error occurred in the main entry point: {e}", exc_info=True)
\ No newline at end of file
+        logging.critical(f"A fatal, unhandled error occurred in the main entry point: {e}", exc_info=True)